@@ -4,13 +4,13 @@ Phi Bot — Telegram-бот MVP на aiogram 3.x.
 """
 
 import asyncio
-import hashlib
+import json
 import logging
 import os
-import sys
 from typing import Optional
 import re
 import tempfile
+import zlib
 from pathlib import Path
 
 # v20 telemetry — только server logs
@@ -21,12 +21,6 @@ if not _logger.handlers:
     _logger.addHandler(logging.StreamHandler())
     _logger.setLevel(logging.INFO)
 
-
-def _hash_text(text: str) -> str:
-    if not text:
-        return "none"
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
-
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from aiogram.filters import CommandStart, Command
@@ -35,31 +29,44 @@ from openai import OpenAI
 
 from logger import (
     _get_db_conn,
+    analytics_stats,
+    close_logs,
+    connect_db_dedicated,
+    db_writer_stats,
+    decode_export_cursor,
+    EXPORT_CHUNK_ROWS,
     export_dialogs_from_db,
+    iter_dialogs_from_db,
+    live_stats_snapshot,
     log_dialog,
     log_event,
     log_feedback,
     log_safety_event,
+    log_writer_stats,
+    save_live_stats,
+    seal_log_segments,
+    search_dialogs,
+    start_db_writer,
+    sync_analytics,
 )
 from prompt_loader import (
-    build_system_prompt,
     load_all_lenses,
     load_system_prompt,
     load_warmup_prompt,
-    load_philosophy_style,
+    prompt_bundle_hash,
+    resource_cache_stats,
+    resource_hashes,
 )
 from router import select_lenses, detect_financial_pattern
-from safety import check_safety, get_safe_response
+from safety import check_safety, get_safe_response, recent_user_texts, safety_stats
 from state_pm import pm_get_profile, pm_record_signal, pm_set_last_suggest_turn
 from philosophy_map import PHILOSOPHY_MAP, pm_score_philosophies
 from prompt_loader import load_file
-from response_postprocess import postprocess_response
+from response_postprocess import finalize_reply as finalize_chain, postprocess_response
 from utils.final_send_clamp import (
     add_closing_sentence,
-    completion_guard,
     final_send_clamp,
     looks_incomplete,
-    meta_tail_to_fork_or_close,
 )
 from utils.output_sanitizer import sanitize_output
 from utils.send_pipeline import send_text
@@ -67,6 +74,15 @@ from utils.telegram_idempotency import IdempotencyMiddleware
 from utils.state_store import load_state, save_state
 from utils.short_ack import is_short_ack
 from utils.context_pack import pack_context, append_history
+from utils.history_store import HistoryStore
+from utils.intent_cache import IntentCache
+from utils.intent_batcher import BATCH_ENABLED as INTENT_BATCH_ENABLED, MicroBatcher
+from utils.backup_job import BackupJob, FileLease, PgLease
+from utils.prompt_builder import SystemPromptBuilder
+from utils import keyword_matcher as km, lens_router, response_chain, topic_classifier
+from utils.message_features import MessageFeatures, feature_stats
+from utils.summary_memory import SUMMARY_MAX_OUTPUT_TOKENS, SUMMARY_MODEL, SummaryRefresher
+from utils.tokens import CONTEXT_MIN_TOKENS, count_prompt_tokens, count_tokens, input_budget, truncate_tokens
 from utils.intent_gate import (
     is_ack_close_intent,
     is_unclear_message,
@@ -86,6 +102,7 @@ from patterns.pattern_engine import (
 )
 from patterns.pattern_governor import (
     governor_plan,
+    needs_topic_llm,
     resolve_pattern_collisions,
     is_philosophy_question,
     _has_buddhism_switch,
@@ -127,15 +144,11 @@ from philosophy.recommendation_pause import (
     detect_recommendation,
     apply_recommendation_pause,
 )
-from philosophy.style_guards import clamp_questions, strip_meta_tail, apply_style_guards
-from response_postprocess import format_readability_ru
-from semantic_blocks import format_reply_md
 from philosophy.practice_cooldown import (
     strip_practice_content,
     contains_practice,
     tick_practice_cooldown,
     COOLDOWN_AFTER_PRACTICE,
-    clamp_to_first_practice_only,
 )
 
 # PhiloBase v1: lazy-loaded philosophy graph DB
@@ -193,28 +206,10 @@ BOT_VERSION = "Phi_Bot v21.4-meta-tail-to-fork"
 
 
 def finalize_reply(text: str, plan: Optional[dict] = None) -> str:
-    """Fix Pack B + PATCH F + PATCH G: unified postprocess.
+    """Fix Pack B + PATCH F + PATCH G: unified postprocess (response_postprocess.finalize_reply).
     Порядок: strip_meta_tail → format_reply_md (semantic blocks) → clamp_practice → style_guards
     → completion_guard → meta_tail_to_fork → clamp_questions → readability."""
-    if plan is None:
-        plan = {}
-    out = (text or "").strip()
-    if not out:
-        return out
-    out = strip_meta_tail(out)
-    # PATCH G: semantic blocks Markdown (longform/explain/philosophy only)
-    out, blocks_used = format_reply_md(out, plan)
-    plan["blocks_used"] = blocks_used
-    out = clamp_to_first_practice_only(out)
-    ban_empathy = plan.get("philosophy_pipeline") or plan.get("answer_first_required") or plan.get("explain_mode")
-    out = apply_style_guards(out, ban_empathy_openers=ban_empathy, answer_first=plan.get("answer_first_required", False))
-    out = completion_guard(out, max_questions=plan.get("max_questions", 1))
-    out = meta_tail_to_fork_or_close(out, max_questions=plan.get("max_questions", 1))
-    out = clamp_questions(out, max_questions=plan.get("max_questions", 1))
-    # PATCH F: readability formatter ПОСЛЕДНИМ — clamp_questions использует " ".join() и затирает переносы
-    if not plan.get("disable_readability_formatter"):
-        out = format_readability_ru(out)
-    return out.strip()
+    return finalize_chain(text, plan)
 
 DEBUG = os.getenv("DEBUG", "0") == "1"
 
@@ -235,7 +230,8 @@ LAST_LENS_BY_USER: dict[int, list[str]] = {}  # последние линзы д
 
 # Governor state v12 + pending follow-through v14
 USER_STATE: dict[int, dict] = {}  # turn_index, last_bridge_turn, last_options, pending, ...
-HISTORY_STORE: dict[int, list] = {}  # user_id -> [{"role":"user"|"assistant","content":...}]
+HISTORY_STORE: HistoryStore = HistoryStore()  # user_id -> [{"role":"user"|"assistant","content":...}], ring buffer
+SYSTEM_PROMPT_BUILDER = SystemPromptBuilder()  # собранные guidance-промпты по (линзы, флаги)
 
 # Человекочитаемые названия линз
 LENS_NAMES: dict[str, str] = {
@@ -266,6 +262,11 @@ RESISTANCE_TRIGGERS = (
 CONFUSION_TRIGGERS = (
     "не понимаю", "запутался", "неясно", "не знаю что", "не понятно",
 )
+MULTI_STYLE_MARKERS = ("смысл", "выбор", "решен", "нереш", "ценност")
+_GUIDANCE_TRIGGERS = km.register("bot.guidance", GUIDANCE_TRIGGERS)
+_RESISTANCE_TRIGGERS = km.register("bot.resistance", RESISTANCE_TRIGGERS)
+_CONFUSION_TRIGGERS = km.register("bot.confusion", CONFUSION_TRIGGERS)
+_MULTI_STYLE = km.register("bot.multi_style", MULTI_STYLE_MARKERS)
 
 # Загрузка .env из папки Phi_Bot
 PROJECT_ROOT = Path(__file__).resolve().parent
@@ -288,16 +289,31 @@ if not OPENAI_API_KEY:
 def _health_payload() -> dict:
     """v20: /health endpoint payload (только server-side)."""
     try:
-        sp = load_system_prompt()
-        sp_hash = _hash_text(sp)
+        hashes = resource_hashes()
+        sp_hash = hashes["prompts"]["system_prompt"]
     except Exception:
-        sp_hash = "load_error"
+        hashes, sp_hash = None, "load_error"
     return {
         "status": "ok",
         "app_version": APP_VERSION,
         "git_sha": GIT_SHA,
         "openai_model": os.getenv("OPENAI_MODEL"),
         "system_prompt_hash": sp_hash,
+        "prompt_hashes": hashes,
+        "prompt_cache": {"resources": resource_cache_stats(), "system_prompts": SYSTEM_PROMPT_BUILDER.stats()},
+        "log_writer": log_writer_stats(),
+        "db_writer": db_writer_stats(),
+        "analytics": analytics_stats(),
+        "summary_memory": SUMMARY_REFRESHER.stats(),
+        "response_chain": response_chain.stats(),
+        "keyword_matcher": km.stats(),
+        "message_features": feature_stats(),
+        "safety": safety_stats(),
+        "lens_router": lens_router.stats(),
+        "topic_classifier": topic_classifier.stats(),
+        "intent_cache": INTENT_CACHE.stats(),
+        "intent_batcher": INTENT_BATCHER.stats() if INTENT_BATCHER else None,
+        "backup": BACKUP_JOB.stats() if BACKUP_JOB else None,
     }
 
 
@@ -331,31 +347,10 @@ def transcribe_voice(audio_path: Path) -> str:
         return f"[Ошибка распознавания: {e}]"
 
 
-def _explain_mode_instructions_ru() -> str:
-    """PATCH F + PATCH G: инструкция для режима разъяснения + blocks contract."""
-    return (
-        "Пользователь просит разъяснение. Сделай ответ более развернутым и понятным: "
-        "1) кратко переформулируй, что именно объясняешь; "
-        "2) разложи на 2–4 смысловых блока; "
-        "3) дай 1 короткий пример; "
-        "4) завершай без вопросов. "
-        "Пиши читабельно: абзацы и маркеры, без полотна. "
-        "Тон: живой, спокойный, без формальностей и без давления.\n\n"
-        "---\n"
-        "[EXPLAIN_MODE_BLOCKS_CONTRACT] Если пользователь просит «объясни», «разбери», «шире», «покажи варианты», «сравни», «поясни детальнее»: "
-        "1) Сформируй ответ как семантические блоки в JSON и помести его строго между тегами: <BLOCKS_JSON> ... </BLOCKS_JSON> "
-        "2) Схема JSON: {\"lead\": \"1–2 предложения по сути\", \"sections\": [{\"title\": \"Заголовок\", \"body\": \"2–5 предложений\", \"bullets\": []}], "
-        "\"bridge\": null, \"question\": \"опционально один финальный вопрос\"} "
-        "3) Никаких других тегов, никакого второго дублирующего блока. "
-        "4) Не добавляй мета-фразы про «рамки», «оптики», «сейчас разберём философски» — начинай по делу."
-    )
-
-
 def _get_stage(user_id: int, user_text: str) -> str:
     """Возвращает stage: warmup или guidance."""
     count = USER_MSG_COUNT.get(user_id, 0)
-    text_lower = (user_text or "").lower().strip()
-    if any(tr in text_lower for tr in GUIDANCE_TRIGGERS):
+    if km.has(_GUIDANCE_TRIGGERS, user_text):
         return "guidance"
     if count <= 1:
         return "warmup"
@@ -368,10 +363,12 @@ EXISTENTIAL_KEYWORDS = (
 )
 
 
+_EXISTENTIAL = km.register("bot.existential", EXISTENTIAL_KEYWORDS)
+
+
 def _is_existential(user_text: str) -> bool:
     """Проверяет экзистенциальный контекст запроса."""
-    t = (user_text or "").lower()
-    return any(kw in t for kw in EXISTENTIAL_KEYWORDS)
+    return km.has(_EXISTENTIAL, user_text)
 
 
 def _trim_existential(text: str) -> str:
@@ -412,16 +409,30 @@ def _extract_response_text(response) -> str:
     return result or "Не удалось получить ответ."
 
 
-def _approx_tokens_from_text(s: str) -> int:
-    """Грубая оценка: ~4 символа на токен для RU/EN микса."""
-    if not s:
-        return 0
-    return max(1, (len(s) + 3) // 4)
+def _fit_input(system_tokens: int, user_text: str, plan: dict, stage: str) -> tuple[str, int]:
+    """Бюджет входа: (текст пользователя для модели, токенов под контекст).
+
+    system_tokens — размер системного промпта. Сообщение режется (середина) только если
+    после промпта под историю не остаётся CONTEXT_MIN_TOKENS.
+    """
+    room = input_budget(plan, stage) - system_tokens
+    llm_user_text = user_text
+    if count_tokens(user_text) > room - CONTEXT_MIN_TOKENS:
+        llm_user_text = truncate_tokens(user_text, max(room - CONTEXT_MIN_TOKENS, 64))
+    return llm_user_text, max(0, room - count_tokens(llm_user_text))
+
+
+def _warmup_call(user_id: int, state: dict, user_text: str, plan: dict, stage: str) -> str:
+    """Warmup-ответ модели с контекстом в пределах бюджета входа."""
+    warmup_prompt = load_warmup_prompt()
+    llm_user_text, ctx_tokens = _fit_input(count_prompt_tokens(warmup_prompt), user_text, plan, stage)
+    ctx = pack_context(user_id, state, HISTORY_STORE, user_language=state.get("user_language"), max_tokens=ctx_tokens)
+    return call_openai(warmup_prompt, llm_user_text, context_block=ctx)
 
 
 def _cache_salt() -> str:
     """FIX V1.2: соль для кэша — меняется при смене системного промпта или кода."""
-    sp = os.getenv("SYSTEM_PROMPT_HASH", "").strip()
+    sp = os.getenv("SYSTEM_PROMPT_HASH", "").strip() or prompt_bundle_hash()
     sha = os.getenv("GIT_SHA", "").strip()
     appv = os.getenv("APP_VERSION", "").strip()
     parts = [p for p in [sp, sha, appv] if p]
@@ -429,7 +440,7 @@ def _cache_salt() -> str:
 
 
 def _extract_usage(response, inst: str, input_text: str, output_text: str) -> dict:
-    """Извлекает usage из response; при отсутствии — приблизительная оценка."""
+    """Извлекает usage из response; при отсутствии — подсчёт токенизатором (utils.tokens)."""
     usage = {}
     usage_obj = getattr(response, "usage", None)
     if usage_obj:
@@ -439,9 +450,9 @@ def _extract_usage(response, inst: str, input_text: str, output_text: str) -> di
             "total_tokens": getattr(usage_obj, "total_tokens", None) or getattr(usage_obj, "total_tokens_count", None),
         }
     if not usage.get("input_tokens"):
-        usage["input_tokens"] = _approx_tokens_from_text(inst) + _approx_tokens_from_text(input_text)
+        usage["input_tokens"] = count_prompt_tokens(inst) + count_tokens(input_text)
     if not usage.get("output_tokens"):
-        usage["output_tokens"] = _approx_tokens_from_text(output_text)
+        usage["output_tokens"] = count_tokens(output_text)
     if not usage.get("total_tokens"):
         usage["total_tokens"] = (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
     return usage
@@ -453,46 +464,110 @@ EVAL_CALL_METAS: list = []
 
 # E1.1: cost control — eval can skip LLM intent classifier for topic_mid
 EVAL_SKIP_LLM_INTENT = os.getenv("EVAL_SKIP_LLM_INTENT", "0") == "1"
+# Решения классификаторов интента: LRU + SQLite с TTL (utils.intent_cache), подключается в main()
+INTENT_CACHE = IntentCache()
+INTENT_TOPIC_NS = "intent_topic"
 
 
-def llm_classify_topic_intent(user_text: str) -> bool:
-    """PATCH E: cheap intent classifier via mini model — философско-понятийный вопрос?"""
-    if EVAL_SKIP_LLM_INTENT:
-        return False
-    t = (user_text or "").strip()
-    if not t:
-        return False
-    key_obj = {"ns": "intent_topic_llm", "v": 1, "text": t.lower()}
-    cache_dir = os.getenv("EVAL_CACHE_DIR", "eval/cache").strip()
-    try:
-        from eval.llm_cache import cache_get, cache_put
-        hit = cache_get(cache_dir, key_obj)
-        if hit is not None and isinstance(hit, dict):
-            return hit.get("is_topic", False)
-    except Exception:
-        pass
-    instructions = (
-        "Классифицируй запрос пользователя. "
-        "Это философско-понятийный вопрос (объяснить идею, школу, концепт, взгляд философии)? "
-        "Ответ только JSON: {\"is_topic\": true} или {\"is_topic\": false}"
-    )
-    model = os.getenv("INTENT_CLASSIFIER_MODEL", "gpt-4o-mini")
+_TOPIC_INSTRUCTIONS = (
+    "Классифицируй запрос пользователя. "
+    "Это философско-понятийный вопрос (объяснить идею, школу, концепт, взгляд философии)? "
+    "Ответ только JSON: {\"is_topic\": true} или {\"is_topic\": false}"
+)
+_TOPIC_BATCH_INSTRUCTIONS = (
+    "На входе JSON-массив запросов пользователей. Для каждого: это философско-понятийный вопрос "
+    "(объяснить идею, школу, концепт, взгляд философии)? "
+    "Ответ только JSON: {\"is_topic\": [true, false, ...]} — по значению на запрос, в том же порядке"
+)
+
+
+def _topic_llm_call(t: str) -> Optional[bool]:
+    """Один вызов mini-модели; None — ошибка API."""
     try:
         response = openai_client.responses.create(
-            model=model,
-            instructions=instructions,
+            model=os.getenv("INTENT_CLASSIFIER_MODEL", "gpt-4o-mini"),
+            instructions=_TOPIC_INSTRUCTIONS,
             input=t,
             max_output_tokens=20,
         )
         text = (_extract_response_text(response) or "").strip().lower()
-        is_topic = bool(re.search(r'is_topic["\']?\s*:\s*true', text))
-    except Exception:
-        is_topic = False
-    try:
-        from eval.llm_cache import cache_put
-        cache_put(cache_dir, key_obj, {"is_topic": is_topic})
+        return bool(re.search(r'is_topic["\']?\s*:\s*true', text))
     except Exception:
-        pass
+        return None
+
+
+def _topic_llm_batch(texts: list) -> list:
+    """Пачка текстов — один вызов mini-модели (utils.intent_batcher). Пачка из одного — прежний промпт."""
+    if len(texts) == 1:
+        return [_topic_llm_call(texts[0])]
+    response = openai_client.responses.create(
+        model=os.getenv("INTENT_CLASSIFIER_MODEL", "gpt-4o-mini"),
+        instructions=_TOPIC_BATCH_INSTRUCTIONS,
+        input=json.dumps(texts, ensure_ascii=False),
+        max_output_tokens=20 + 8 * len(texts),
+    )
+    text = _extract_response_text(response) or ""
+    m = re.search(r"\{.*\}", text, re.S)
+    values = json.loads(m.group(0)).get("is_topic") if m else None
+    if not isinstance(values, list) or len(values) != len(texts):
+        return [None] * len(texts)  # ответ не разобран — каждый спросит модель сам
+    return [v if isinstance(v, bool) else None for v in values]
+
+
+INTENT_BATCHER = MicroBatcher(_topic_llm_batch, name=INTENT_TOPIC_NS) if INTENT_BATCH_ENABLED else None
+
+
+def _topic_intent_known(t: str) -> Optional[bool]:
+    """Решение без mini-модели: кэш интентов, затем локальный классификатор (utils.topic_classifier)."""
+    cached = INTENT_CACHE.get(INTENT_TOPIC_NS, t)
+    if cached is not None:
+        return bool(cached)
+    return topic_classifier.classify(t)
+
+
+def _topic_intent_from_llm(t: str, is_topic: Optional[bool]) -> bool:
+    if is_topic is None:
+        return False  # ошибку API не кэшируем
+    INTENT_CACHE.put(INTENT_TOPIC_NS, t, is_topic)
+    return is_topic
+
+
+def llm_classify_topic_intent(user_text: str) -> bool:
+    """PATCH E: cheap intent classifier via mini model — философско-понятийный вопрос?"""
+    if EVAL_SKIP_LLM_INTENT:
+        return False
+    t = (user_text or "").strip()
+    if not t:
+        return False
+    known = _topic_intent_known(t)
+    if known is not None:
+        return known
+    return _topic_intent_from_llm(t, _topic_llm_call(t))
+
+
+async def llm_classify_topic_intent_batched(user_text: str) -> bool:
+    """llm_classify_topic_intent, но вызов mini-модели — пачкой с параллельными сообщениями
+    (INTENT_BATCHER). Пачка не разобрана — один вызов, как раньше."""
+    if EVAL_SKIP_LLM_INTENT:
+        return False
+    t = (user_text or "").strip()
+    if not t:
+        return False
+    # кэш: память — на loop, SQLite — в потоке (диск не блокирует обработку других сообщений)
+    cached = INTENT_CACHE.peek(INTENT_TOPIC_NS, t)
+    if cached is None:
+        cached = await asyncio.to_thread(INTENT_CACHE.get, INTENT_TOPIC_NS, t)
+    if cached is not None:
+        return bool(cached)
+    known = topic_classifier.classify(t)
+    if known is not None:
+        return known
+    is_topic = await INTENT_BATCHER.submit(t) if INTENT_BATCHER is not None else None
+    if is_topic is None:
+        is_topic = _topic_llm_call(t)
+    if is_topic is None:
+        return False  # ошибку API не кэшируем
+    await asyncio.to_thread(INTENT_CACHE.put, INTENT_TOPIC_NS, t, is_topic)
     return is_topic
 
 
@@ -501,8 +576,13 @@ def call_openai(
     user_text: str,
     force_short: bool = False,
     context_block: str = "",
+    previous_response_id: Optional[str] = None,
+    store: bool = False,
+    meta_out: Optional[dict] = None,
 ) -> str:
     """Вызывает OpenAI Responses API. context_block — упакованный контекст диалога.
+    previous_response_id / store / meta_out — цепочка ответов (utils.response_chain): id ответа
+    кладётся в meta_out["response_id"]; ошибка при previous_response_id пробрасывается (цепочка потеряна).
     TEST COST OPTIMIZER V1: при EVAL_CACHE_DIR — кэш; при EVAL_MODEL — модель; при EVAL_MAX_TOKENS — лимит."""
     model_name = os.getenv("EVAL_MODEL") or OPENAI_MODEL
     inst = system_prompt
@@ -525,6 +605,8 @@ def call_openai(
         "input": input_text,
         "force_short": force_short,
     }
+    if previous_response_id:
+        key_obj["previous_response_id"] = previous_response_id
     if use_cache:
         try:
             from eval.llm_cache import cache_get, cache_put
@@ -540,9 +622,15 @@ def call_openai(
     kwargs = {"model": model_name, "instructions": inst, "input": input_text}
     if max_output_tokens:
         kwargs["max_output_tokens"] = max_output_tokens
+    if previous_response_id:
+        kwargs["previous_response_id"] = previous_response_id
+    if store or previous_response_id:
+        kwargs["store"] = True
 
     try:
         response = openai_client.responses.create(**kwargs)
+        if meta_out is not None:
+            meta_out["response_id"] = getattr(response, "id", None)
         text = _extract_response_text(response)
         usage = _extract_usage(response, inst, input_text, text)
         if use_cache:
@@ -555,6 +643,8 @@ def call_openai(
             EVAL_CALL_METAS.append({"cached_hit": False, "model": model_name, "usage": usage})
         return text
     except Exception as e:
+        if previous_response_id:
+            raise
         if DEBUG:
             print(f"[Phi] model {model_name} failed, fallback to gpt-5.2-mini: {e}")
         if os.getenv("EVAL_MODEL"):
@@ -575,6 +665,84 @@ def call_openai(
             return f"Ошибка API: {str(e2)}"
 
 
+def _call_with_chain(
+    user_id: int,
+    state: dict,
+    system_prompt: str,
+    user_text: str,
+    ctx: str,
+    turn_hints: list,
+) -> str:
+    """Основной guidance-вызов. PHI_RESPONSES_CHAIN=1: ход цепляется к прошлому ответу
+    (previous_response_id) и отправляет только дельту вместо упакованной истории;
+    цепочка потеряна — тот же ход stateless с полным контекстом (см. utils/response_chain.py)."""
+    if not _chain_active():
+        return call_openai(system_prompt, user_text, context_block=ctx)
+    meta: dict = {}
+    head = response_chain.chain_head(state)
+    if head:
+        delta = pack_context(
+            user_id, state, HISTORY_STORE,
+            user_language=state.get("user_language"),
+            history_tail=response_chain.missed_turns(state, head) * 2,
+            include_summary=False,
+        )
+        delta = "\n\n".join([delta] + turn_hints)
+        try:
+            text = call_openai(system_prompt, user_text, context_block=delta, previous_response_id=head["id"], meta_out=meta)
+            response_chain.advance(state, meta.get("response_id"), started=False, ctx_tokens_saved=count_tokens(ctx) - count_tokens(delta))
+            return text
+        except Exception as e:
+            print(f"[Phi] response chain lost user={user_id}: {e}")
+            response_chain.drop(state)
+    text = call_openai(system_prompt, user_text, context_block=ctx, store=True, meta_out=meta)
+    response_chain.advance(state, meta.get("response_id"), started=True)
+    return text
+
+
+def _chain_active() -> bool:
+    return response_chain.CHAIN_ENABLED and not os.getenv("EVAL_CACHE_DIR")
+
+
+def _retry_call(system_prompt: str, user_text: str, ctx: str, meta_out: dict, force_short: bool = False) -> str:
+    """Повтор хода (force_short / expand / дозавершение) с полным контекстом. С цепочкой ответ
+    сохраняется на сервере (store): если он заменит ответ хода — _adopt_retry."""
+    if not _chain_active():
+        return call_openai(system_prompt, user_text, force_short=force_short, context_block=ctx)
+    return call_openai(system_prompt, user_text, force_short=force_short, context_block=ctx, store=True, meta_out=meta_out)
+
+
+def _adopt_retry(state: dict, meta: dict) -> None:
+    """Ответ хода заменён повтором: цепочка продолжается от него, а не от выброшенного ответа
+    (нет response_id — цепочка обрывается, следующий ход начнёт новую)."""
+    if _chain_active():
+        response_chain.advance(state, meta.get("response_id"), started=True)
+
+
+def _summarize_call(instructions: str, input_text: str) -> str:
+    """Вызов дешёвой модели для скользящего резюме (в фоне, вне пути ответа)."""
+    response = openai_client.responses.create(
+        model=SUMMARY_MODEL,
+        instructions=instructions,
+        input=input_text,
+        max_output_tokens=SUMMARY_MAX_OUTPUT_TOKENS,
+    )
+    return (getattr(response, "output_text", "") or "").strip()
+
+
+def _apply_summary(user_id: int, summary: str, turn: int) -> None:
+    """Записать готовое резюме в state и на диск. После /start (turn_index сброшен) — отбросить."""
+    state = USER_STATE.get(user_id)
+    if state is None or state.get("turn_index", 0) < turn:
+        return
+    state["summary"] = summary
+    state["summary_turn"] = turn
+    save_state(_state_to_persist())
+
+
+SUMMARY_REFRESHER = SummaryRefresher(_summarize_call, _apply_summary)
+
+
 TOOLS_MENU = """Инструменты Phi Bot
 
 1) Зона контроля — разделить «влияю / не влияю». Когда хаос, перегруз, много всего.
@@ -631,6 +799,9 @@ def _state_to_persist() -> dict:
             "pending_orientation": state.get("pending_orientation"),
             "orientation_lock": state.get("orientation_lock"),
             "force_expand_next": state.get("force_expand_next"),
+            "summary": state.get("summary"),
+            "summary_turn": state.get("summary_turn", 0),
+            "response_chain": state.get("response_chain"),
             "last_updated": time.time(),
         }
     return out
@@ -717,6 +888,9 @@ def _load_persisted_state() -> None:
             "pending_orientation": blob.get("pending_orientation", False),
             "orientation_lock": blob.get("orientation_lock", False),
             "force_expand_next": blob.get("force_expand_next", False),
+            "summary": blob.get("summary"),
+            "summary_turn": blob.get("summary_turn", 0),
+            "response_chain": blob.get("response_chain"),
         }
 
 
@@ -758,7 +932,7 @@ async def cmd_start(message: Message) -> None:
     tail = (parts[1].strip() if len(parts) > 1 else "") or ""
     # Онбординг не считается первым ответом: очищаем историю, диалог начинается с нуля
     if uid in HISTORY_STORE:
-        HISTORY_STORE[uid] = []
+        HISTORY_STORE.reset(uid)
     USER_STAGE[uid] = "warmup"
     USER_MSG_COUNT[uid] = 0
     USER_STATE[uid] = {
@@ -886,9 +1060,33 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
 
     Возвращает: {"reply_text": str, "telemetry": dict, "mode": str|None, "stage": str|None}
     Использует глобальные USER_STATE, HISTORY_STORE, USER_STAGE, USER_MSG_COUNT, LAST_LENS_BY_USER.
-    Вызывается из process_user_query и из eval/run_synth_simulation.
+    Вызывается из eval/run_synth_simulation; бот — generate_reply_core_batched.
     TEST COST OPTIMIZER V1.1: в eval очищает EVAL_CALL_METAS для телеметрии.
     """
+    steps = _reply_core_steps(user_id, user_text)
+    try:
+        text = next(steps)
+        while True:
+            text = steps.send(llm_classify_topic_intent(text))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def generate_reply_core_batched(user_id: int, user_text: str) -> dict:
+    """generate_reply_core, но topic intent (если governor его спросит) — пачкой с параллельными
+    сообщениями: ранние выходы ядра (safety, short ack, first-turn gate) модель не спрашивают."""
+    steps = _reply_core_steps(user_id, user_text)
+    try:
+        text = next(steps)
+        while True:
+            text = steps.send(await llm_classify_topic_intent_batched(text))
+    except StopIteration as stop:
+        return stop.value
+
+
+def _reply_core_steps(user_id: int, user_text: str):
+    """Тело generate_reply_core — генератор: если governor_plan спросит mini-модель (needs_topic_llm),
+    отдаёт текст через yield и получает решение (bool) от вызывающего. Результат хода — return."""
     if os.getenv("EVAL_CACHE_DIR"):
         EVAL_CALL_METAS.clear()
     if not user_text:
@@ -906,19 +1104,22 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
             append_history(HISTORY_STORE, user_id, "assistant", reply_text)
             return {"reply_text": finalize_reply(reply_text, {}), "telemetry": {"stage": "guidance", "intent": "short_ack"}, "mode": None, "stage": "guidance"}
 
-    if check_safety(user_text):
+    # Окно: фраза риска может быть разорвана между последними репликами пользователя
+    if check_safety(user_text, recent_user_texts(HISTORY_STORE.get(user_id, []))):
         safe_text = get_safe_response()
         return {"reply_text": finalize_reply(safe_text, {"max_questions": 1}), "telemetry": {"stage": "safety", "intent": "safety"}, "mode": None, "stage": "safety"}
 
+    # Признаки сообщения на ход: предикаты детекторов считаются один раз (utils/message_features.py)
+    feats = MessageFeatures(user_text)
     history_count = len(HISTORY_STORE.get(user_id, []))
     current_stage = USER_STAGE.get(user_id)
     # FIX: концептуальные вопросы (бог, философы 21 века) — не использовать first_turn gate,
     # иначе fallback "decision" даёт ответ про выбор/зона контроля вместо ответа на вопрос
     # PHILOBASE: граф влияний/связи философов → philosophy pipeline, не first_turn
     is_concept = (
-        detect_philosophy_topic_intent(user_text)[0]
-        or is_topic_high(user_text)
-        or is_philo_graph_intent(user_text)
+        feats(detect_philosophy_topic_intent)[0]
+        or feats(is_topic_high)
+        or feats(is_philo_graph_intent)
     )
     skip_warmup = should_skip_warmup_first_turn(state, user_text, history_count, current_stage)
     # BUG1: telemetry для отладки роутинга
@@ -929,7 +1130,7 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
     if skip_warmup and not is_concept:
         gate_text, gate_label = render_first_turn_philosophy(user_text)
         # BUG1: hard-guard — религия + вопрос ⇒ никогда first_turn (идти в pipeline)
-        if gate_text and has_religion_in_orientation_context(user_text):
+        if gate_text and feats(has_religion_in_orientation_context):
             if any(m in (user_text or "").lower() for m in ("расскажи", "объясни", "как ", "какие", "?")):
                 gate_text, gate_label = None, "skip"
         if not gate_text or gate_label == "skip":
@@ -955,21 +1156,24 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
     turn_index = state.get("turn_index", 0) + 1
     state["turn_index"] = turn_index
 
-    text_lower = (user_text or "").lower()
-    is_resistance = any(tr in text_lower for tr in RESISTANCE_TRIGGERS)
-    is_confusion = any(tr in text_lower for tr in CONFUSION_TRIGGERS)
-    want_fork = detect_financial_pattern(user_text)
+    is_resistance = km.has(_RESISTANCE_TRIGGERS, user_text)
+    is_confusion = km.has(_CONFUSION_TRIGGERS, user_text)
+    want_fork = feats(detect_financial_pattern)
     want_option_close = ENABLE_SESSION_CLOSE_CHOICE and stage == "guidance" and not (user_text or "").rstrip().endswith("?")
 
     context = {"stage": stage, "user_text_len": len((user_text or "").strip()), "is_safety": False, "is_resistance": is_resistance, "is_confusion": is_confusion, "want_fork": want_fork, "want_option_close": want_option_close, "enable_philosophy_match": ENABLE_PHILOSOPHY_MATCH}
     context = resolve_pattern_collisions(context)
-    # E1.1: pass None when EVAL_SKIP_LLM_INTENT → topic_mid won't trigger LLM
+    # E1.1: EVAL_SKIP_LLM_INTENT → topic_mid won't trigger LLM
+    topic_llm: Optional[bool] = None
+    if not EVAL_SKIP_LLM_INTENT and needs_topic_llm(user_text, feats):
+        topic_llm = yield user_text
     plan = governor_plan(
         user_id, stage, user_text, context, state,
-        llm_classify_fn=None if EVAL_SKIP_LLM_INTENT else llm_classify_topic_intent,
+        llm_classify_fn=None if topic_llm is None else (lambda _text: topic_llm),
+        features=feats,
     )
     # PHILOBASE: early routing for influence/connections questions
-    if is_philo_graph_intent(user_text):
+    if feats(is_philo_graph_intent):
         plan.setdefault("stage_override", "guidance")
         plan["philosophy_pipeline"] = True
         plan["disable_warmup"] = True
@@ -1009,7 +1213,7 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
     context["answer_first_required"] = plan.get("answer_first_required", False)
     context["explain_mode"] = plan.get("explain_mode", False)
 
-    if plan.get("philosophy_pipeline") or detect_financial_pattern(user_text) or plan.get("explain_mode"):
+    if plan.get("philosophy_pipeline") or feats(detect_financial_pattern) or plan.get("explain_mode"):
         want_option_close = False
 
     handled_orientation_choice = False
@@ -1040,7 +1244,7 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
         USER_STAGE[user_id] = stage
 
     # BUG2: ack/close («понял, спасибо») — короткий ответ, без triage; stage=guidance чтобы след. вопрос не warmup
-    if is_ack_close_intent(user_text):
+    if feats(is_ack_close_intent):
         USER_STAGE[user_id] = "guidance"
         append_history(HISTORY_STORE, user_id, "user", user_text)
         append_history(HISTORY_STORE, user_id, "assistant", ACK_CLOSE_REPLY_RU)
@@ -1051,7 +1255,7 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
     if (
         not handled_orientation_choice
         and not plan.get("force_philosophy_mode")
-        and is_unclear_message(user_text)
+        and feats(is_unclear_message)
         and stage == "warmup"
         and not plan.get("disable_warmup")
         and not plan.get("philosophy_pipeline")
@@ -1070,8 +1274,11 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
     pattern_id = None
     forbid_practice = False
     injection_this_turn = False
+    expand_retry = False
+    llm_retries = 0
     has_reco = False
     guidance_ctx_for_completion = None
+    token_report = None
     reply_text = ""
 
     last_preview = state.get("last_lens_preview_turn")
@@ -1092,13 +1299,13 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
         else:
             reply_text = "Уточни, пожалуйста — с чего начать?"
         want_option_close = False
-    elif plan.get("force_philosophy_mode") and not plan.get("philosophy_pipeline") and not get_active_lens(state) and len((user_text or "").strip()) <= 250 and not detect_financial_pattern(user_text):
+    elif plan.get("force_philosophy_mode") and not plan.get("philosophy_pipeline") and not get_active_lens(state) and len((user_text or "").strip()) <= 250 and not feats(detect_financial_pattern):
         # Lens preview только для расплывчатых запросов (поговорим про философию). Конкретные topic-вопросы (расскажи про X) — в LLM, не preview
         reply_text = render_lens_preview("guidance" if detect_lens_preview_need(user_text) else "default") + "\n\n" + render_lens_soft_question()
         reply_text = enforce_constraints(reply_text, "guidance", load_patterns().get("global_constraints", {}))
         state["last_lens_preview_turn"] = turn_index
         want_option_close = False
-    elif plan.get("force_philosophy_mode") and not get_active_lens(state) and (len((user_text or "").strip()) > 250 or detect_financial_pattern(user_text)):
+    elif plan.get("force_philosophy_mode") and not get_active_lens(state) and (len((user_text or "").strip()) > 250 or feats(detect_financial_pattern)):
         plan["force_philosophy_mode"] = False
     elif stage == "warmup" and not plan.get("disable_warmup") and not plan.get("philosophy_pipeline"):
         selected_names = []
@@ -1112,16 +1319,13 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
                 state["last_bridge_turn"] = turn_index
                 reply_from_pattern = True
             else:
-                ctx = pack_context(user_id, state, HISTORY_STORE, user_language=state.get("user_language"))
-                reply_text = call_openai(load_warmup_prompt(), user_text, context_block=ctx)
+                reply_text = _warmup_call(user_id, state, user_text, plan, stage)
                 reply_text = postprocess_response(reply_text, stage)
         else:
-            ctx = pack_context(user_id, state, HISTORY_STORE, user_language=state.get("user_language"))
-            reply_text = call_openai(load_warmup_prompt(), user_text, context_block=ctx)
+            reply_text = _warmup_call(user_id, state, user_text, plan, stage)
             reply_text = postprocess_response(reply_text, stage)
         if reply_from_pattern and reply_text and len((reply_text or "").strip()) < 120 and "?" not in reply_text and "\n\n" not in reply_text:
-            ctx = pack_context(user_id, state, HISTORY_STORE, user_language=state.get("user_language"))
-            reply_text = call_openai(load_warmup_prompt(), user_text, context_block=ctx)
+            reply_text = _warmup_call(user_id, state, user_text, plan, stage)
             reply_text = postprocess_response(reply_text, stage)
     else:
         if plan.get("philosophy_pipeline"):
@@ -1135,12 +1339,11 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
             want_option_close = False
         else:
             raw_llm_text = ""
-            main_prompt = load_system_prompt()
             all_lenses = load_all_lenses()
             active_lens = get_active_lens(state)
             if active_lens and active_lens in LENS_TO_SYSTEM_ID:
                 selected_names = [LENS_TO_SYSTEM_ID[active_lens]]
-            elif detect_financial_pattern(user_text):
+            elif feats(detect_financial_pattern):
                 selected_names = ["lens_finance_rhythm"]
                 mode_tag = "financial_rhythm"
             else:
@@ -1153,63 +1356,65 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
                     selected_names = selected_names[:3]
                 elif plan.get("explain_mode"):
                     selected_names = selected_names[: plan.get("max_lenses", 2)]
-            lens_contents = [all_lenses.get(n, "") for n in selected_names]
-            lens_contents = [c for c in lens_contents if c]
-            system_prompt = build_system_prompt(main_prompt, lens_contents)
-            system_prompt += plan.get("system_prompt_extra", "")
-            system_prompt += "\n\nExistential: макс. 2 рамки, каждая ≤2 предложения."
-            if state.get("force_expand_next"):
-                system_prompt += "\n\n---\nforce_expand_next: Дай развёрнутый ответ с объяснением и примером. Не менее 2 абзацев."
-                state["force_expand_next"] = False
-            phi_style = load_philosophy_style()
-            if phi_style:
-                system_prompt += "\n\n---\n" + phi_style
             # Fix Pack D: anti-too-short — floor 900 при богатом запросе
             user_len = len((user_text or "").strip())
             rich_request = user_len >= 80 and (stage in ("guidance", "analysis") or plan.get("answer_first_required") or plan.get("philosophy_pipeline"))
-            if rich_request and not plan.get("philosophy_pipeline") and not plan.get("explain_mode"):
-                system_prompt += "\n\nОтвет: развёрнуто, не менее 900 символов. Без ultra-short."
-            if plan.get("philosophy_pipeline"):
-                system_prompt += (
-                    "\n\nОтвет: развёрнуто, не менее ~900 символов. Без короткого режима."
-                    "\n---\nЗАПРЕЩЕНО: начинать с абстрактной подводки («Когда ответов много», «Когда внутри нет ясности» и т.п.). Сразу отвечать на вопрос."
-                    "\n---\nОдин связный ответ. Не дублировать содержание вторым блоком."
-                    "\nЕсли ответ длинный — вторую часть не начинать с «Продолжу», «Дальше». Продолжать тот же ответ без вступления, сразу по делу."
-                )
+            explain_optic = None
             if plan.get("explain_mode"):
-                # Fix Pack D2: structure requirement вместо только length floor
-                expl = (
-                    "\n\n---\nEXPLAIN_MODE: Структура обязательна (без заголовков, но по смыслу):\n"
-                    "1) Первый абзац: заявленная оптика (если попросили через буддизм/другую — именно её рамку). "
-                    "2) Середина: 2–3 пункта или нумерованные предложения — как это работает в случае пользователя. "
-                    "3) Конец: одно практическое переформулирование (не новая практика каждый раз), затем макс 1 вопрос. "
-                    "Практика — макс 1, только если просит советы. СТРОГО не менее 900 символов."
-                )
-                if _has_buddhism_switch(user_text or ""):
-                    expl += (
-                        "\n\n---\nБУДДИЙСКАЯ ОПТИКА: Мягко, без лекции. Ключи: дуккха/танха (привязанность к контролю), "
-                        "непостоянство, осознанность к тяге к определённости. Переведи на язык пользователя, не академично."
-                    )
+                if feats(_has_buddhism_switch):
+                    explain_optic = "buddhism"
                 elif any(k in (user_text or "").lower() for k in ("пример", "покажи", "как выглядит", "на моём случае", "на моем случае")):
-                    expl += " Обязательно включи конкретный пример."
-                system_prompt += expl
-                # PATCH F: Explain Expander — развернуто и читабельно
-                system_prompt += "\n\n---\n" + _explain_mode_instructions_ru()
-            if plan.get("allow_philosophy_examples") and (detect_financial_pattern(user_text) or any(k in (user_text or "").lower() for k in ("смысл", "выбор", "решен", "нереш", "ценност"))):
-                system_prompt += "\n\n---\nv21.1 Multi-style: 2–3 оптики. Максимум 3 школы, 1 вопрос, 1 практика."
-            ctx = pack_context(user_id, state, HISTORY_STORE, user_language=state.get("user_language"))
+                    explain_optic = "example"
+            # Сборка промпта мемоизирована по (линзы, флаги) — см. utils/prompt_builder.py
+            prompt_flags = {
+                "extra": plan.get("system_prompt_extra", ""),
+                "force_expand": bool(state.get("force_expand_next")),
+                "rich_floor": rich_request and not plan.get("philosophy_pipeline") and not plan.get("explain_mode"),
+                "philosophy_pipeline": bool(plan.get("philosophy_pipeline")),
+                "explain_mode": bool(plan.get("explain_mode")),
+                "explain_optic": explain_optic,
+                "multi_style": bool(plan.get("allow_philosophy_examples") and (feats(detect_financial_pattern) or km.has(_MULTI_STYLE, user_text))),
+            }
+            built_prompt = SYSTEM_PROMPT_BUILDER.build(selected_names, prompt_flags)
+            state["force_expand_next"] = False
+            # Бюджет входа: сначала старая история, потом линзы с конца, в последнюю очередь — сообщение
+            budget = input_budget(plan, stage)
+            user_tokens = count_tokens(user_text)
+            degraded = []
+            while len(selected_names) > 1 and built_prompt.tokens + user_tokens + CONTEXT_MIN_TOKENS > budget:
+                selected_names = selected_names[:-1]
+                built_prompt = SYSTEM_PROMPT_BUILDER.build(selected_names, prompt_flags)
+                degraded.append("lens")
+            system_prompt = built_prompt.text
+            llm_user_text, ctx_tokens = _fit_input(built_prompt.tokens, user_text, plan, stage)
+            if llm_user_text != user_text:
+                degraded.append("user_text")
+            ctx = pack_context(user_id, state, HISTORY_STORE, user_language=state.get("user_language"), max_tokens=ctx_tokens)
+            turn_hints = []  # подсказки этого хода — идут и в полный контекст, и в дельту цепочки
             if plan.get("explain_mode"):
-                ctx = (ctx + f"\n\n[explain_mode: true]\n[explain_topic: {(user_text or '')[:200]}]").strip() if ctx else f"[explain_mode: true]\n[explain_topic: {(user_text or '')[:200]}]"
+                turn_hints.append(f"[explain_mode: true]\n[explain_topic: {(user_text or '')[:200]}]")
             if plan.get("system_prompt_extra"):
                 path_hint = try_graph_answer_ru(user_text or "")
                 if path_hint:
-                    ctx = (ctx + f"\n\n{path_hint}").strip() if ctx else path_hint
-            guidance_ctx_for_completion = {"system_prompt": system_prompt, "ctx": ctx, "user_text": user_text}
-            reply_text = call_openai(system_prompt, user_text, context_block=ctx)
+                    turn_hints.append(path_hint)
+            for hint in turn_hints:
+                ctx = (ctx + f"\n\n{hint}").strip() if ctx else hint
+            token_report = {
+                "budget": budget,
+                "system": built_prompt.tokens,
+                "context": count_tokens(ctx),
+                "user": count_tokens(llm_user_text),
+                "degraded": degraded,
+            }
+            guidance_ctx_for_completion = {"system_prompt": system_prompt, "ctx": ctx, "user_text": llm_user_text}
+            reply_text = _call_with_chain(user_id, state, system_prompt, llm_user_text, ctx, turn_hints)
             # Fix Pack D: не укорачивать при rich_request / explain / philosophy
             if _is_meta_lecture(reply_text) and not plan.get("philosophy_pipeline") and not plan.get("explain_mode") and not plan.get("disable_short_mode") and not rich_request:
-                reply_text = call_openai(system_prompt, user_text, force_short=True, context_block=ctx)
-            if _is_existential(user_text) and stage != "guidance":
+                retry_meta: dict = {}
+                reply_text = _retry_call(system_prompt, llm_user_text, ctx, retry_meta, force_short=True)
+                _adopt_retry(state, retry_meta)
+                llm_retries += 1
+            if feats(_is_existential) and stage != "guidance":
                 reply_text = _trim_existential(reply_text)
             raw_llm_text = reply_text
             reply_text = postprocess_response(reply_text, stage, philosophy_pipeline=plan.get("philosophy_pipeline", False), mode_tag=mode_tag, answer_first_required=plan.get("answer_first_required", False), explain_mode=plan.get("explain_mode", False))
@@ -1227,8 +1432,12 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
                 expand_hint = f"Ответ должен быть не менее {floor_chars} символов. Разверни мысль, добавь пример или слой анализа."
                 gc = guidance_ctx_for_completion
                 ctx_expand = (gc["ctx"] + f"\n\n[требование: {expand_hint}]").strip() if gc.get("ctx") else f"[требование: {expand_hint}]"
-                reply_text2 = call_openai(gc["system_prompt"], gc["user_text"], context_block=ctx_expand)
+                retry_meta = {}
+                reply_text2 = _retry_call(gc["system_prompt"], gc["user_text"], ctx_expand, retry_meta)
+                expand_retry = True
+                llm_retries += 1
                 if len((reply_text2 or "").strip()) >= floor_chars:
+                    _adopt_retry(state, retry_meta)
                     reply_text = postprocess_response(reply_text2, stage, philosophy_pipeline=plan.get("philosophy_pipeline", False), mode_tag=mode_tag, answer_first_required=plan.get("answer_first_required", False), explain_mode=plan.get("explain_mode", False))
             stable_match = detect_stable_pattern(user_text)
             if should_inject(state, stage, stable_match, is_safety=False):
@@ -1307,7 +1516,10 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
         reply_text2 = final_send_clamp(reply_text2, **clamp_kw)
         if looks_incomplete(reply_text2) and guidance_ctx_for_completion:
             gc = guidance_ctx_for_completion
-            reply_text2 = call_openai(gc["system_prompt"], gc["user_text"], context_block=gc["ctx"])
+            retry_meta = {}
+            reply_text2 = _retry_call(gc["system_prompt"], gc["user_text"], gc["ctx"], retry_meta)
+            _adopt_retry(state, retry_meta)
+            llm_retries += 1
             reply_text2 = postprocess_response(reply_text2, stage, philosophy_pipeline=plan.get("philosophy_pipeline", False), mode_tag=mode_tag, answer_first_required=plan.get("answer_first_required", False), explain_mode=plan.get("explain_mode", False))
             reply_text2 = final_send_clamp(reply_text2, **clamp_kw)
         reply_text = reply_text2
@@ -1321,7 +1533,7 @@ def generate_reply_core(user_id: int, user_text: str) -> dict:
         state["force_expand_next"] = True
     if state.get("orientation_lock"):
         state["orientation_lock"] = False
-    telemetry = {"stage": stage, "mode_tag": mode_tag, "lenses": selected_names, "pattern_id": pattern_id, "intent": plan.get("intent", "none"), "blocks_used": plan.get("blocks_used", "none")}
+    telemetry = {"stage": stage, "mode_tag": mode_tag, "lenses": selected_names, "pattern_id": pattern_id, "intent": plan.get("intent", "none"), "blocks_used": plan.get("blocks_used", "none"), "expand_retry": expand_retry, "llm_retries": llm_retries, "input_tokens": token_report, "features": feats.summary()}
     return {"reply_text": reply_text, "telemetry": telemetry, "mode": mode_tag, "stage": stage}
 
 
@@ -1375,17 +1587,29 @@ async def process_user_query(message: Message, user_text: str, update_id: Option
             from philosophy.source_rule import get_user_language
             state["user_language"] = get_user_language(_lang_code)
 
-    # Core pipeline (общий для bot и eval)
-    result = generate_reply_core(user_id, user_text)
+    # Core pipeline (общий для bot и eval); topic_mid → mini-модель пачкой с параллельными сообщениями
+    result = await generate_reply_core_batched(user_id, user_text)
     reply_text = result.get("reply_text", "")
 
     if result.get("stage") == "safety":
         log_safety_event(user_id, user_text)
     tel = result.get("telemetry", {})
-    log_dialog(user_id, user_text, tel.get("lenses", []), reply_text)
     save_state(_state_to_persist())
     corr = f"u{update_id}_m{getattr(message, 'message_id', '?')}" if update_id else None
-    await send_text(bot, message.chat.id, reply_text, reply_markup=FEEDBACK_KEYBOARD, correlation_id=corr)
+    sent = None
+    try:
+        sent = await send_text(bot, message.chat.id, reply_text, reply_markup=FEEDBACK_KEYBOARD, correlation_id=corr)
+    finally:
+        # message_id ответа (с кнопками фидбека) — ключ связи feedback ↔ реплика в аналитике
+        log_dialog(
+            user_id, user_text, tel.get("lenses", []), reply_text,
+            message_id=getattr(sent, "message_id", None),
+            meta={k: tel[k] for k in ("intent", "stage", "expand_retry", "llm_retries") if k in tel},
+        )
+    # Скользящее резюме — после отправки, в фоне: ответ его не ждёт
+    state = USER_STATE.get(user_id)
+    if state is not None and result.get("stage") != "safety":
+        SUMMARY_REFRESHER.maybe_schedule(user_id, state, HISTORY_STORE.get(user_id, []))
 
 
 @dp.message(F.voice)
@@ -1437,51 +1661,193 @@ async def handle_feedback(callback: CallbackQuery) -> None:
 
 
 async def _run_export_server() -> None:
-    """HTTP‑сервер для /export — экспорт диалогов из БД."""
+    """HTTP‑сервер (PORT + EXPORT_TOKEN): /export — диалоги из БД (только при DATABASE_URL);
+    /search и /stats — локальные SQLite-аналитика и живые агрегаты, Postgres им не нужен."""
     port = int(os.getenv("PORT", "0"))
-    if port <= 0 or not DATABASE_URL or not EXPORT_TOKEN:
+    if port <= 0 or not EXPORT_TOKEN:
         return
 
     from aiohttp import web
 
-    async def export_handler(request: web.Request) -> web.Response:
-        token = request.query.get("token", "")
+    async def export_handler(request: web.Request) -> web.StreamResponse:
+        """/export?token=…[&since=&until=&user_id=&cursor=&limit=][&format=ndjson][&gzip=1]
+
+        format=ndjson — потоковая выдача из server-side cursor (одна запись на строку,
+        последняя строка {"_meta": {"count", "next_cursor"}}); иначе legacy JSON.
+        БД читается в потоке-исполнителе — event loop не блокируется.
+        """
+        q = request.query
+        token = q.get("token", "")
         if token != EXPORT_TOKEN:
             return web.json_response({"error": "unauthorized"}, status=401)
-        dialogs = export_dialogs_from_db()
-        return web.json_response({"dialogs": dialogs, "count": len(dialogs)})
+        filters = {"since": q.get("since") or None, "until": q.get("until") or None}
+        try:
+            if q.get("user_id"):
+                filters["user_id"] = int(q["user_id"])
+            limit = int(q["limit"]) if q.get("limit") else None
+        except ValueError:
+            return web.json_response({"error": "bad user_id/limit"}, status=400)
+        if q.get("cursor"):
+            after = decode_export_cursor(q["cursor"])
+            if after is None:
+                return web.json_response({"error": "bad cursor"}, status=400)
+            filters["after"] = after
+        filters["limit"] = limit
+
+        if q.get("format") != "ndjson":
+            return web.json_response(await asyncio.to_thread(export_dialogs_from_db, **filters))
+
+        # статус 200 уходит с prepare(): недоступную БД сообщить до него, а не пустой выдачей
+        if await asyncio.to_thread(_get_db_conn) is None:
+            return web.json_response({"error": "database unavailable"}, status=503)
+        use_gzip = q.get("gzip") == "1" or "gzip" in request.headers.get("Accept-Encoding", "")
+        resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson; charset=utf-8"})
+        if use_gzip:
+            resp.headers["Content-Encoding"] = "gzip"
+        await resp.prepare(request)
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        rows = iter_dialogs_from_db(**filters)
+
+        def _next_chunk() -> list:
+            out = []
+            for d in rows:
+                out.append(d)
+                if len(out) >= EXPORT_CHUNK_ROWS:
+                    break
+            return out
+
+        count, last_cursor = 0, None
+        try:
+            while True:
+                chunk = await asyncio.to_thread(_next_chunk)
+                if not chunk:
+                    break
+                count += len(chunk)
+                last_cursor = chunk[-1]["cursor"]
+                data = "".join(json.dumps(d, ensure_ascii=False) + "\n" for d in chunk).encode("utf-8")
+                await resp.write(gz.compress(data) if gz else data)
+            meta = {"_meta": {"count": count, "next_cursor": last_cursor if limit and count >= limit else None}}
+            tail = (json.dumps(meta) + "\n").encode("utf-8")
+            await resp.write(gz.compress(tail) + gz.flush() if gz else tail)
+        finally:
+            await asyncio.to_thread(rows.close)
+        await resp.write_eof()
+        return resp
+
+    async def search_handler(request: web.Request) -> web.Response:
+        """/search?token=…&q=…[&since=&until=&lens=&stage=&user_id=&field=text_in|text_out&limit=]
+
+        Полнотекстовый поиск по локальной аналитике (SQLite FTS5), новые реплики первыми.
+        """
+        q = request.query
+        if q.get("token", "") != EXPORT_TOKEN:
+            return web.json_response({"error": "unauthorized"}, status=401)
+        query = (q.get("q") or "").strip()
+        if not query:
+            return web.json_response({"error": "q required"}, status=400)
+        try:
+            filters = {
+                "since": q.get("since") or None,
+                "until": q.get("until") or None,
+                "lens": q.get("lens") or None,
+                "stage": q.get("stage") or None,
+                "user_id": int(q["user_id"]) if q.get("user_id") else None,
+                "field": q.get("field") or None,
+                "limit": int(q.get("limit") or 50),
+            }
+        except ValueError:
+            return web.json_response({"error": "bad user_id/limit"}, status=400)
+        try:
+            hits = await asyncio.to_thread(search_dialogs, query, **filters)
+        except Exception as e:
+            return web.json_response({"error": f"search failed: {e}"}, status=500)
+        return web.json_response({"hits": hits, "count": len(hits)})
+
+    async def stats_handler(request: web.Request) -> web.Response:
+        """/stats?token=…[&days=7] — живые агрегаты (реплики, линзы, intent, фидбек, safety, ретраи LLM)."""
+        q = request.query
+        if q.get("token", "") != EXPORT_TOKEN:
+            return web.json_response({"error": "unauthorized"}, status=401)
+        try:
+            days = int(q.get("days") or 7)
+        except ValueError:
+            return web.json_response({"error": "bad days"}, status=400)
+        return web.json_response(live_stats_snapshot(days))
 
     async def health_handler(_: web.Request) -> web.Response:
-        return web.json_response(_health_payload())
+        # stats() кэша интентов и аналитики читают SQLite — не на event loop
+        return web.json_response(await asyncio.to_thread(_health_payload))
 
     app = web.Application()
-    app.router.add_get("/export", export_handler)
+    if DATABASE_URL:
+        app.router.add_get("/export", export_handler)
+    app.router.add_get("/search", search_handler)
+    app.router.add_get("/stats", stats_handler)
     app.router.add_get("/", health_handler)
     app.router.add_get("/health", health_handler)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", port)
     await site.start()
-    print(f"Export server: PORT={port} /export?token=...")
+    print(f"Export server: PORT={port} {'/export, ' if DATABASE_URL else ''}/search, /stats ?token=...")
+
+
+def _make_backup_job() -> BackupJob:
+    """Бэкап логов: async subprocess + lease между репликами (Postgres advisory lock или flock)."""
+    file_lease = FileLease(PROJECT_ROOT / "exports" / ".backup_job.lock")
+    lease = PgLease(connect_db_dedicated, fallback=file_lease) if DATABASE_URL else file_lease
+    return BackupJob(PROJECT_ROOT / "scripts" / "backup_logs_daily.py", PROJECT_ROOT, lease)
+
+
+BACKUP_JOB: Optional[BackupJob] = None
 
 
 async def _daily_backup_task() -> None:
-    """Ежедневное сохранение логов (если BACKUP_DAILY=1)."""
-    import subprocess
-    backup_script = PROJECT_ROOT / "scripts" / "backup_logs_daily.py"
+    """Ежедневное сохранение логов (если BACKUP_DAILY=1). Не блокирует event loop."""
+    global BACKUP_JOB
+    BACKUP_JOB = _make_backup_job()
+    await BACKUP_JOB.run_forever()
+
+
+LOG_SEAL_INTERVAL_SEC = 3600
+
+
+async def _seal_log_segments_task() -> None:
+    """Раз в час: индекс + сжатие закрытых сегментов логов (в потоке, не блокирует loop)."""
     while True:
-        await asyncio.sleep(86400)  # 24 ч
-        if backup_script.exists():
-            try:
-                subprocess.run(
-                    [sys.executable, str(backup_script)],
-                    cwd=str(PROJECT_ROOT),
-                    capture_output=True,
-                    timeout=60,
-                )
-            except Exception as e:
-                if DEBUG:
-                    print(f"[Phi] backup error: {e}")
+        try:
+            sealed = await asyncio.to_thread(seal_log_segments)
+            if sealed:
+                print(f"[Phi] Log segments sealed: {sealed}")
+        except Exception as e:
+            print(f"[Phi] seal log segments error: {e}")
+        await asyncio.sleep(LOG_SEAL_INTERVAL_SEC)
+
+
+ANALYTICS_SYNC_SEC = int(os.getenv("PHI_ANALYTICS_SYNC_SEC", "300"))
+
+
+async def _analytics_sync_task() -> None:
+    """Инкрементально догружать логи в SQLite-аналитику (PHI_ANALYTICS_SYNC_SEC, 0 — выкл.)."""
+    while True:
+        await asyncio.sleep(ANALYTICS_SYNC_SEC)
+        try:
+            await asyncio.to_thread(sync_analytics)
+        except Exception as e:
+            print(f"[Phi] analytics sync error: {e}")
+
+
+LIVE_STATS_SAVE_SEC = 60
+
+
+async def _live_stats_save_task() -> None:
+    """Периодически сбрасывать живые агрегаты на диск (переживают рестарт)."""
+    while True:
+        await asyncio.sleep(LIVE_STATS_SAVE_SEC)
+        try:
+            await asyncio.to_thread(save_live_stats)
+        except Exception as e:
+            print(f"[Phi] live stats save error: {e}")
 
 
 async def main() -> None:
@@ -1493,28 +1859,46 @@ async def main() -> None:
 
     if DATABASE_URL:
         conn = _get_db_conn()
-        print(f"[DB] PostgreSQL: {'OK' if conn else 'FAIL (см. лог выше)'}")
+        print(f"[DB] PostgreSQL: {'OK' if conn else 'FAIL (см. лог выше, записи копятся в outbox)'}")
+        start_db_writer()
 
     port = int(os.getenv("PORT", "0"))
-    if port > 0 and DATABASE_URL and EXPORT_TOKEN:
+    api_server = port > 0 and bool(EXPORT_TOKEN)
+    if api_server:
         asyncio.create_task(_run_export_server())
 
     # Ежедневный бэкап логов (BACKUP_DAILY=1, локальный запуск)
     if os.getenv("BACKUP_DAILY", "").strip() == "1":
         asyncio.create_task(_daily_backup_task())
-        print("[Phi] Daily backup enabled (exports/dialogs_YYYY-MM-DD.json)")
-    elif port > 0:
-        # Railway web требует listen на PORT — заглушка если нет DB
+        print("[Phi] Daily backup enabled (exports/dialogs_YYYY-MM-DD.jsonl.gz)")
+    elif port > 0 and not api_server:
+        # Railway web требует listen на PORT — заглушка, если PORT не занят сервером /export /search /stats
         from aiohttp import web
         app = web.Application()
         app.router.add_get("/", lambda r: web.Response(text="Phi Bot"))
-        app.router.add_get("/health", lambda r: web.json_response(_health_payload()))
+
+        async def stub_health(_: web.Request) -> web.Response:
+            return web.json_response(await asyncio.to_thread(_health_payload))
+
+        app.router.add_get("/health", stub_health)
         runner = web.AppRunner(app)
         await runner.setup()
         await web.TCPSite(runner, "0.0.0.0", port).start()
 
+    # История диалогов переживает рестарт: восстановить из журнала (PHI_HISTORY_PATH)
+    HISTORY_STORE.attach_journal()
+    INTENT_CACHE.attach()
+    asyncio.create_task(_seal_log_segments_task())
+    asyncio.create_task(_live_stats_save_task())
+    if ANALYTICS_SYNC_SEC > 0:
+        asyncio.create_task(_analytics_sync_task())
+
     print("Бот запущен. Ожидание сообщений...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Фоновый writer: дописать очередь и fsync до выхода процесса
+        close_logs()
 
 
 if __name__ == "__main__":
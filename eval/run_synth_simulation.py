@@ -288,7 +288,10 @@ def main():
             sys.exit(1)
 
     from eval.checks import run_checks
-    from bot import EVAL_CALL_METAS
+    from bot import EVAL_CALL_METAS, INTENT_CACHE
+
+    if use_cache:
+        INTENT_CACHE.attach(Path(args.cache_dir) / "intent_cache.sqlite3")
 
     only_failed_pairs = None
     if args.only_failed:
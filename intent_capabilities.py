@@ -2,6 +2,16 @@
 import re
 from dataclasses import dataclass
 
+from utils import keyword_matcher as km
+
+# Быстрые исключения: если это явно "тема/проблема", не перехватываем
+CAP_TOPIC_MARKERS = [
+    "дружб", "любов", "смерт", "деньг", "морал", "смысл", "выбор", "страх",
+    "тревог", "сон", "бессон", "работ", "увол", "развод", "отношен", "сем",
+    "апат", "депресс", "паник", "злост", "обид"
+]
+_CAP_TOPIC = km.register("capabilities.topic", CAP_TOPIC_MARKERS, view="cap")
+
 
 @dataclass
 class CapIntentResult:
@@ -11,11 +21,7 @@ class CapIntentResult:
 
 
 def _norm(text: str) -> str:
-    t = (text or "").lower().strip()
-    t = t.replace("ё", "е")
-    t = re.sub(r"[^\w\s]", " ", t, flags=re.UNICODE)
-    t = re.sub(r"\s+", " ", t, flags=re.UNICODE).strip()
-    return t
+    return km.scan_message(text or "").view("cap")
 
 
 def detect_capabilities_intent(user_text: str) -> CapIntentResult:
@@ -24,13 +30,7 @@ def detect_capabilities_intent(user_text: str) -> CapIntentResult:
     if not t:
         return CapIntentResult(False, 0, ["empty"])
 
-    # Быстрые исключения: если это явно "тема/проблема", не перехватываем
-    topic_markers = [
-        "дружб", "любов", "смерт", "деньг", "морал", "смысл", "выбор", "страх",
-        "тревог", "сон", "бессон", "работ", "увол", "развод", "отношен", "сем",
-        "апат", "депресс", "паник", "злост", "обид"
-    ]
-    if any(m in t for m in topic_markers) and ("что ты" not in t and "чем ты" not in t and "как ты" not in t):
+    if km.has(_CAP_TOPIC, user_text) and ("что ты" not in t and "чем ты" not in t and "как ты" not in t):
         return CapIntentResult(False, 0, ["topic_like"])
 
     score = 0
@@ -2,6 +2,8 @@
 import re
 from functools import lru_cache
 
+from utils import keyword_matcher as km
+
 EXPLAIN_MARKERS = [
     "объясни", "поясни", "детальнее", "подробнее", "разверни",
     "разбери", "на кусочки", "расшифруй", "что ты имеешь в виду",
@@ -24,27 +26,26 @@ EXPLAIN_PATTERNS = [
 ]
 
 
+_EXPLAIN_MARKERS = km.register("explain_ru.markers", EXPLAIN_MARKERS, view="yo")
+_EXPLAIN_BONUS = km.register("explain_ru.bonus", ("объясни", "поясни", "детальнее", "подробнее"), view="yo")
+
+
 def _norm(t: str) -> str:
-    t = (t or "").lower().replace("ё", "е")
-    t = re.sub(r"\s+", " ", t).strip()
-    return t
+    return km.scan_message(t or "").view("yo")
 
 
 @lru_cache(maxsize=2048)
 def explain_score(text: str) -> int:
     t = _norm(text)
-    score = 0
-
-    for m in EXPLAIN_MARKERS:
-        if m in t:
-            score += 1
+    match = km.scan_message(text or "")
+    score = match.count(_EXPLAIN_MARKERS)
 
     for pat in EXPLAIN_PATTERNS:
         if re.search(pat, t):
             score += 2
 
     # bonus if user explicitly asks to expand/clarify
-    if "объясни" in t or "поясни" in t or "детальнее" in t or "подробнее" in t:
+    if match.has(_EXPLAIN_BONUS):
         score += 2
 
     return score
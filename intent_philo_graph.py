@@ -2,6 +2,8 @@
 import re
 from typing import List
 
+from utils import keyword_matcher as km
+
 # Common Russian philosopher names -> English (for DB lookup)
 RU_TO_EN_PHILO = {
     "кант": "kant",
@@ -32,9 +34,11 @@ PHILO_GRAPH_MARKERS = [
 ]
 
 
+_PHILO_GRAPH = km.register("philo_graph.markers", PHILO_GRAPH_MARKERS)
+
+
 def is_philo_graph_intent(text: str) -> bool:
-    t = (text or "").lower()
-    return any(m in t for m in PHILO_GRAPH_MARKERS)
+    return km.has(_PHILO_GRAPH, text)
 
 
 def extract_names_naive(text: str) -> List[str]:
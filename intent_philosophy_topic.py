@@ -1,7 +1,8 @@
 # intent_philosophy_topic.py
-import re
 from typing import Tuple, Dict, Any
 
+from utils import keyword_matcher as km
+
 # Маркеры "это философская тема/понятие", а не личная история
 # Расширено: один stem ловит много вариаций (расскажи про = расскажи/мне/те про)
 TOPIC_MARKERS = [
@@ -39,10 +40,15 @@ SCHOOL_SWITCH = [
 ]
 
 
+_TOPIC_MARKERS = km.register("philosophy_topic.markers", TOPIC_MARKERS, view="ws")
+_PHILOSOPHY_TOPICS = km.register("philosophy_topic.topics", PHILOSOPHY_TOPICS, view="ws")
+_PERSONAL = km.register("philosophy_topic.personal", PERSONAL_MARKERS, view="ws")
+_SITUATION = km.register("philosophy_topic.situation", SITUATION_MARKERS, view="ws")
+_SCHOOL_SWITCH = km.register("philosophy_topic.school_switch", SCHOOL_SWITCH, view="ws")
+
+
 def _norm(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = re.sub(r"\s+", " ", s)
-    return s
+    return km.scan_message(s or "").view("ws")
 
 
 def detect_philosophy_topic_intent(user_text: str) -> Tuple[bool, Dict[str, Any]]:
@@ -57,26 +63,26 @@ def detect_philosophy_topic_intent(user_text: str) -> Tuple[bool, Dict[str, Any]
 
     score = 0
     reason = []
+    match = km.scan_message(user_text)
 
     # 1) Сильные конструкции
-    for m in TOPIC_MARKERS:
-        if m in t:
-            score += 1
-            reason.append(f"marker:{m}")
-            break
+    markers = match.hits(_TOPIC_MARKERS)
+    if markers:
+        score += 1
+        reason.append(f"marker:{markers[0]}")
 
     # 2) Темы (бог/смерть/дружба/мораль…)
-    if any(tok in t for tok in PHILOSOPHY_TOPICS):
+    if match.has(_PHILOSOPHY_TOPICS):
         score += 2
         reason.append("topic")
 
     # 3) Явный запрос "через X оптику" усиливает
-    if any(m in t for m in SCHOOL_SWITCH):
+    if match.has(_SCHOOL_SWITCH):
         score += 2
         reason.append("school_switch")
 
     # 4) Штраф: длинная личная ситуация
-    if len(t) >= 160 and any(pm in t for pm in PERSONAL_MARKERS) and any(sm in t for sm in SITUATION_MARKERS):
+    if len(t) >= 160 and match.has(_PERSONAL) and match.has(_SITUATION):
         score -= 2
         reason.append("penalty:personal_situation")
 
@@ -3,6 +3,8 @@
 import re
 from functools import lru_cache
 
+from utils import keyword_matcher as km
+
 # Имена философов, школ, направлений
 TOPIC_PREFIXES = [
     "будд", "стоик", "экзист", "аристот", "сократ", "платон",
@@ -38,11 +40,13 @@ TOPIC_PATTERNS = [
 ]
 
 
+_TOPIC_PREFIXES = km.register("topic_v2.prefixes", TOPIC_PREFIXES, view="yo")
+_TOPIC_NOUNS = km.register("topic_v2.nouns", TOPIC_NOUNS, view="yo")
+
+
 def _normalize(text: str) -> str:
     """E1.1: unify with P1-style normalization."""
-    t = (text or "").lower().replace("ё", "е")
-    t = re.sub(r"\s+", " ", t).strip()
-    return t
+    return km.scan_message(text or "").view("yo")
 
 
 @lru_cache(maxsize=2048)
@@ -50,13 +54,8 @@ def topic_score(text: str) -> int:
     t = _normalize(text)
     score = 0
 
-    for p in TOPIC_PREFIXES:
-        if p in t:
-            score += 2
-
-    for n in TOPIC_NOUNS:
-        if n in t:
-            score += 1
+    match = km.scan_message(text or "")
+    score += 2 * match.count(_TOPIC_PREFIXES) + match.count(_TOPIC_NOUNS)
 
     for pat in TOPIC_PATTERNS:
         if re.search(pat, t):
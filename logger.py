@@ -1,66 +1,279 @@
-"""Логирование диалогов, фидбека и safety-событий — по пользователям."""
+"""Логирование диалогов, фидбека и safety-событий — в сегменты по времени (utils.log_segments)."""
 
+import base64
 import json
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Iterator, Optional
+
+from utils.log_segments import seal_closed_segments, segment_path
+from utils.live_stats import LiveStats
+from utils.log_writer import get_writer
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 LOGS_DIR = PROJECT_ROOT / "logs"
-USERS_DIR = LOGS_DIR / "users"
+USERS_DIR = LOGS_DIR / "users"  # старая раскладка (до сегментов), см. utils.log_segments migrate
+SEGMENTS_DIR = LOGS_DIR / "segments"
+# Локальная аналитика (SQLite), догружается из сегментов: python -m utils.analytics_store report
+ANALYTICS_DB = Path(os.getenv("PHI_ANALYTICS_DB", str(LOGS_DIR / "analytics.sqlite3")))
+# Живые агрегаты (линзы, intent, фидбек, safety, ретраи) — снимок для рестарта
+LIVE_STATS_PATH = LOGS_DIR / "live_stats.json"
 
 # PostgreSQL (Railway) — опционально
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
-_db_conn = None
+DB_POOL_MAX = int(os.getenv("PHI_DB_POOL_MAX", "4"))
+DB_CONNECT_BACKOFF_MAX = 60.0
+# Записи для БД сначала ложатся сюда, реплеер досылает их при доступном Postgres
+OUTBOX_DIR = Path(os.getenv("PHI_OUTBOX_DIR", str(LOGS_DIR / "outbox")))
 
+# Колонки INSERT по таблицам (порядок = порядок значений в строке очереди)
+DB_TABLES: dict[str, tuple[str, ...]] = {
+    "dialogs": ("ts", "user_id", "text_in", "lenses", "text_out"),
+    "feedback_log": ("ts", "user_id", "message_id", "rating"),
+    "safety_log": ("ts", "user_id", "text_in", "reason"),
+}
 
-def _get_db_conn():
-    """Ленивое подключение к PostgreSQL (Railway требует sslmode)."""
-    global _db_conn
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_db_retry_at = 0.0
+_db_backoff = 0.0
+_db_writer = None
+
+
+def _db_url() -> str:
+    url = DATABASE_URL
+    if "sslmode" not in url.lower():
+        url += "?sslmode=require" if "?" not in url else "&sslmode=require"
+    return url
+
+
+def _ensure_schema(conn) -> None:
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS dialogs (
+            id SERIAL PRIMARY KEY, ts TIMESTAMPTZ, user_id BIGINT,
+            text_in TEXT, lenses TEXT, text_out TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS feedback_log (
+            id SERIAL PRIMARY KEY, ts TIMESTAMPTZ, user_id BIGINT,
+            message_id BIGINT, rating VARCHAR(32)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS safety_log (
+            id SERIAL PRIMARY KEY, ts TIMESTAMPTZ, user_id BIGINT,
+            text_in TEXT, reason VARCHAR(64)
+        )
+    """)
+    # idem_key: повтор батча из outbox не создаёт дублей (ON CONFLICT DO NOTHING)
+    for table in DB_TABLES:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS idem_key TEXT")
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_idem_key_uq ON {table} (idem_key)")
+    conn.commit()
+    cur.close()
+
+
+def _get_db_pool():
+    """Ленивый пул соединений PostgreSQL (Railway требует sslmode).
+
+    После неудачного подключения следующая попытка — не раньше чем через backoff
+    (1, 2, 4 … 60 с), чтобы сообщения не ждали reconnect синхронно.
+    """
+    global _db_pool, _db_retry_at, _db_backoff
+    if not DATABASE_URL:
+        return None
+    if _db_pool is not None:
+        return _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            return _db_pool
+        if time.monotonic() < _db_retry_at:
+            return None
+        try:
+            from psycopg2.pool import ThreadedConnectionPool
+            pool = ThreadedConnectionPool(1, DB_POOL_MAX, _db_url())
+            conn = pool.getconn()
+            try:
+                _ensure_schema(conn)
+            finally:
+                pool.putconn(conn)
+            _db_pool = pool
+            _db_backoff = 0.0
+            print("[DB] PostgreSQL connected, tables ready")
+            return _db_pool
+        except Exception as e:
+            _db_backoff = min(max(_db_backoff * 2, 1.0), DB_CONNECT_BACKOFF_MAX)
+            _db_retry_at = time.monotonic() + _db_backoff
+            print(f"[DB] Connection error: {e} (retry in {_db_backoff:.0f}s)")
+            return None
+
+
+def _reset_db_pool() -> None:
+    """Закрыть пул после обрыва соединения; следующий _get_db_pool переподключится."""
+    global _db_pool
+    with _db_pool_lock:
+        pool, _db_pool = _db_pool, None
+    if pool is not None:
+        try:
+            pool.closeall()
+        except Exception:
+            pass
+
+
+def connect_db_dedicated():
+    """Отдельное соединение PostgreSQL вне пула (сессионные advisory lock). None — БД недоступна.
+
+    Закрывает вызывающий; _reset_db_pool() его не трогает.
+    """
     if not DATABASE_URL:
         return None
-    if _db_conn is not None and not _db_conn.closed:
-        return _db_conn
     try:
         import psycopg2
-        url = DATABASE_URL
-        if "sslmode" not in url.lower():
-            url += "?sslmode=require" if "?" not in url else "&sslmode=require"
-        _db_conn = psycopg2.connect(url)
-        cur = _db_conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS dialogs (
-                id SERIAL PRIMARY KEY, ts TIMESTAMPTZ, user_id BIGINT,
-                text_in TEXT, lenses TEXT, text_out TEXT
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS feedback_log (
-                id SERIAL PRIMARY KEY, ts TIMESTAMPTZ, user_id BIGINT,
-                message_id BIGINT, rating VARCHAR(32)
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS safety_log (
-                id SERIAL PRIMARY KEY, ts TIMESTAMPTZ, user_id BIGINT,
-                text_in TEXT, reason VARCHAR(64)
-            )
-        """)
-        _db_conn.commit()
-        cur.close()
-        print("[DB] PostgreSQL connected, tables ready")
-        return _db_conn
+        return psycopg2.connect(_db_url(), connect_timeout=10)
     except Exception as e:
-        print(f"[DB] Connection error: {e}")
-        _db_conn = None
+        print(f"[DB] Dedicated connection error: {e}")
+        return None
+
+
+def _get_db_conn():
+    """Проверка доступности PostgreSQL (старт бота). Возвращает пул или None."""
+    return _get_db_pool()
+
+
+@contextmanager
+def db_connection():
+    """Соединение из пула на время блока (None, если БД недоступна)."""
+    pool = _get_db_pool()
+    if pool is None:
+        yield None
+        return
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except Exception:
+        broken = bool(getattr(conn, "closed", 0))
+        raise
+    finally:
+        try:
+            pool.putconn(conn, close=broken)
+        except Exception:
+            pass
+
+
+def _get_db_writer():
+    global _db_writer
+    if not DATABASE_URL:
         return None
+    if _db_writer is None:
+        from utils.db_writer import make_writer
+        _db_writer = make_writer(DB_TABLES, _get_db_pool, _reset_db_pool, OUTBOX_DIR)
+    return _db_writer
+
+
+def start_db_writer() -> None:
+    """Запустить реплеер outbox при старте (дослать хвост прошлого запуска)."""
+    writer = _get_db_writer()
+    if writer is not None:
+        writer.start()
+
+
+def _db_submit(table: str, row: tuple) -> None:
+    """Записать строку в outbox; в PostgreSQL её отправит фоновый реплеер."""
+    writer = _get_db_writer()
+    if writer is not None:
+        writer.submit(table, row)
+
+
+def db_writer_stats() -> dict:
+    """Backlog outbox и латентность INSERT по таблицам для /health ({} без DATABASE_URL)."""
+    writer = _get_db_writer()
+    return writer.stats() if writer is not None else {}
+
+
+def _append_jsonl(kind: str, record: dict) -> None:
+    """Поставить запись в очередь фонового writer: активный сегмент logs/segments/{kind}/."""
+    path = segment_path(SEGMENTS_DIR, kind)
+    get_writer().write(path, json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def seal_log_segments() -> int:
+    """Индексировать и сжать закрытые сегменты (блокирующий — вызывать вне event loop)."""
+    return seal_closed_segments(SEGMENTS_DIR, release=get_writer().release)
+
 
+_analytics = None
+_analytics_lock = threading.Lock()
 
-def _user_dir(user_id: int) -> Path:
-    """Папка логов пользователя: logs/users/{user_id}/"""
-    path = USERS_DIR / str(user_id)
-    path.mkdir(parents=True, exist_ok=True)
-    return path
+
+def _get_analytics():
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            from utils.analytics_store import AnalyticsStore
+            _analytics = AnalyticsStore(ANALYTICS_DB)
+    return _analytics
+
+
+def sync_analytics() -> int:
+    """Догрузить новые записи сегментов в SQLite-аналитику (блокирующий — вызывать вне event loop)."""
+    return _get_analytics().sync_segments(SEGMENTS_DIR)
+
+
+def search_dialogs(query: str, **filters) -> list[dict]:
+    """Полнотекстовый поиск по диалогам (FTS5); перед поиском догружает свежие сегменты."""
+    store = _get_analytics()
+    store.sync_segments(SEGMENTS_DIR)
+    return store.search(query, **filters)
+
+
+def analytics_stats() -> Optional[dict]:
+    """Счётчики синхронизации аналитики для /health (None — ещё не запускалась)."""
+    return _analytics.stats() if _analytics is not None else None
+
+
+_live_stats: Optional[LiveStats] = None
+_live_stats_lock = threading.Lock()
+
+
+def get_live_stats() -> LiveStats:
+    """Счётчики, обновляемые в log_*; снимок подхватывается из LIVE_STATS_PATH."""
+    global _live_stats
+    if _live_stats is None:
+        with _live_stats_lock:
+            if _live_stats is None:
+                _live_stats = LiveStats(LIVE_STATS_PATH)
+    return _live_stats
+
+
+def live_stats_snapshot(days: int = 7) -> dict:
+    return get_live_stats().snapshot(days)
+
+
+def save_live_stats() -> None:
+    """Сбросить живые агрегаты на диск (блокирующий — вызывать вне event loop)."""
+    if _live_stats is not None:
+        _live_stats.save()
+
+
+def log_writer_stats() -> dict:
+    """Счётчики фонового writer (очередь, дропы, backpressure) для /health."""
+    return get_writer().stats()
+
+
+def close_logs() -> None:
+    """Дописать очереди логов (файлы + PostgreSQL) и закрыть их (shutdown)."""
+    get_writer().close()
+    save_live_stats()
+    if _db_writer is not None:
+        _db_writer.close()
 
 
 def _ts() -> str:
@@ -72,8 +285,14 @@ def log_dialog(
     text_in: str,
     lenses: list[str],
     text_out: str,
+    message_id: Optional[int] = None,
+    meta: Optional[dict] = None,
 ) -> None:
-    """Логирует диалог в файл и (если DATABASE_URL) в PostgreSQL."""
+    """Логирует диалог в файл и (если DATABASE_URL) в outbox PostgreSQL.
+
+    message_id — id ответа бота (к нему привязан фидбек); meta — intent/stage/expand_retry/llm_retries
+    (только в файл и живые агрегаты).
+    """
     ts = _ts()
     record = {
         "ts": ts,
@@ -82,22 +301,17 @@ def log_dialog(
         "lenses": lenses,
         "text_out": text_out,
     }
-    udir = _user_dir(user_id)
-    with open(udir / "dialogs.jsonl", "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
-    conn = _get_db_conn()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO dialogs (ts, user_id, text_in, lenses, text_out) VALUES (%s, %s, %s, %s, %s)",
-                (ts, user_id, text_in, json.dumps(lenses, ensure_ascii=False), text_out),
-            )
-            conn.commit()
-            cur.close()
-        except Exception as e:
-            conn.rollback()
-            print(f"[DB] Insert dialogs error: {e}")
+    if message_id is not None:
+        record["message_id"] = message_id
+    if meta:
+        record.update(meta)
+    _append_jsonl("dialogs", record)
+    meta = meta or {}
+    get_live_stats().record_turn(
+        ts, lenses, meta.get("intent"), meta.get("stage"),
+        llm_retries=meta.get("llm_retries", 0), expand_retry=meta.get("expand_retry", False),
+    )
+    _db_submit("dialogs", (ts, user_id, text_in, json.dumps(lenses, ensure_ascii=False), text_out))
 
 
 def log_feedback(
@@ -105,41 +319,20 @@ def log_feedback(
     message_id: int,
     rating: str,
 ) -> None:
-    """Логирует фидбек в файл и (если DATABASE_URL) в PostgreSQL."""
+    """Логирует фидбек в файл и (если DATABASE_URL) в outbox PostgreSQL."""
     ts = _ts()
     record = {"ts": ts, "user_id": user_id, "message_id": message_id, "rating": rating}
-    udir = _user_dir(user_id)
-    with open(udir / "feedback.jsonl", "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
-    conn = _get_db_conn()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO feedback_log (ts, user_id, message_id, rating) VALUES (%s, %s, %s, %s)",
-                (ts, user_id, message_id, rating),
-            )
-            conn.commit()
-            cur.close()
-        except Exception as e:
-            conn.rollback()
-            print(f"[DB] Insert feedback error: {e}")
+    _append_jsonl("feedback", record)
+    get_live_stats().record_feedback(ts, rating)
+    _db_submit("feedback_log", (ts, user_id, message_id, rating))
 
 
 def log_event(event_name: str, **kwargs) -> None:
-    """Логирует generic event в файл (events.jsonl)."""
+    """Логирует generic event в сегмент events через фоновый writer."""
     ts = _ts()
     record = {"ts": ts, "event": event_name, **kwargs}
-    # user_id для папки; если нет — в общий events.jsonl
-    user_id = kwargs.get("user_id")
-    if user_id is not None:
-        udir = _user_dir(user_id)
-        path = udir / "events.jsonl"
-    else:
-        LOGS_DIR.mkdir(parents=True, exist_ok=True)
-        path = LOGS_DIR / "events.jsonl"
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    _append_jsonl("events", record)
+    get_live_stats().record_event(ts, event_name)
 
 
 def log_safety_event(
@@ -147,46 +340,97 @@ def log_safety_event(
     text_in: str,
     reason: str = "self_harm_indicators",
 ) -> None:
-    """Логирует safety-событие в файл и (если DATABASE_URL) в PostgreSQL."""
+    """Логирует safety-событие в файл и (если DATABASE_URL) в outbox PostgreSQL."""
     ts = _ts()
     record = {"ts": ts, "user_id": user_id, "text_in": text_in, "reason": reason}
-    udir = _user_dir(user_id)
-    with open(udir / "safety.jsonl", "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
-    conn = _get_db_conn()
-    if conn:
+    _append_jsonl("safety", record)
+    get_live_stats().record_safety(ts, reason)
+    _db_submit("safety_log", (ts, user_id, text_in, reason))
+
+
+EXPORT_CHUNK_ROWS = 1000
+
+
+def encode_export_cursor(ts: str, row_id: int) -> str:
+    """Непрозрачный курсор пагинации /export: (ts, id) последней выданной строки."""
+    return base64.urlsafe_b64encode(f"{ts}|{row_id}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_export_cursor(cursor: str) -> Optional[tuple[str, int]]:
+    """Разобрать курсор /export; None — курсор битый."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        ts, row_id = raw.rsplit("|", 1)
+        return ts, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def iter_dialogs_from_db(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    user_id: Optional[int] = None,
+    after: Optional[tuple[str, int]] = None,
+    limit: Optional[int] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[dict]:
+    """Диалоги из PostgreSQL по одному, через server-side cursor (память O(chunk_rows)).
+
+    Фильтры: since <= ts < until, user_id; after — keyset-пагинация по (ts, id).
+    Каждая запись содержит "cursor" для продолжения выгрузки. Блокирующий — вызывать вне event loop.
+    """
+    where, params = [], []
+    if since:
+        where.append("ts >= %s")
+        params.append(since)
+    if until:
+        where.append("ts < %s")
+        params.append(until)
+    if user_id is not None:
+        where.append("user_id = %s")
+        params.append(user_id)
+    if after:
+        where.append("(ts, id) > (%s, %s)")
+        params.extend(after)
+    sql = "SELECT id, ts, user_id, text_in, lenses, text_out FROM dialogs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts, id"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    with db_connection() as conn:
+        if conn is None:
+            return
+        cur = conn.cursor(name=f"phi_export_{uuid.uuid4().hex[:8]}")
+        cur.itersize = chunk_rows
         try:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO safety_log (ts, user_id, text_in, reason) VALUES (%s, %s, %s, %s)",
-                (ts, user_id, text_in, reason),
-            )
-            conn.commit()
+            cur.execute(sql, params)
+            for r in cur:
+                ts = r[1].isoformat() if hasattr(r[1], "isoformat") else str(r[1])
+                yield {
+                    "ts": str(r[1]),
+                    "user_id": r[2],
+                    "text_in": r[3],
+                    "lenses": json.loads(r[4]) if r[4] else [],
+                    "text_out": r[5],
+                    "cursor": encode_export_cursor(ts, r[0]),
+                }
+        finally:
             cur.close()
-        except Exception as e:
-            conn.rollback()
-            print(f"[DB] Insert safety error: {e}")
+            conn.rollback()  # закрыть транзакцию named cursor перед возвратом в пул
 
 
-def export_dialogs_from_db() -> list[dict]:
-    """Экспорт диалогов из PostgreSQL (для /export)."""
-    conn = _get_db_conn()
-    if not conn:
-        return []
+def export_dialogs_from_db(**filters) -> dict:
+    """Экспорт диалогов из PostgreSQL одним ответом (legacy /export JSON). Фильтры — как у iter_dialogs_from_db.
+    {"dialogs", "count", "next_cursor"}; next_cursor — если выдача упёрлась в limit. Ошибка БД — пустой список."""
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT ts, user_id, text_in, lenses, text_out FROM dialogs ORDER BY ts")
-        rows = cur.fetchall()
-        cur.close()
-        return [
-            {
-                "ts": str(r[0]),
-                "user_id": r[1],
-                "text_in": r[2],
-                "lenses": json.loads(r[3]) if r[3] else [],
-                "text_out": r[4],
-            }
-            for r in rows
-        ]
-    except Exception:
-        return []
+        dialogs = list(iter_dialogs_from_db(**filters))
+    except Exception as e:
+        print(f"[DB] export error: {e}")
+        dialogs = []
+    limit = filters.get("limit")
+    next_cursor = dialogs[-1]["cursor"] if limit and len(dialogs) >= limit else None
+    for d in dialogs:
+        d.pop("cursor", None)
+    return {"dialogs": dialogs, "count": len(dialogs), "next_cursor": next_cursor}
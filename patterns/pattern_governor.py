@@ -4,6 +4,8 @@ import random
 from typing import Any, Optional
 
 from router import detect_financial_pattern
+from utils import keyword_matcher as km
+from utils.message_features import MessageFeatures
 from intent_capabilities import detect_capabilities_intent, CAPABILITIES_REPLY_RU
 from intent_philosophy_topic import detect_philosophy_topic_intent
 from intent_topic_v2 import is_topic_high, is_topic_mid
@@ -117,19 +119,32 @@ BUDDHISM_SWITCH_MARKERS = (
 )
 
 
+# structure-запрос, допускающий философскую рамку
+STRUCTURE_PHILOSOPHY_MARKERS = ("философ", "рамк", "модель", "оптик")
+PHILOSOPHY_CHAT_MARKERS = ("давай просто поговорим про философию", "как разные традиции смотрят на")
+
+_PRAGMATIC = km.register("governor.pragmatic", PRAGMATIC_TRIGGERS)
+_IRRITATION_SHORT = km.register("governor.irritation_short", IRRITATION_SHORT_TRIGGERS)
+_FULL_Q = km.register("governor.full_q", FULL_Q_MARKERS)
+_STATE_TOPIC = km.register("governor.state_topic", STATE_TOPIC_MARKERS)
+_ACTION_OPENERS = km.register("governor.action_openers", ACTION_OPENERS)
+_STRUCTURE_STEPS = km.register("governor.structure_steps", STRUCTURE_STEPS_MARKERS)
+_STRUCTURE_PHILOSOPHY = km.register("governor.structure_philosophy", STRUCTURE_PHILOSOPHY_MARKERS)
+_RELIGIOUS = km.register("governor.religious", RELIGIOUS_MARKERS)
+_BUDDHISM_SWITCH = km.register("governor.buddhism_switch", BUDDHISM_SWITCH_MARKERS)
+_PHILOSOPHY_CHAT = km.register("governor.philosophy_chat", PHILOSOPHY_CHAT_MARKERS)
+
+
 def _has_structure_steps_marker(text: str) -> bool:
-    t = (text or "").strip().lower()
-    return any(m in t for m in STRUCTURE_STEPS_MARKERS)
+    return km.has(_STRUCTURE_STEPS, text)
 
 
 def _has_religious_marker(text: str) -> bool:
-    t = (text or "").strip().lower()
-    return any(m in t for m in RELIGIOUS_MARKERS)
+    return km.has(_RELIGIOUS, text)
 
 
 def _has_buddhism_switch(text: str) -> bool:
-    t = (text or "").strip().lower()
-    return any(m in t for m in BUDDHISM_SWITCH_MARKERS)
+    return km.has(_BUDDHISM_SWITCH, text)
 
 
 def is_full_question(text: str) -> bool:
@@ -142,7 +157,7 @@ def is_full_question(text: str) -> bool:
     if len(t) >= 220:
         return True
 
-    hits = sum(1 for m in FULL_Q_MARKERS if m in t)
+    hits = km.count(_FULL_Q, text)
     if len(t) >= 160 and hits >= 2:
         return True
 
@@ -154,35 +169,24 @@ def is_full_question(text: str) -> bool:
 
 def _has_pragmatic_trigger(text: str) -> bool:
     """FIX C: пользователь хочет конкретики, не афоризмов."""
-    t = (text or "").strip().lower()
-    return any(tr in t for tr in PRAGMATIC_TRIGGERS)
+    return km.has(_PRAGMATIC, text)
 
 
 def _is_action_state_request(text: str) -> bool:
     """FIX D: 'как/что делать/помоги' + темы состояния → answer-first, без triage."""
-    t = (text or "").strip().lower()
-    has_opener = any(o in t for o in ACTION_OPENERS)
-    has_state = any(m in t for m in STATE_TOPIC_MARKERS)
-    return has_opener and has_state
+    return km.has(_ACTION_OPENERS, text) and km.has(_STATE_TOPIC, text)
 
 
 def _is_philosophy_chat_request(text: str) -> bool:
     """FIX D: 'давай просто поговорим про философию' → philosophy_pipeline, без triage."""
-    t = (text or "").strip().lower()
-    return "давай просто поговорим про философию" in t or "как разные традиции смотрят на" in t
+    return km.has(_PHILOSOPHY_CHAT, text)
 
 
-def governor_plan(
-    user_id: int,
-    stage: str,
-    user_text: str,
-    context: dict,
-    state: dict,
-    llm_classify_fn=None,
-) -> dict:
-    """Возвращает план для pattern engine."""
+def _plan_before_topic_llm(f: MessageFeatures) -> Optional[dict]:
+    """Ветки governor_plan до вопроса к mini-модели (topic_mid). Одна функция для governor_plan
+    и needs_topic_llm: новая ранняя ветка добавляется сюда, иначе ядро спросит модель зря."""
     # BUG2: религиозный короткий запрос → явно в philosophy, не в warmup/orientation
-    if has_religion_in_orientation_context(user_text):
+    if f(has_religion_in_orientation_context):
         return {
             "stage_override": "guidance",
             "answer_first_required": True,
@@ -197,7 +201,7 @@ def governor_plan(
         }
 
     # CAPABILITIES INTENT: "что ты умеешь / чем полезен" → canned reply, без warmup
-    cap = detect_capabilities_intent(user_text)
+    cap = f(detect_capabilities_intent)
     if cap.is_capabilities:
         return {
             "stage_override": "guidance",
@@ -213,7 +217,7 @@ def governor_plan(
         }
 
     # P1: Philosophy topic gate (concept/explain questions: Бог/смерть/дружба/смысл/мораль и т.д.)
-    is_topic, topic_meta = detect_philosophy_topic_intent(user_text)
+    is_topic, topic_meta = f(detect_philosophy_topic_intent)
     if is_topic:
         return {
             "stage_override": "guidance",
@@ -232,7 +236,7 @@ def governor_plan(
         }
 
     # PATCH E: Topic Gate V2 — topic_high (score >= 5) или topic_mid + LLM
-    if is_topic_high(user_text):
+    if f(is_topic_high):
         return {
             "philosophy_pipeline": True,
             "allow_philosophy_examples": True,
@@ -248,7 +252,35 @@ def governor_plan(
             "min_chars": 900,
             "intent": "philosophy_topic_high",
         }
-    if is_topic_mid(user_text) and llm_classify_fn:
+    return None
+
+
+def needs_topic_llm(user_text: str, features: Optional[MessageFeatures] = None) -> bool:
+    """Спросит ли governor_plan llm_classify_fn: topic_mid и ни одна ранняя ветка не сработала."""
+    f = features if features is not None else MessageFeatures(user_text)
+    return bool(f(is_topic_mid)) and _plan_before_topic_llm(f) is None
+
+
+def governor_plan(
+    user_id: int,
+    stage: str,
+    user_text: str,
+    context: dict,
+    state: dict,
+    llm_classify_fn=None,
+    features: Optional[MessageFeatures] = None,
+) -> dict:
+    """Возвращает план для pattern engine.
+
+    features — признаки сообщения хода (utils.message_features): предикаты, уже посчитанные
+    ботом, не пересчитываются. Без него — свой кэш на вызов.
+    """
+    f = features if features is not None else MessageFeatures(user_text)
+    plan = _plan_before_topic_llm(f)
+    if plan is not None:
+        return plan
+    # PATCH E: topic_mid → решает mini-модель
+    if f(is_topic_mid) and llm_classify_fn:
         if llm_classify_fn(user_text):
             return {
                 "philosophy_pipeline": True,
@@ -267,7 +299,7 @@ def governor_plan(
             }
 
     # PATCH F: Explain Expander — "объясни", "поясни", "детальнее", "подробнее" etc.
-    if detect_explain_intent(user_text):
+    if f(detect_explain_intent):
         return {
             "explain_mode": True,
             "stage_override": "guidance",
@@ -283,7 +315,7 @@ def governor_plan(
         }
 
     # Fix Pack D: Buddhism/tradition switch → explain_mode + philosophy_pipeline (highest priority)
-    if _has_buddhism_switch(user_text):
+    if f(_has_buddhism_switch):
         return {
             "explain_mode": True,
             "philosophy_pipeline": True,
@@ -298,8 +330,8 @@ def governor_plan(
         }
 
     # Fix Pack D: structure/steps markers → guidance, no triage
-    if _has_structure_steps_marker(user_text):
-        allows_phi = any(k in (user_text or "").lower() for k in ("философ", "рамк", "модель", "оптик"))
+    if f(_has_structure_steps_marker):
+        allows_phi = km.has(_STRUCTURE_PHILOSOPHY, user_text)
         return {
             "stage_override": "guidance",
             "answer_first_required": True,
@@ -313,7 +345,7 @@ def governor_plan(
         }
 
     # Fix Pack D: religious markers → philosophy_pipeline, disable warmup
-    if _has_religious_marker(user_text):
+    if f(_has_religious_marker):
         return {
             "philosophy_pipeline": True,
             "allow_philosophy_examples": True,
@@ -325,7 +357,7 @@ def governor_plan(
         }
 
     # FIX C: pragmatic triggers — disable pattern_engine
-    if _has_pragmatic_trigger(user_text):
+    if f(_has_pragmatic_trigger):
         return {
             "disable_pattern_engine": True,
             "disable_option_close": True,
@@ -336,7 +368,7 @@ def governor_plan(
         }
 
     # FIX D: action + state topic → answer-first, no triage
-    if _is_action_state_request(user_text):
+    if f(_is_action_state_request):
         return {
             "stage_override": "guidance",
             "answer_first_required": True,
@@ -346,7 +378,7 @@ def governor_plan(
         }
 
     # FIX D: philosophy chat request
-    if _is_philosophy_chat_request(user_text):
+    if f(_is_philosophy_chat_request):
         return {
             "stage_override": "guidance",
             "philosophy_pipeline": True,
@@ -356,7 +388,7 @@ def governor_plan(
         }
 
     # Answer-first must override warmup & patterns — ПЕРВОЕ правило, до warmup/uncertainty
-    if is_full_question(user_text):
+    if f(is_full_question):
         plan = {}
         plan["stage_override"] = "guidance"
         plan["answer_first_required"] = True
@@ -381,7 +413,7 @@ def governor_plan(
         return plan
 
     # PATCH 5 + Fix Pack B: explain_mode — запросы на разъяснение (до warmup)
-    if is_expand_request(user_text):
+    if f(is_expand_request):
         plan = {}
         plan["explain_mode"] = True
         plan["stage_override"] = "guidance"
@@ -396,8 +428,7 @@ def governor_plan(
         return plan
 
     # Fix Pack B: раздражение на короткие → disable pattern, no short mode
-    t_lower = (user_text or "").strip().lower()
-    if any(tr in t_lower for tr in IRRITATION_SHORT_TRIGGERS):
+    if km.has(_IRRITATION_SHORT, user_text):
         return {
             "disable_pattern_engine": True,
             "disable_option_close": True,
@@ -408,7 +439,7 @@ def governor_plan(
         }
 
     # Hotfix-A: direct philosophy — обход triage/orientation
-    if is_direct_philosophy_intent(user_text):
+    if f(is_direct_philosophy_intent):
         plan = {
             "force_philosophy_mode": True,
             "disable_warmup": True,
@@ -433,7 +464,7 @@ def governor_plan(
             "force_repeat_options": False,
             "stage_override": "guidance",
         }
-    if detect_financial_pattern(user_text):
+    if f(detect_financial_pattern):
         return {
             "add_bridge": False,
             "disable_pattern_engine": True,
@@ -455,11 +486,11 @@ def governor_plan(
         "force_repeat_options": False,
     }
 
-    if is_short_ambiguous(user_text) and state.get("last_options"):
+    if f(is_short_ambiguous) and state.get("last_options"):
         plan["force_repeat_options"] = True
 
     # v17.2 Philosophy Pipeline Priority: is_philosophy_intent (broader) до pattern_engine
-    if _is_philosophy_intent(user_text) or _is_philosophy_question(user_text):
+    if f(_is_philosophy_intent) or f(_is_philosophy_question):
         plan["philosophy_pipeline"] = True
         plan["force_philosophy_mode"] = True
         plan["disable_pattern_engine"] = True
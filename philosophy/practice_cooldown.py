@@ -8,6 +8,7 @@ PRACTICE_PATTERNS = (
     r"Отметь один пункт[^.]*\.",   # "Отметь один пункт, где действие возможно сегодня."
     r"Микро-практика[^.]*\.",
 )
+PRACTICE_RE = re.compile("|".join(PRACTICE_PATTERNS), re.IGNORECASE)
 # Целые строки с практикой (построчно)
 PRACTICE_LINE_PREFIXES = (
     "попробуй выписать",
@@ -26,7 +27,7 @@ def strip_practice_content(text: str) -> str:
         ln_lower = ln.lower().strip()
         if any(ln_lower.startswith(prefix) for prefix in PRACTICE_LINE_PREFIXES):
             continue
-        if any(re.search(pat, ln, re.I) for pat in PRACTICE_PATTERNS):
+        if PRACTICE_RE.search(ln):
             continue
         result.append(ln)
     return "\n".join(result).strip()
@@ -67,6 +67,10 @@ def apply_style_rewrite(text: str) -> str:
     return out
 
 
+# Маркеры быстрого пути: без них META_TAIL_RE / построчный фильтр ничего не удалят
+_META_TAIL_RE_MARKERS = ("если хочешь", "давай продолжим", "продолжим с")
+_LINE_BAN_MARKERS = BAN_PHRASES + BAN_DIRECTIVE_PHRASES + NO_DEV_LEXICON
+
 # v19: debug tags — вычищать перед отправкой
 DEBUG_TAG_PATTERN = re.compile(
     r"\[(?:pattern|mode|stage|lens):\s*[^\]]*\]",
@@ -74,9 +78,13 @@ DEBUG_TAG_PATTERN = re.compile(
 )
 
 
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+_SENT_ELLIPSIS_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
 def _split_sentences(text: str) -> list:
     """Разбить на предложения по . ! ?"""
-    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
+    return [s.strip() for s in _SENT_SPLIT_RE.split(text) if s.strip()]
 
 
 def apply_style_guards(text: str, ban_empathy_openers: bool = False, answer_first: bool = False) -> str:
@@ -85,8 +93,12 @@ def apply_style_guards(text: str, ban_empathy_openers: bool = False, answer_firs
     if not text or not text.strip():
         return text
     original = text
-    text = META_TAIL_RE.sub("", text)
-    text = DEBUG_TAG_PATTERN.sub("", text).strip()
+    low = text.lower()
+    if any(m in low for m in _META_TAIL_RE_MARKERS):
+        text = META_TAIL_RE.sub("", text)
+    if "[" in text:
+        text = DEBUG_TAG_PATTERN.sub("", text)
+    text = text.strip()
     # v21: meta tail sentence filter — удалить предложения с навигацией
     if answer_first:
         sentences = _split_sentences(text)
@@ -98,9 +110,12 @@ def apply_style_guards(text: str, ban_empathy_openers: bool = False, answer_firs
             if any(first_lower.startswith(p) for p in EMPATHY_OPENER_STARTS_ANSWER_FIRST):
                 sentences = sentences[1:]
                 text = " ".join(sentences).strip()
+    opener_list = EMPATHY_OPENER_STARTS_ANSWER_FIRST if answer_first else EMPATHY_OPENER_STARTS
+    low = text.lower()
+    if not any(m in low for m in _LINE_BAN_MARKERS) and not (ban_empathy_openers and any(p in low for p in opener_list)):
+        return text  # построчному фильтру нечего удалять
     lines = text.split("\n")
     result = []
-    opener_list = EMPATHY_OPENER_STARTS_ANSWER_FIRST if answer_first else EMPATHY_OPENER_STARTS
     for ln in lines:
         ln_lower = ln.lower().strip()
         if ban_empathy_openers and any(ln_lower.startswith(p) for p in opener_list):
@@ -136,6 +151,23 @@ META_TAIL_PATTERNS = [
 ]
 
 
+# все META_TAIL_PATTERNS одной альтернацией: каждый режет хвост от совпадения до конца, итог — от самого
+# раннего совпадения любого шаблона, как и при последовательных re.sub
+META_TAIL_PATTERNS_RE = re.compile(
+    "|".join(f"(?:{p})" for p in META_TAIL_PATTERNS),
+    re.IGNORECASE | re.DOTALL,
+)
+_MULTI_NEWLINE_RE = re.compile(r"\n{3,}")
+_EXTRA_LEAD_RE = re.compile(r"^(и\s+)?(еще|ещё)\s+", re.IGNORECASE)
+_SPACE_BEFORE_DOT_RE = re.compile(r"\s+\.")
+
+# каждый шаблон META_TAIL_PATTERNS содержит один из маркеров
+_META_TAIL_PATTERN_MARKERS = (
+    "если хоч", "если хот", "продолж", "разобрать глубже", "упростить", "рамку или практику",
+    "выберем направление", "чтобы не давать пустых советов", "важно понять",
+)
+
+
 def strip_meta_tail(text: str) -> str:
     """Удаляет мета-хвосты в последних 500 символах."""
     s = (text or "").strip()
@@ -145,11 +177,13 @@ def strip_meta_tail(text: str) -> str:
     head = s[:-500] if len(s) > 500 else ""
     tail = s[-500:] if len(s) > 500 else s
 
-    for pat in META_TAIL_PATTERNS:
-        tail = re.sub(pat, "", tail, flags=re.IGNORECASE | re.DOTALL).strip()
+    low = s.lower()
+    if any(m in low for m in _META_TAIL_PATTERN_MARKERS):
+        tail = META_TAIL_PATTERNS_RE.sub("", tail)
+    tail = tail.strip()
 
     out = (head + tail).strip()
-    out = re.sub(r"\n{3,}", "\n\n", out).strip()
+    out = _MULTI_NEWLINE_RE.sub("\n\n", out).strip()
     return out
 
 
@@ -158,7 +192,7 @@ def _split_sentences_for_clamp(text: str) -> list:
     s = (text or "").strip()
     if not s:
         return []
-    parts = re.split(r"(?<=[.!?…])\s+", s)
+    parts = _SENT_ELLIPSIS_SPLIT_RE.split(s)
     return [p.strip() for p in parts if p.strip()]
 
 
@@ -184,13 +218,13 @@ def clamp_questions(text: str, max_questions: int = 1) -> str:
                 questions_kept += 1
             else:
                 replaced = sent.replace("?", "").strip()
-                replaced = re.sub(r"^(и\s+)?(еще|ещё)\s+", "", replaced, flags=re.IGNORECASE).strip()
+                replaced = _EXTRA_LEAD_RE.sub("", replaced).strip()
                 if replaced:
                     kept.append(replaced + ".")
         else:
             kept.append(sent)
 
     out = " ".join(kept).strip()
-    out = re.sub(r"\s+\.", ".", out)
-    out = re.sub(r"\n{3,}", "\n\n", out).strip()
+    out = _SPACE_BEFORE_DOT_RE.sub(".", out)
+    out = _MULTI_NEWLINE_RE.sub("\n\n", out).strip()
     return out
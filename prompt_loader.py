@@ -1,28 +1,114 @@
-"""Загрузка промптов и линз из файлов."""
+"""Загрузка промптов и линз из файлов.
 
+Файлы читаются один раз и отдаются из памяти (ResourceCache); изменение файла
+(mtime/size) подхватывается без рестарта — проверка не чаще PHI_PROMPT_RELOAD_SEC.
+Хэши содержимого — для /health и для «соли» кэшей, зависящих от промптов.
+"""
+
+import hashlib
 import logging
+import os
+import threading
+import time
 from pathlib import Path
+from typing import Optional
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 PROMPTS_DIR = PROJECT_ROOT / "prompts"
 LENSES_DIR = PROJECT_ROOT / "lenses"
+RELOAD_CHECK_SEC = float(os.getenv("PHI_PROMPT_RELOAD_SEC", "2"))
 _logger = logging.getLogger("phi.telemetry")
 
 
+def _digest(text: str) -> str:
+    if not text:
+        return "none"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+class ResourceCache:
+    """Кэш текстовых файлов и списков файлов каталога с перечитыванием по mtime."""
+
+    def __init__(self, check_interval: float = RELOAD_CHECK_SEC):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # path -> [signature, text, digest, checked_at]
+        self._files: dict[Path, list] = {}
+        # (dir, pattern) -> [dir_mtime_ns, paths, checked_at]
+        self._globs: dict[tuple[Path, str], list] = {}
+        self._stats = {"hits": 0, "loads": 0, "reloads": 0}
+
+    @staticmethod
+    def _signature(path: Path) -> Optional[tuple[int, int]]:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, path: Path) -> tuple[str, str]:
+        """(содержимое без крайних пробелов, хэш). Нет файла — ("", "none")."""
+        path = Path(path)
+        now = time.monotonic()
+        item = self._files.get(path)
+        if item is not None and now - item[3] < self.check_interval:
+            self._stats["hits"] += 1
+            return item[1], item[2]
+        sig = self._signature(path)
+        with self._lock:
+            item = self._files.get(path)
+            if item is not None and item[0] == sig:
+                item[3] = now
+                self._stats["hits"] += 1
+                return item[1], item[2]
+            text = ""
+            if sig is not None:
+                try:
+                    text = path.read_text(encoding="utf-8").strip()
+                except OSError:
+                    sig = None
+            self._stats["reloads" if item is not None else "loads"] += 1
+            self._files[path] = [sig, text, _digest(text), now]
+            return text, self._files[path][2]
+
+    def glob(self, directory: Path, pattern: str) -> list[Path]:
+        """Отсортированный список файлов; пересканируется при изменении mtime каталога."""
+        key = (Path(directory), pattern)
+        now = time.monotonic()
+        item = self._globs.get(key)
+        if item is not None and now - item[2] < self.check_interval:
+            return item[1]
+        try:
+            mtime = key[0].stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            item = self._globs.get(key)
+            if item is not None and item[0] == mtime:
+                item[2] = now
+                return item[1]
+            paths = sorted(key[0].glob(pattern)) if mtime is not None else []
+            self._globs[key] = [mtime, paths, now]
+            return paths
+
+    def stats(self) -> dict:
+        return dict(self._stats, files=len(self._files))
+
+
+_CACHE = ResourceCache()
+
+
 def load_file(path: Path) -> str:
-    """Загружает содержимое файла."""
-    if not path.exists():
-        return ""
-    return path.read_text(encoding="utf-8").strip()
+    """Загружает содержимое файла (из кэша, перечитывается при изменении)."""
+    return _CACHE.get(path)[0]
 
 
 def load_system_prompt() -> str:
     """Загружает system_prompt_ru.md."""
-    path = PROMPTS_DIR / "system_prompt_ru.md"
-    if not path.exists():
+    text = load_file(PROMPTS_DIR / "system_prompt_ru.md")
+    if not text:
         _logger.error("PROMPT_LOAD_FAIL system_prompt_ru.md")
-        return ""
-    return load_file(path)
+    return text
 
 
 def load_router_rules() -> str:
@@ -44,19 +130,46 @@ def load_all_lenses() -> dict[str, str]:
     """Загружает все markdown-файлы из папки lenses.
 
     Returns:
-        dict: имя файла (без расширения) -> содержимое
+        dict: имя файла (без расширения) -> содержимое (новый dict, содержимое — из кэша)
     """
     result = {}
-    if not LENSES_DIR.exists():
-        return result
-    for path in sorted(LENSES_DIR.glob("*.md")):
+    for path in _CACHE.glob(LENSES_DIR, "*.md"):
         content = load_file(path)
-        if not content or not content.strip():
+        if not content:
             _logger.error(f"LENS_EMPTY {path.stem}")
         result[path.stem] = content
     return result
 
 
+def resource_hashes() -> dict:
+    """Хэши промптов и линз (для /health и соли кэшей); "bundle" меняется при любой правке."""
+    prompts = {
+        name: _CACHE.get(PROMPTS_DIR / f"{name}_ru.md")[1]
+        for name in ("system_prompt", "warmup_prompt", "philosophy_style", "router_rules")
+    }
+    lenses = {p.stem: _CACHE.get(p)[1] for p in _CACHE.glob(LENSES_DIR, "*.md")}
+    bundle = _digest("|".join(f"{k}={v}" for k, v in sorted({**prompts, **lenses}.items())))
+    return {"bundle": bundle, "prompts": prompts, "lenses": lenses}
+
+
+_bundle: list = [None, 0.0]  # [hash, monotonic время вычисления]
+
+
+def prompt_bundle_hash() -> str:
+    """Короткий хэш всех промптов и линз — соль для кэшей, зависящих от их содержимого.
+
+    Пересчитывается не чаще интервала проверки файлов (раньше правка всё равно не видна).
+    """
+    now = time.monotonic()
+    if _bundle[0] is None or now - _bundle[1] >= _CACHE.check_interval:
+        _bundle[0], _bundle[1] = resource_hashes()["bundle"], now
+    return _bundle[0]
+
+
+def resource_cache_stats() -> dict:
+    return _CACHE.stats()
+
+
 def build_system_prompt(main_prompt: str, lens_contents: list[str]) -> str:
     """Формирует итоговый system prompt из основного и линз."""
     parts = [main_prompt]
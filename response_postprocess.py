@@ -6,15 +6,43 @@ import re
 
 _logger = logging.getLogger("phi.telemetry")
 
+# Шаблоны format_readability_ru / ensure_markdown_spacing — компилируются один раз при импорте.
+# Имена и связки — одной альтернацией: вставка "\n\n" только на месте пробелов, поэтому один проход
+# даёт то же, что цикл re.sub по каждому слову.
+PHILOSOPHER_NAMES = (
+    "Кьеркегор", "Сартр", "Камю", "Конфуций", "Сократ", "Платон",
+    "Аристотель", "Кант", "Ницше", "Хайдеггер", "Будда", "Спиноза",
+    "Сенека", "Эпиктет", "Марк Аврелий", "Шопенгауэр", "Юнг", "Фрейд",
+)
+PIVOTS = (
+    "Есть", "Но", "При этом", "Поэтому", "Во-первых",
+    "Во-вторых", "С другой стороны", "Другая", "Важно",
+    "Если", "Когда", "Чтобы", "И ещё", "И еще",
+    "Вместо", "Важнее", "То есть", "Однако",
+)
+
+_MULTI_NEWLINE_RE = re.compile(r"\n{3,}")
+_LABEL_DASH_RE = re.compile(r"(\n)([А-ЯA-ZЁ][^\n]{1,60})\n—\s*")
+_INLINE_SPACES_RE = re.compile(r"[ \t]+")
+_ENUM_PAREN_RE = re.compile(r"(?<!\n)(\b\d\))\s+")
+_ENUM_DOT_RE = re.compile(r"(?<!\n)(\b\d\.)\s+")
+_DASH_BULLET_RE = re.compile(r"(?<!\n)\s+—\s+")
+_BEFORE_PHILOSOPHER_RE = re.compile(
+    r"(?<=[.!?])\s+(?=(?:" + "|".join(map(re.escape, PHILOSOPHER_NAMES)) + r")\s*[:(])"
+)
+_BEFORE_PIVOT_RE = re.compile(r"(?<=[.!?])\s+(?=(?:" + "|".join(map(re.escape, PIVOTS)) + r")\b)")
+_BEFORE_UPPER_RE = re.compile(r"(?<=[.!?])\s+(?=[А-ЯЁ])")
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
 
 def ensure_markdown_spacing(t: str) -> str:
     """PHILOBASE: improve Markdown readability — bullets, headings, collapse excess newlines."""
     if not t:
         return t
     t = t.replace(" • ", "\n- ")
-    t = re.sub(r"\n{3,}", "\n\n", t)
+    t = _MULTI_NEWLINE_RE.sub("\n\n", t)
     # Merge "Label\n— text" into "**Label** — text"
-    t = re.sub(r"(\n)([А-ЯA-ZЁ][^\n]{1,60})\n—\s*", r"\1**\2** — ", t)
+    t = _LABEL_DASH_RE.sub(r"\1**\2** — ", t)
     return t
 
 
@@ -30,44 +58,27 @@ def format_readability_ru(text: str) -> str:
 
     t = text.strip()
     t = t.replace("\r\n", "\n").replace("\r", "\n")
-    t = "\n".join([re.sub(r"[ \t]+", " ", line).strip() for line in t.split("\n")])
+    t = "\n".join([_INLINE_SPACES_RE.sub(" ", line).strip() for line in t.split("\n")])
 
     has_paragraphs = "\n\n" in t
     is_monolith = (not has_paragraphs) and (len(t) >= 650)
 
     # Ensure enumerations each start on a new line
-    t = re.sub(r"(?<!\n)(\b\d\))\s+", r"\n\1 ", t)
-    t = re.sub(r"(?<!\n)(\b\d\.)\s+", r"\n\1 ", t)
+    t = _ENUM_PAREN_RE.sub(r"\n\1 ", t)
+    t = _ENUM_DOT_RE.sub(r"\n\1 ", t)
 
     # Ensure bullet dashes start on new line
-    t = re.sub(r"(?<!\n)\s+—\s+", r"\n— ", t)
+    t = _DASH_BULLET_RE.sub("\n— ", t)
 
     # Always: new paragraph before philosopher names (Кьеркегор, Сартр, Камю, ...)
-    philosopher_names = [
-        "Кьеркегор", "Сартр", "Камю", "Конфуций", "Сократ", "Платон",
-        "Аристотель", "Кант", "Ницше", "Хайдеггер", "Будда", "Спиноза",
-        "Сенека", "Эпиктет", "Марк Аврелий", "Шопенгауэр", "Юнг", "Фрейд",
-    ]
-    for name in philosopher_names:
-        t = re.sub(rf"(?<=[.!?])\s+(?={re.escape(name)}\s*[:(])", "\n\n", t)
+    t = _BEFORE_PHILOSOPHER_RE.sub("\n\n", t)
 
     if is_monolith:
-        pivots = [
-            "Есть", "Но", "При этом", "Поэтому", "Во-первых",
-            "Во-вторых", "С другой стороны", "Другая", "Важно",
-            "Если", "Когда", "Чтобы", "И ещё", "И еще",
-            "Вместо", "Важнее", "То есть", "Однако", "При этом",
-        ]
-        for p in pivots:
-            t = re.sub(rf"(?<=[.!?])\s+(?={re.escape(p)}\b)", "\n\n", t)
-
+        t = _BEFORE_PIVOT_RE.sub("\n\n", t)
         # Break after sentence when next starts with uppercase (Russian)
-        def _break_long(m):
-            return "\n\n" if len(t) > 900 else " "
-
-        t = re.sub(r"(?<=[.!?])\s+(?=[А-ЯЁ])", _break_long, t, count=3)
+        t = _BEFORE_UPPER_RE.sub("\n\n" if len(t) > 900 else " ", t, count=3)
 
-    t = re.sub(r"\n{3,}", "\n\n", t).strip()
+    t = _MULTI_NEWLINE_RE.sub("\n\n", t).strip()
     t = ensure_markdown_spacing(t)
     return t
 
@@ -76,7 +87,7 @@ def _split_to_sentences(text: str) -> list:
     """Разбить текст на предложения (по . ! ?)."""
     if not text or not text.strip():
         return []
-    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
+    return [s.strip() for s in _SENT_SPLIT_RE.split(text) if s.strip()]
 
 
 def _clamp_max_one_question(text: str) -> str:
@@ -142,3 +153,33 @@ def postprocess_response(
 
     _logger.info(f"[telemetry] questions={result.count('?')}")
     return result
+
+
+def finalize_reply(text: str, plan: Optional[dict] = None) -> str:
+    """Fix Pack B + PATCH F + PATCH G: unified postprocess.
+    Порядок: strip_meta_tail → format_reply_md (semantic blocks) → clamp_practice → style_guards
+    → completion_guard → meta_tail_to_fork → clamp_questions → readability."""
+    from philosophy.practice_cooldown import clamp_to_first_practice_only
+    from philosophy.style_guards import apply_style_guards, clamp_questions, strip_meta_tail
+    from semantic_blocks import format_reply_md
+    from utils.final_send_clamp import completion_guard, meta_tail_to_fork_or_close
+
+    if plan is None:
+        plan = {}
+    out = (text or "").strip()
+    if not out:
+        return out
+    out = strip_meta_tail(out)
+    # PATCH G: semantic blocks Markdown (longform/explain/philosophy only)
+    out, blocks_used = format_reply_md(out, plan)
+    plan["blocks_used"] = blocks_used
+    out = clamp_to_first_practice_only(out)
+    ban_empathy = plan.get("philosophy_pipeline") or plan.get("answer_first_required") or plan.get("explain_mode")
+    out = apply_style_guards(out, ban_empathy_openers=ban_empathy, answer_first=plan.get("answer_first_required", False))
+    out = completion_guard(out, max_questions=plan.get("max_questions", 1))
+    out = meta_tail_to_fork_or_close(out, max_questions=plan.get("max_questions", 1))
+    out = clamp_questions(out, max_questions=plan.get("max_questions", 1))
+    # PATCH F: readability formatter ПОСЛЕДНИМ — clamp_questions использует " ".join() и затирает переносы
+    if not plan.get("disable_readability_formatter"):
+        out = format_readability_ru(out)
+    return out.strip()
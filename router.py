@@ -1,8 +1,9 @@
 """Роутер для выбора линз по ключевым словам."""
 
-import re
 from pathlib import Path
 
+from utils import keyword_matcher as km, lens_router
+
 PROJECT_ROOT = Path(__file__).resolve().parent
 
 # Маппинг: имя линзы -> список ключевых слов (нижний регистр)
@@ -80,17 +81,41 @@ FINANCIAL_PATTERNS = (
 )
 
 
+# Словари — в общем автомате utils.keyword_matcher (скан сообщения один раз на ход)
+_LENS_VOCABS = {
+    name: km.register(f"router.{name}", keywords, view="punct")
+    for name, keywords in LENS_KEYWORDS.items()
+    if keywords
+}
+_FINANCIAL_VOCAB = km.register("router.financial", FINANCIAL_PATTERNS)
+
+
 def detect_financial_pattern(text: str) -> bool:
     """Проверяет финансовый паттерн в тексте."""
-    t = (text or "").lower()
-    return any(p in t for p in FINANCIAL_PATTERNS)
+    return km.has(_FINANCIAL_VOCAB, text)
 
 
 def _normalize_text(text: str) -> str:
     """Нормализует текст для поиска: нижний регистр, без лишних символов."""
-    text = text.lower().strip()
-    text = re.sub(r"[^\w\s\-]", " ", text)
-    return text
+    return km.scan_message(text).view("punct")
+
+
+def _keyword_scores(user_text: str, lenses) -> dict[str, int]:
+    """Сколько ключевых слов каждой линзы в тексте (только линзы из lenses, ненулевые)."""
+    # ключевое слово в нормализованном тексте (_normalize_text) — view "punct" автомата
+    match = km.scan_message(user_text)
+    scores = {}
+    for lens_name, vocab in _LENS_VOCABS.items():
+        if lens_name not in lenses:
+            continue
+        score = match.count(vocab)
+        if score > 0:
+            scores[lens_name] = score
+    return scores
+
+
+def _keyword_lenses(text: str) -> list[str]:
+    return list(_keyword_scores(text, _LENS_VOCABS))
 
 
 def select_lenses(
@@ -98,7 +123,7 @@ def select_lenses(
     available_lenses: dict[str, str],
     max_lenses: int = 3,
 ) -> list[str]:
-    """Выбирает 2–3 линзы по ключевым словам.
+    """Выбирает 2–3 линзы по ключевым словам (+ TF-IDF, если PHI_LENS_ROUTER=tfidf).
 
     Args:
         user_text: Текст запроса пользователя
@@ -108,21 +133,15 @@ def select_lenses(
     Returns:
         Список имён выбранных линз
     """
-    normalized = _normalize_text(user_text)
-    words = set(normalized.split())
+    scores: dict[str, float] = _keyword_scores(user_text, available_lenses)
 
-    scores: list[tuple[str, int]] = []
-    for lens_name, keywords in LENS_KEYWORDS.items():
-        if lens_name not in available_lenses:
-            continue
-        if lens_name == "lens_general":
-            continue  # используем только как fallback
-        score = sum(1 for kw in keywords if kw in normalized or kw in words)
-        if score > 0:
-            scores.append((lens_name, score))
+    if lens_router.get_index(available_lenses, LENS_KEYWORDS, _keyword_lenses) is not None:
+        for lens_name, sim in lens_router.similarities(user_text).items():
+            if sim >= lens_router.MIN_SIM and lens_name in available_lenses:
+                scores[lens_name] = scores.get(lens_name, 0) + lens_router.TFIDF_WEIGHT * sim
 
-    scores.sort(key=lambda x: (-x[1], x[0]))
-    selected = [name for name, _ in scores[:max_lenses]]
+    ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+    selected = [name for name, _ in ranked[:max_lenses]]
 
     if not selected:
         selected = ["lens_general"]
@@ -1,6 +1,22 @@
-"""Safety-фильтр: проверка на признаки самоповреждения/суицида."""
+"""Safety-фильтр: проверка на признаки самоповреждения/суицида.
 
+Два слоя, каждый — одно скомпилированное выражение на весь список:
+  1) RISK_PATTERNS — ручные regex по нормализованному тексту (нижний регистр, ё→е);
+  2) RISK_PHRASES — фразы в словарной форме, сравниваются по основам слов (utils.ru_stem):
+     «покончила с собой», «перережу вены», «не хочу больше жить» — без перечисления форм;
+     возвратность значима («повешусь» ≠ «повешу»).
+     «…» во фразе — до RISK_PHRASE_GAP любых слов между соседними.
+Окно истории (PHI_SAFETY_WINDOW, последние реплики пользователя): фраза, разорванная между
+сообщениями («не хочу» / «жить»), засчитывается, если совпадение заходит в текущее сообщение.
+
+Замер и проверка полноты: python scripts/bench_safety.py --check (корпус tests/safety_corpus.json)
+"""
+
+import os
 import re
+from typing import Optional
+
+from utils.ru_stem import stem_words
 
 # Слова/фразы, указывающие на риск (расширяемый список)
 RISK_PATTERNS = [
@@ -21,6 +37,28 @@ RISK_PATTERNS = [
     r"\bпорезы\b.*\bсам\b",
 ]
 
+# Фразы по основам: любая словоформа каждого слова (чередования основы — отдельной строкой)
+RISK_PHRASES = [
+    "убить себя", "убивать себя", "убью себя", "убьёт себя",
+    "покончить с собой", "покончить собой", "покончить с жизнью",
+    "самоубийца", "суицидальный", "суицидник",
+    "повеситься", "повешусь", "вздёрнуться",
+    "перерезать вены", "перережу вены", "вскрыть вены", "вскрыла вены", "вскрою вены", "резать вены", "режу вены",
+    "порезать себя", "порежу себя", "резать себя", "режу себя",
+    "навредить себе", "наврежу себе", "причинить себе вред", "причиняю себе вред", "причинить себе боль",
+    "кончить жизнь", "кончить с жизнью", "уйти из жизни", "уйду из жизни",
+    "свести счёты с жизнью", "сведу счёты с жизнью",
+    "не хочу … жить", "не хочется … жить", "не хотеть … жить", "жить не хочу", "жить не хочется",
+    "незачем жить", "нет смысла жить", "не вижу смысла жить",
+    "лучше умереть", "лучше бы я умер", "лучше бы я умерла", "хочу умереть", "хочется умереть",
+    "хочу сдохнуть", "хочется сдохнуть", "хочу исчезнуть навсегда",
+    "выброситься", "выброшусь", "прыгнуть с крыши", "спрыгнуть с крыши", "спрыгну с крыши",
+    "шагнуть из окна", "шагну из окна", "выйти в окно", "выйду в окно",
+    "хочу отравиться", "наглотаться таблеток", "выпить все таблетки", "выпью все таблетки",
+]
+RISK_PHRASE_GAP = 1
+SAFETY_WINDOW = int(os.environ.get("PHI_SAFETY_WINDOW", "2"))  # реплик пользователя до текущей; 0 — выкл.
+
 # Soft bridge: мягкий контакт, без резких "срочно звоните"
 SAFE_RESPONSE_BRIDGE = (
     "Похоже, тебе сейчас очень тяжело, и такие мысли могут сильно изматывать.\n\n"
@@ -34,21 +72,115 @@ SAFE_RESPONSE_REFERRAL = (
     "💬 fpond.ru"
 )
 
+_RISK_RE = re.compile("|".join(f"(?:{p.replace('ё', 'е')})" for p in RISK_PATTERNS), re.IGNORECASE)
+
+
+_GAP = None  # «…» во фразе
+
+
+def _phrase_stems(phrase: str) -> tuple:
+    return tuple(_GAP if w == "…" else stem_words(w, keep_reflexive=True)[0] for w in phrase.split())
+
+
+# Индекс фраз по основе первого слова: на сообщение — проход по словам и сравнение продолжений
+_PHRASES = [_phrase_stems(p) for p in RISK_PHRASES]
+_BY_FIRST: dict = {}
+for _i, _stems in enumerate(_PHRASES):
+    _BY_FIRST.setdefault(_stems[0], []).append((_i, _stems[1:]))
+_MAX_PHRASE_WORDS = max(len(p) for p in _PHRASES) * (RISK_PHRASE_GAP + 1)
+_WINDOW_TAIL_CHARS = 200  # из прошлых реплик нужен только хвост: фраза не длиннее нескольких слов
+
+
+def _match_rest(stems: list, j: int, rest: tuple) -> int:
+    """Конец совпадения продолжения фразы с позиции j или -1."""
+    if not rest:
+        return j
+    w = rest[0]
+    if w is _GAP:
+        for k in range(RISK_PHRASE_GAP + 1):
+            end = _match_rest(stems, j + k, rest[1:])
+            if end >= 0:
+                return end
+        return -1
+    if j < len(stems) and stems[j] == w:
+        return _match_rest(stems, j + 1, rest[1:])
+    return -1
+
+
+def _find_phrase(stems: list, min_end: int = 0) -> Optional[int]:
+    """Индекс первой найденной фразы RISK_PHRASES (совпадение кончается после min_end слов)."""
+    for i in range(len(stems)):
+        for idx, rest in _BY_FIRST.get(stems[i], ()):
+            if _match_rest(stems, i + 1, rest) > min_end:
+                return idx
+    return None
 
-def check_safety(text: str) -> bool:
+
+_STATS = {"checked": 0, "flagged": 0, "regex": 0, "stems": 0, "window": 0}
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+def scan_safety(text: str, recent: Optional[list] = None) -> Optional[str]:
+    """Что сработало: "regex:<шаблон>" / "stems:<фраза>" / "window:<фраза>" или None.
+
+    recent — предыдущие реплики пользователя (старые → новые), см. recent_user_texts.
+    """
+    if not text or not text.strip():
+        return None
+    _STATS["checked"] += 1
+    hit = None
+    m = _RISK_RE.search(_normalize(text))
+    if m:
+        hit, layer = f"regex:{m.group(0)}", "regex"
+    else:
+        stems = stem_words(text, keep_reflexive=True)
+        idx = _find_phrase(stems)
+        if idx is not None:
+            hit, layer = f"stems:{RISK_PHRASES[idx]}", "stems"
+        elif recent:
+            # Фраза на стыке сообщений: совпадение должно заканчиваться в текущем
+            tail = " ".join(recent[-SAFETY_WINDOW:])
+            if len(tail) > _WINDOW_TAIL_CHARS:
+                tail = tail[-_WINDOW_TAIL_CHARS:].split(" ", 1)[-1]  # без обрезанного слова
+            prev = stem_words(tail, keep_reflexive=True)[-_MAX_PHRASE_WORDS:]
+            if prev:
+                idx = _find_phrase(prev + stems, min_end=len(prev))
+                if idx is not None:
+                    hit, layer = f"window:{RISK_PHRASES[idx]}", "window"
+    if hit:
+        _STATS["flagged"] += 1
+        _STATS[layer] += 1
+    return hit
+
+
+def check_safety(text: str, recent: Optional[list] = None) -> bool:
     """Проверяет текст на признаки самоповреждения/суицида.
 
     Returns:
         True если обнаружены рискованные признаки (нужно блокировать),
         False если текст безопасен.
     """
-    if not text or not text.strip():
-        return False
-    normalized = text.lower().strip()
-    for pattern in RISK_PATTERNS:
-        if re.search(pattern, normalized, re.IGNORECASE):
-            return True
-    return False
+    return scan_safety(text, recent) is not None
+
+
+def recent_user_texts(history: list, window: int = SAFETY_WINDOW) -> list:
+    """Последние window реплик пользователя из истории (для окна safety)."""
+    if window <= 0 or not history:
+        return []
+    texts = []
+    for h in reversed(history):
+        if h.get("role") == "user":
+            texts.append(h.get("content") or "")
+            if len(texts) >= window:
+                break
+    return texts[::-1]
+
+
+def safety_stats() -> dict:
+    return dict(_STATS, window_size=SAFETY_WINDOW)
 
 
 def get_safe_response() -> str:
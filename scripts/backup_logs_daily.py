@@ -1,100 +1,214 @@
 #!/usr/bin/env python3
-"""Ежедневное сохранение логов с датой в имени файла.
+"""Ежедневное инкрементальное сохранение логов в сжатые дневные сегменты.
+
+Выгружаются только новые записи с прошлого запуска:
+- локальные сегменты logs/segments/dialogs/ — по несжатому offset каждого сегмента (watermark);
+- Railway /export — по курсору последней выгруженной записи (ts, id).
+Результат: exports/dialogs_YYYY-MM-DD.jsonl.gz (повторный запуск в тот же день дописывает gzip-member).
+Watermark'и: exports/.backup_state.json.
 
 Запуск вручную: python scripts/backup_logs_daily.py
+Компактизация:  python scripts/backup_logs_daily.py compact   (дневные сегменты прошлых месяцев → dialogs_YYYY-MM.jsonl.gz)
 Cron (ежедневно в 9:00): 0 9 * * * cd /path/to/Phi_Bot && python scripts/backup_logs_daily.py
 """
+import argparse
+import gzip
+import hashlib
 import json
 import os
+import re
 import sys
 from datetime import date
 from pathlib import Path
+from typing import Optional
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 from dotenv import load_dotenv
 load_dotenv(PROJECT_ROOT / ".env")
+from utils.log_segments import iter_records, list_segments, read_index, stem_of
 
 EXPORT_URL = os.getenv("EXPORT_URL", "").strip()
 EXPORT_TOKEN = os.getenv("EXPORT_TOKEN", "").strip()
 OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", str(PROJECT_ROOT / "exports")))
-LOGS_DIR = PROJECT_ROOT / "logs"
+SEGMENTS_DIR = PROJECT_ROOT / "logs" / "segments"
+STATE_FILE = OUTPUT_DIR / ".backup_state.json"
+DAILY_RE = re.compile(r"^dialogs_(\d{4}-\d{2})-\d{2}\.jsonl\.gz$")
+
+
+def load_watermarks() -> dict:
+    """{"files": {segment_stem: {"offset"}}, "railway_cursor": str|None}"""
+    try:
+        with open(STATE_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+        data.setdefault("files", {})
+        data.setdefault("railway_cursor", None)
+        return data
+    except (OSError, json.JSONDecodeError):
+        return {"files": {}, "railway_cursor": None}
+
+
+def save_watermarks(state: dict) -> None:
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=0)
+    os.replace(tmp, STATE_FILE)
 
 
-def fetch_from_railway() -> list[dict]:
-    """Выгрузка диалогов с Railway API."""
+def fetch_from_railway(cursor: Optional[str]) -> tuple[list[dict], Optional[str]]:
+    """Новые диалоги с Railway после cursor (NDJSON-стрим). Возвращает (записи, новый cursor)."""
     if not EXPORT_URL or not EXPORT_TOKEN:
-        return []
+        return [], cursor
     try:
         import requests
     except ImportError:
-        return []
-    url = f"{EXPORT_URL.rstrip('/')}?token={EXPORT_TOKEN}"
+        return [], cursor
+    params = {"token": EXPORT_TOKEN, "format": "ndjson", "gzip": "1"}
+    if cursor:
+        params["cursor"] = cursor
+    records = []
+    last = cursor
     try:
-        r = requests.get(url, timeout=30)
+        r = requests.get(EXPORT_URL.rstrip("/"), params=params, timeout=(10, 300), stream=True)
         r.raise_for_status()
-        data = r.json()
-        if "error" in data:
-            return []
-        return data.get("dialogs", [])
+        for line in r.iter_lines():
+            if not line:
+                continue
+            d = json.loads(line)
+            if "_meta" in d:
+                continue
+            last = d.pop("cursor", None) or last
+            records.append(d)
     except Exception:
-        return []
+        return [], cursor
+    return records, last
+
 
+def collect_local_logs(watermarks: dict) -> list[dict]:
+    """Новые записи из сегментов logs/segments/dialogs/ после сохранённых offset'ов (обновляет watermarks).
 
-def collect_local_logs() -> list[dict]:
-    """Сбор диалогов из локальных logs/users/*/dialogs.jsonl и logs/dialogs.jsonl."""
+    Offset — в несжатых байтах, поэтому запечатывание (сжатие) сегмента между запусками его не сбивает.
+    """
     records = []
-    for path in LOGS_DIR.rglob("dialogs.jsonl"):
+    seen = set()
+    for path in list_segments(SEGMENTS_DIR, "dialogs"):
+        stem = stem_of(path)
+        seen.add(stem)
+        offset = (watermarks.get(stem) or {}).get("offset", 0)
+        idx = read_index(path)
+        if idx is not None:
+            size = idx.get("bytes", 0)
+        else:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+        if size < offset:
+            offset = 0  # сегмент пересоздан/обрезан — читаем заново
+        if size == offset:
+            watermarks[stem] = {"offset": offset}
+            continue
         try:
-            with open(path, encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        records.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        continue
-        except OSError:
+            for end, rec in iter_records(path, offset):
+                records.append(rec)
+                offset = end
+        except (OSError, EOFError):
             continue
+        watermarks[stem] = {"offset": offset}
+    for stem in list(watermarks):
+        if stem not in seen:
+            del watermarks[stem]
     return sorted(records, key=lambda r: r.get("ts", ""))
 
 
-def main():
+def append_segment(path: Path, records: list[dict]) -> None:
+    """Дописать записи в gzip-сегмент (новый gzip-member, читается как один поток)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for d in records:
+            f.write(json.dumps(d, ensure_ascii=False) + "\n")
+
+
+def _record_key(d: dict) -> str:
+    raw = json.dumps([d.get("ts"), d.get("user_id"), d.get("text_in"), d.get("text_out")], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def compact(keep_month: Optional[str] = None) -> None:
+    """Склеить дневные сегменты прошлых месяцев в месячные (сортировка по ts, без дублей)."""
+    keep_month = keep_month or date.today().isoformat()[:7]
+    by_month: dict[str, list[Path]] = {}
+    for p in sorted(OUTPUT_DIR.glob("dialogs_*.jsonl.gz")):
+        m = DAILY_RE.match(p.name)
+        if m and m.group(1) < keep_month:
+            by_month.setdefault(m.group(1), []).append(p)
+    for month, parts in by_month.items():
+        out = OUTPUT_DIR / f"dialogs_{month}.jsonl.gz"
+        records, keys = [], set()
+        for src in ([out] if out.exists() else []) + parts:
+            with gzip.open(src, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    d = json.loads(line)
+                    k = _record_key(d)
+                    if k not in keys:
+                        keys.add(k)
+                        records.append(d)
+        records.sort(key=lambda r: r.get("ts", ""))
+        tmp = out.with_name(out.name + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for d in records:
+                f.write(json.dumps(d, ensure_ascii=False) + "\n")
+        os.replace(tmp, out)
+        for p in parts:
+            p.unlink()
+        print(f"[backup] compact {month}: {len(parts)} сегм. → {out.name} ({len(records)} записей)")
+
+
+def run_incremental() -> None:
     today = date.today().isoformat()
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    state = load_watermarks()
 
     dialogs = []
     source = None
 
     # 1. Пробуем Railway
     if EXPORT_URL and EXPORT_TOKEN:
-        dialogs = fetch_from_railway()
+        dialogs, cursor = fetch_from_railway(state.get("railway_cursor"))
         if dialogs:
             source = "railway"
+            state["railway_cursor"] = cursor
 
     # 2. Если Railway пуст — локальные логи
     if not dialogs:
-        dialogs = collect_local_logs()
+        dialogs = collect_local_logs(state["files"])
         if dialogs:
             source = "local"
 
     if not dialogs:
-        print(f"[backup] Нет данных для сохранения ({today})")
+        save_watermarks(state)
+        print(f"[backup] Нет новых записей ({today})")
         return
 
-    # Сохранение с датой в имени
-    out_json = OUTPUT_DIR / f"dialogs_{today}.json"
-    out_jsonl = OUTPUT_DIR / f"dialogs_{today}.jsonl"
+    out = OUTPUT_DIR / f"dialogs_{today}.jsonl.gz"
+    append_segment(out, dialogs)
+    # watermark сохраняем только после записи сегмента — при сбое записи повторим выгрузку
+    save_watermarks(state)
+    print(f"[backup] Сохранено {len(dialogs)} новых записей → {out.name} ({source or 'unknown'})")
 
-    with open(out_json, "w", encoding="utf-8") as f:
-        json.dump(dialogs, f, ensure_ascii=False, indent=2)
 
-    with open(out_jsonl, "w", encoding="utf-8") as f:
-        for d in dialogs:
-            f.write(json.dumps(d, ensure_ascii=False) + "\n")
-
-    print(f"[backup] Сохранено {len(dialogs)} записей → {out_json.name} ({source or 'unknown'})")
+def main():
+    parser = argparse.ArgumentParser(description="Инкрементальный бэкап диалогов")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "compact"])
+    parser.add_argument("--keep-month", default=None, help="compact: не трогать этот месяц и новее (YYYY-MM)")
+    args = parser.parse_args()
+    if args.command == "compact":
+        compact(args.keep_month)
+    else:
+        run_incremental()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Замер детекторов ключевых слов: построчный поиск по словарям vs общий автомат (utils.keyword_matcher).
+
+legacy    — как раньше: каждый словарь нормализует текст сам и проверяет `p in t` по всем шаблонам
+automaton — один проход автомата на различное представление текста (кэш скана сброшен)
+turn      — детекторы, которые дергает один ход (generate_reply_core + governor_plan), холодный кэш
+features  — тот же ход через MessageFeatures (utils.message_features): повторные предикаты из кэша хода
+
+Запуск: python scripts/bench_detectors.py [--rounds 2000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import intent_capabilities  # noqa: E402  (регистрация словарей при импорте)
+import intent_explain_ru  # noqa: E402
+import intent_philo_graph  # noqa: E402
+import intent_philosophy_topic  # noqa: E402
+import intent_topic_v2  # noqa: E402
+import router  # noqa: E402
+from patterns import pattern_governor  # noqa: E402
+from utils import intent_gate, is_philosophy_question  # noqa: E402
+from utils import keyword_matcher as km  # noqa: E402
+from utils.message_features import MessageFeatures, feature_stats  # noqa: E402
+
+SAMPLES = [
+    "привет",
+    "Мне плохо, ничего не хочу.",
+    "Что такое стоицизм и как стоики смотрят на страх смерти?",
+    "Объясни подробнее, я не понимаю, как это работает на моём случае",
+    "Меня тревожат деньги, хотя доход нормальный — разберём? Деньги уходят, не копится ничего.",
+    "Кто на кого повлиял: Кант, Юм и Ницше? Покажи связи философов.",
+    "Давай без воды: дай модель и шаги, по делу, только конкретика. Добавь философскую рамку.",
+    "Слушай, давай заново обсудим вопрос финансов — у меня постоянная тревога из-за долгов, не могу "
+    "расслабиться и каждое утро просыпаюсь с мыслью, что всё рухнет. Работа есть, но ощущение, что я "
+    "бегу по кругу и не понимаю, зачем всё это. Как быть и что делать дальше? Ответь через буддизм.",
+    "Верю в бога, но стыдно за то, что сомневаюсь. Как разные традиции смотрят на вину и грех?",
+    "ок, спасибо",
+]
+
+
+def legacy_scan(text: str) -> int:
+    """Старый путь: нормализация и `in` по каждому словарю отдельно."""
+    found = 0
+    for vocab in km.vocabs().values():
+        t = km.VIEWS[vocab.view](text)
+        found += sum(1 for p in vocab.patterns if p in t)
+    return found
+
+
+def automaton_scan(text: str) -> int:
+    km.scan_message.cache_clear()
+    match = km.scan_message(text)
+    return sum(match.count(v) for v in km.vocabs().values())
+
+
+def turn_detectors(text: str) -> None:
+    """Детекторы одного хода (с повторами, как в bot.generate_reply_core)."""
+    router.detect_financial_pattern(text)
+    intent_philosophy_topic.detect_philosophy_topic_intent(text)
+    intent_topic_v2.topic_score.__wrapped__(text)
+    intent_philo_graph.is_philo_graph_intent(text)
+    intent_gate.is_philosophy_intent(text)
+    intent_gate.has_religion_in_orientation_context(text)
+    pattern_governor.governor_plan(1, "guidance", text, {}, {"turn_index": 3, "last_bridge_turn": 0})
+    intent_gate.is_ack_close_intent(text)
+    intent_gate.is_unclear_message(text)
+    router.detect_financial_pattern(text)
+    router.select_lenses(text, dict.fromkeys(router.LENS_KEYWORDS, ""), 3)
+    pattern_governor._has_buddhism_switch(text)
+    router.detect_financial_pattern(text)
+
+
+def turn_features(text: str) -> None:
+    """Тот же ход, что turn_detectors, с общим MessageFeatures."""
+    f = MessageFeatures(text)
+    f(router.detect_financial_pattern)
+    f(intent_philosophy_topic.detect_philosophy_topic_intent)
+    f(intent_topic_v2.is_topic_high)
+    f(intent_philo_graph.is_philo_graph_intent)
+    f(intent_gate.has_religion_in_orientation_context)
+    pattern_governor.governor_plan(1, "guidance", text, {}, {"turn_index": 3, "last_bridge_turn": 0}, features=f)
+    f(intent_philo_graph.is_philo_graph_intent)
+    f(router.detect_financial_pattern)
+    f(intent_gate.is_ack_close_intent)
+    f(intent_gate.is_unclear_message)
+    f(router.detect_financial_pattern)
+    router.select_lenses(text, dict.fromkeys(router.LENS_KEYWORDS, ""), 3)
+    f(pattern_governor._has_buddhism_switch)
+    f(router.detect_financial_pattern)
+
+
+def _bench(fn, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for s in SAMPLES:
+            fn(s)
+    return (time.perf_counter() - t0) / (rounds * len(SAMPLES)) * 1e6
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rounds", type=int, default=2000)
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    km.scan_message("прогрев")
+    build_ms = (time.perf_counter() - t0) * 1000
+    for s in SAMPLES:
+        assert legacy_scan(s) == automaton_scan(s), s
+    st = km.stats()
+    print(f"словарей: {st['vocabs']}, шаблонов: {st['patterns']}, состояний: {st['states']}, сборка: {build_ms:.1f} ms")
+    legacy = _bench(legacy_scan, args.rounds)
+    auto = _bench(automaton_scan, args.rounds)
+    print(f"все словари, µs/сообщение:  legacy {legacy:8.1f}   automaton {auto:8.1f}   x{legacy / auto:.1f}")
+
+    def cold_turn(s):
+        km.scan_message.cache_clear()
+        intent_explain_ru.explain_score.cache_clear()
+        intent_topic_v2.topic_score.cache_clear()
+        turn_detectors(s)
+
+    cold = _bench(cold_turn, max(1, args.rounds // 4))
+    warm = _bench(turn_detectors, max(1, args.rounds // 4))
+    print(f"детекторы хода (вместе с regex), µs/ход:  cold {cold:8.1f}   warm (скан из кэша) {warm:8.1f}")
+
+    def cold_features(s):
+        km.scan_message.cache_clear()
+        intent_explain_ru.explain_score.cache_clear()
+        intent_topic_v2.topic_score.cache_clear()
+        turn_features(s)
+
+    before = feature_stats()
+    feats = _bench(cold_features, max(1, args.rounds // 4))
+    st = feature_stats()
+    per_turn = max(1, args.rounds // 4) * len(SAMPLES)
+    print(
+        f"ход через MessageFeatures, µs/ход:  cold {feats:8.1f}   "
+        f"предикатов на ход: {(st['computed'] - before['computed']) / per_turn:.1f} посчитано, "
+        f"{(st['reused'] - before['reused']) / per_turn:.1f} из кэша"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Micro-batching классификации (utils.intent_batcher): число вызовов модели и задержка под нагрузкой.
+
+Модель имитируется: вызов стоит --call-ms + --item-ms на элемент пачки. Сообщения приходят потоком
+--rps (экспоненциальные интервалы), каждое ждёт свой результат. Сравнение: вызов на сообщение vs пачки
+при разных PHI_INTENT_BATCH_WAIT_MS. Плюс сверка needs_topic_llm с governor_plan на tests/cases.json:
+ядро отдаёт на классификацию ровно те сообщения, о которых спросит governor.
+
+Запуск: python scripts/bench_intent_batcher.py [--messages 400] [--rps 50] [--call-ms 300] [--check]
+--check — код возврата 1 при расхождении needs_topic_llm и governor_plan.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from patterns.pattern_governor import governor_plan, needs_topic_llm  # noqa: E402
+from utils.intent_batcher import MicroBatcher  # noqa: E402
+
+CASES_PATH = PROJECT_ROOT / "tests" / "cases.json"
+
+
+async def _simulate(n: int, rps: float, call_ms: float, item_ms: float, max_batch: int, wait_ms: float) -> dict:
+    calls = []
+
+    def fake_model(texts: list) -> list:
+        calls.append(len(texts))
+        time.sleep((call_ms + item_ms * len(texts)) / 1000)
+        return [len(t) % 2 == 0 for t in texts]
+
+    batcher = MicroBatcher(fake_model, max_batch=max_batch, max_wait_ms=wait_ms)
+    rnd = random.Random(7)
+    latencies = []
+
+    async def one(i: int) -> None:
+        t0 = time.perf_counter()
+        await batcher.submit(f"сообщение {i}")
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    tasks = []
+    for i in range(n):
+        tasks.append(asyncio.create_task(one(i)))
+        await asyncio.sleep(rnd.expovariate(rps))
+    await asyncio.gather(*tasks)
+    latencies.sort()
+    return {
+        "calls": len(calls),
+        "avg_batch": sum(calls) / len(calls),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95)],
+    }
+
+
+def _check_prefetch() -> tuple[list[str], int, int]:
+    """needs_topic_llm == «governor_plan вызвал llm_classify_fn». (расхождения, спросили модель, всего)"""
+    mismatches, n_asked = [], 0
+    cases = json.loads(CASES_PATH.read_text(encoding="utf-8"))
+    for c in cases:
+        asked = []
+        governor_plan(0, "guidance", c["input"], {"stage": "guidance"}, {}, llm_classify_fn=lambda t: asked.append(t) or False)
+        n_asked += bool(asked)
+        if bool(asked) != needs_topic_llm(c["input"]):
+            mismatches.append(f"{c['id']}: governor {bool(asked)} needs_topic_llm {not asked} ← {c['input'][:60]}")
+    return mismatches, n_asked, len(cases)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--messages", type=int, default=400)
+    ap.add_argument("--rps", type=float, default=50, help="сообщений topic_mid в секунду")
+    ap.add_argument("--call-ms", type=float, default=300, help="задержка вызова модели")
+    ap.add_argument("--item-ms", type=float, default=5, help="добавка на элемент пачки")
+    ap.add_argument("--max-batch", type=int, default=16)
+    ap.add_argument("--check", action="store_true", help="код 1 при расхождении needs_topic_llm с governor_plan")
+    args = ap.parse_args()
+
+    mismatches, n_asked, n_cases = _check_prefetch()
+    print(f"needs_topic_llm vs governor_plan: расхождений {len(mismatches)} (модель спрошена в {n_asked} из {n_cases})")
+    for m in mismatches:
+        print("  " + m)
+
+    print(f"{args.messages} сообщений, {args.rps:g}/с, вызов {args.call_ms:g} ms + {args.item_ms:g} ms/элемент")
+    for label, max_batch, wait_ms in [("по одному", 1, 0), *((f"пачка ≤{args.max_batch}, {w:g} ms", args.max_batch, w) for w in (2, 5, 20))]:
+        r = asyncio.run(_simulate(args.messages, args.rps, args.call_ms, args.item_ms, max_batch, wait_ms))
+        print(f"  {label:22s} вызовов {r['calls']:4d} (в среднем {r['avg_batch']:4.1f} в пачке)   "
+              f"задержка p50 {r['p50_ms']:6.0f} ms  p95 {r['p95_ms']:6.0f} ms")
+    return 1 if args.check and mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Роутер линз: ключевые слова vs ключевые слова + TF-IDF (utils.lens_router) — ожидания и скорость.
+
+Ожидания — поле "lenses" в tests/cases.json: хотя бы одна из перечисленных линз среди выбранных
+(lens_general ни одну не покрывает). Финансовый режим бота (detect_financial_pattern →
+lens_finance_rhythm) выбирается до select_lenses и здесь не учитывается. Входы cases.json и их
+почти-дубли из eval-сценариев в центроиды не попадают (lens_router.NEAR_DUP_OVERLAP) — счёт отложенный.
+Скорость — µs на сообщение: векторизация + матрица × вектор, без кэша по тексту.
+
+Запуск: python scripts/bench_lens_router.py [--rounds 300] [--check]   (нужен numpy)
+--check — код возврата 1, если TF-IDF теряет случай, который ключевые слова выполняют.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import router  # noqa: E402
+from prompt_loader import load_all_lenses  # noqa: E402
+from utils import lens_router  # noqa: E402
+
+CASES_PATH = PROJECT_ROOT / "tests" / "cases.json"
+
+
+def _select(text: str, lenses: dict, tfidf: bool) -> list[str]:
+    lens_router.LENS_ROUTER = "tfidf" if tfidf else "keywords"
+    return router.select_lenses(text, lenses, max_lenses=3)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rounds", type=int, default=300)
+    ap.add_argument("--check", action="store_true", help="код 1, если ожидания не выполнены")
+    args = ap.parse_args()
+    if lens_router.np is None:
+        print("numpy не установлен — TF-IDF роутер недоступен")
+        return 1
+
+    lenses = load_all_lenses()
+    cases = json.loads(CASES_PATH.read_text(encoding="utf-8"))
+    lens_router.LENS_ROUTER = "tfidf"
+    t0 = time.perf_counter()
+    index = lens_router.get_index(lenses, router.LENS_KEYWORDS, router._keyword_lenses)
+    build_ms = (time.perf_counter() - t0) * 1000
+    print(f"линз: {len(index.names)}, n-грамм: {len(index.vocab)}, сборка: {build_ms:.1f} ms")
+
+    ok = {False: 0, True: 0}
+    lost = []
+    checked = [c for c in cases if c.get("lenses")]
+    for c in checked:
+        row, hits = [], []
+        for tfidf in (False, True):
+            got = _select(c["input"], lenses, tfidf)
+            hit = any(name in c["lenses"] for name in got)
+            ok[tfidf] += hit
+            hits.append(hit)
+            row.append(f"{'+' if hit else '-'} {','.join(n.removeprefix('lens_') for n in got)}")
+        if hits[0] and not hits[1]:
+            lost.append(c["id"])
+        print(f"{c['id']:3s} {row[0]:42s} | {row[1]:50s} ← {c['input'][:50]}")
+    print(f"ожидания (отложенные): keywords {ok[False]}/{len(checked)}   keywords+tfidf {ok[True]}/{len(checked)}")
+    if lost:
+        print(f"TF-IDF теряет: {', '.join(lost)}")
+
+    texts = [c["input"] for c in cases]
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for t in texts:
+            index.similarities(t)
+    sim_us = (time.perf_counter() - t0) / (args.rounds * len(texts)) * 1e6
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        lens_router._similarities.cache_clear()
+        for t in texts:
+            _select(t, lenses, True)
+    sel_us = (time.perf_counter() - t0) / (args.rounds * len(texts)) * 1e6
+    print(f"µs/сообщение: similarities {sim_us:6.1f}   select_lenses (keywords+tfidf) {sel_us:6.1f}")
+    return 1 if args.check and lost else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
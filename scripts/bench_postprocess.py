@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Цепочка постобработки ответа: регресс (вывод не меняется) и CPU на ответ.
+
+Корпус — ответы text_out из exports/dialogs_all.json × варианты (как есть, мета-хвост, обрыв, лишние
+вопросы, empathy-opener + практики, монолит с философами) × планы (обычный, answer-first, explain,
+без readability). Каждый случай проходит хвост generate_reply_core: postprocess_response →
+final_send_clamp → (обрыв: add_closing_sentence + final_send_clamp) → finalize_reply.
+random (пулы закрытий/fork) сидируется номером случая.
+Эталон — tests/postprocess_golden.json (хэш вывода на случай); пересобрать: --write-golden
+(только если вывод меняется намеренно).
+
+Скорость — µs на ответ. --baseline REV — «до»: дерево ревизии (git archive) во временном каталоге,
+в отдельном процессе; там же сверка с эталоном.
+
+Запуск: python scripts/bench_postprocess.py [--rounds 30] [--check] [--write-golden] [--baseline REV]
+--check — код возврата 1, если вывод хоть одного случая отличается от эталона.
+"""
+import argparse
+import hashlib
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_ROOT = Path(__file__).resolve().parent.parent
+# --root DIR: этапы из другого дерева (--baseline); корпус и эталон — всегда из текущего
+PROJECT_ROOT = Path(sys.argv[sys.argv.index("--root") + 1]).resolve() if "--root" in sys.argv else SCRIPT_ROOT
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from philosophy.practice_cooldown import clamp_to_first_practice_only  # noqa: E402
+from philosophy.style_guards import apply_style_guards, clamp_questions, strip_meta_tail  # noqa: E402
+import response_postprocess  # noqa: E402
+from response_postprocess import format_readability_ru  # noqa: E402
+from semantic_blocks import format_reply_md  # noqa: E402
+from utils.final_send_clamp import (  # noqa: E402
+    add_closing_sentence,
+    completion_guard,
+    final_send_clamp,
+    looks_incomplete,
+    meta_tail_to_fork_or_close,
+)
+
+DIALOGS_PATH = SCRIPT_ROOT / "exports" / "dialogs_all.json"
+GOLDEN_PATH = SCRIPT_ROOT / "tests" / "postprocess_golden.json"
+
+VARIANTS = {
+    "raw": lambda x: x,
+    "meta": lambda x: x + "\n\nЕсли хочешь, можем разобрать это глубже. Важно понять, что тебе ближе?",
+    "cut": lambda x: x[: int(len(x) * 0.6)],
+    "questions": lambda x: x + " Почему так? Что ты чувствуешь? И ещё: что дальше?",
+    "opener": lambda x: (
+        "Похоже, тебе сейчас непросто. " + x
+        + "\n\nПопробуй выписать 2 пункта: влияю / не влияю.\n\nМикро-практика: отметь один пункт, где действие возможно."
+    ),
+    "mono": lambda x: " ".join([x.replace("\n", " ")] * 3) + " Сартр: свобода — это выбор. Кант (долг) важнее. Но это не всё.",
+}
+PLANS = {
+    "default": ({}, {"stage": "guidance"}),
+    "answer_first": (
+        {"answer_first_required": True, "philosophy_pipeline": True, "max_questions": 1},
+        {"stage": "guidance", "mode_tag": "financial_rhythm"},
+    ),
+    "explain": ({"explain_mode": True, "max_questions": 0, "min_chars": 900}, {"stage": "guidance"}),
+    "no_fmt": ({"disable_readability_formatter": True, "max_questions": 2}, {"stage": "warmup"}),
+}
+
+
+def build_cases() -> list[tuple[str, str, dict, dict]]:
+    """[(id, текст, plan, kw)] — детерминированно из exports/dialogs_all.json."""
+    dialogs = json.loads(DIALOGS_PATH.read_text(encoding="utf-8"))
+    cases = []
+    for i, d in enumerate(dialogs):
+        x = (d.get("text_out") or "").strip()
+        if not x:
+            continue
+        for vname, variant in VARIANTS.items():
+            for pname, (plan, kw) in PLANS.items():
+                cases.append((f"{i}:{vname}:{pname}", variant(x), plan, kw))
+    return cases
+
+
+def _finalize_by_string(text: str, plan: dict) -> str:
+    """finalize_reply для ревизий, где он жил в bot.py (--baseline)."""
+    out = (text or "").strip()
+    if not out:
+        return out
+    out = strip_meta_tail(out)
+    out, plan["blocks_used"] = format_reply_md(out, plan)
+    out = clamp_to_first_practice_only(out)
+    ban_empathy = plan.get("philosophy_pipeline") or plan.get("answer_first_required") or plan.get("explain_mode")
+    out = apply_style_guards(out, ban_empathy_openers=ban_empathy, answer_first=plan.get("answer_first_required", False))
+    out = completion_guard(out, max_questions=plan.get("max_questions", 1))
+    out = meta_tail_to_fork_or_close(out, max_questions=plan.get("max_questions", 1))
+    out = clamp_questions(out, max_questions=plan.get("max_questions", 1))
+    if not plan.get("disable_readability_formatter"):
+        out = format_readability_ru(out)
+    return out.strip()
+
+
+def run_case(n: int, text: str, plan: dict, kw: dict) -> str:
+    """Хвост generate_reply_core для одного ответа."""
+    random.seed(n)
+    plan = dict(plan)
+    stage = kw["stage"]
+    flags = {
+        "philosophy_pipeline": plan.get("philosophy_pipeline", False),
+        "answer_first_required": plan.get("answer_first_required", False),
+        "explain_mode": plan.get("explain_mode", False),
+    }
+    out = response_postprocess.postprocess_response(text, stage, mode_tag=kw.get("mode_tag"), **flags)
+    clamp_kw = dict(flags, mode_tag=kw.get("mode_tag"), stage=stage)
+    out = final_send_clamp(out, **clamp_kw)
+    if stage == "guidance" and looks_incomplete(out):
+        out = final_send_clamp(add_closing_sentence(out), **clamp_kw)
+    return _finalize(out, plan)
+
+
+_finalize = getattr(response_postprocess, "finalize_reply", _finalize_by_string)
+
+
+def digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _check(cases: list, golden: dict) -> list[str]:
+    return [cid for n, (cid, text, plan, kw) in enumerate(cases) if golden.get(cid) != digest(run_case(n, text, plan, kw))]
+
+
+def _bench(cases: list, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for n, (_, text, plan, kw) in enumerate(cases):
+            run_case(n, text, plan, kw)
+    return (time.perf_counter() - t0) / (rounds * len(cases)) * 1e6
+
+
+def _baseline(rev: str, rounds: int) -> dict:
+    """Цепочка ревизии rev: {"us": µs/ответ, "failed": [...]} из отдельного процесса."""
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = subprocess.run(["git", "archive", rev], cwd=SCRIPT_ROOT, capture_output=True, check=True).stdout
+        subprocess.run(["tar", "-x", "-C", tmp], input=archive, check=True)
+        r = subprocess.run(
+            [sys.executable, __file__, "--root", tmp, "--rounds", str(rounds), "--json"],
+            capture_output=True, text=True, check=True,
+        )
+    return json.loads(r.stdout)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rounds", type=int, default=30)
+    ap.add_argument("--check", action="store_true", help="код 1 при расхождении с эталоном")
+    ap.add_argument("--write-golden", action="store_true", help="записать эталон из текущего вывода")
+    ap.add_argument("--baseline", metavar="REV", help="сравнить скорость с этапами ревизии REV")
+    ap.add_argument("--root", help=argparse.SUPPRESS)
+    ap.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    cases = build_cases()
+    golden = json.loads(GOLDEN_PATH.read_text(encoding="utf-8")) if GOLDEN_PATH.exists() else {}
+    if args.json:
+        print(json.dumps({"us": _bench(cases, args.rounds), "failed": _check(cases, golden)}))
+        return 0
+    if args.write_golden:
+        golden = {cid: digest(run_case(n, text, plan, kw)) for n, (cid, text, plan, kw) in enumerate(cases)}
+        GOLDEN_PATH.write_text(json.dumps(golden, ensure_ascii=False, indent=0, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"эталон: {GOLDEN_PATH} ({len(golden)} случаев)")
+        return 0
+
+    failed = _check(cases, golden)
+    print(f"совпадает с эталоном: {len(cases) - len(failed)}/{len(cases)}")
+    for cid in failed[:10]:
+        print(f"  расхождение: {cid}")
+    per_reply = _bench(cases, args.rounds)
+    print(f"µs/ответ ({len(cases)} случаев): {per_reply:6.1f}")
+    if args.baseline:
+        base = _baseline(args.baseline, args.rounds)
+        failed += base["failed"]
+        print(f"{args.baseline}: {base['us']:6.1f} µs/ответ, совпадает с эталоном: "
+              f"{len(cases) - len(base['failed'])}/{len(cases)}   → разница {per_reply / base['us'] - 1:+.0%}")
+    return 1 if args.check and failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Safety-фильтр: полнота на корпусе и пропускная способность — прежний цикл regex vs safety.scan_safety.
+
+Корпус: tests/safety_corpus.json
+  positive — должны срабатывать (в т.ч. словоформы, которых нет в ручных regex)
+  negative — не должны (бытовые «убить время», «повешу картину», «отравился шаурмой» …)
+  window   — фраза разорвана между сообщениями: recent + text, expect
+Поток: корпус + входы tests/cases.json, µs/сообщение.
+
+Запуск: python scripts/bench_safety.py [--rounds 500] [--check]
+--check — код возврата 1, если safety пропускает positive/window или срабатывает на negative.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import safety  # noqa: E402
+
+CORPUS_PATH = PROJECT_ROOT / "tests" / "safety_corpus.json"
+CASES_PATH = PROJECT_ROOT / "tests" / "cases.json"
+
+
+def legacy_check(text: str) -> bool:
+    """Прежний check_safety: re.search по каждому шаблону."""
+    if not text or not text.strip():
+        return False
+    normalized = text.lower().strip()
+    for pattern in safety.RISK_PATTERNS:
+        if re.search(pattern, normalized, re.IGNORECASE):
+            return True
+    return False
+
+
+def _bench(fn, texts: list, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - t0) / (rounds * len(texts)) * 1e6
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rounds", type=int, default=500)
+    ap.add_argument("--check", action="store_true", help="код 1 при пропусках / ложных срабатываниях")
+    args = ap.parse_args()
+
+    corpus = json.loads(CORPUS_PATH.read_text(encoding="utf-8"))
+    pos, neg, window = corpus["positive"], corpus["negative"], corpus["window"]
+    failures = []
+    for name, fn in (("legacy", legacy_check), ("safety", safety.check_safety)):
+        hit = sum(1 for t in pos if fn(t))
+        false_pos = sum(1 for t in neg if fn(t))
+        print(f"{name:7s} recall {hit}/{len(pos)} ({hit / len(pos):.0%})   ложных {false_pos}/{len(neg)}")
+    for t in pos:
+        if not safety.check_safety(t):
+            failures.append(f"пропуск: {t}")
+    for t in neg:
+        hit = safety.scan_safety(t)
+        if hit:
+            failures.append(f"ложное: {t}  ← {hit}")
+    ok_window = 0
+    for case in window:
+        got = safety.check_safety(case["text"], case["recent"])
+        ok_window += got == case["expect"]
+        if got != case["expect"]:
+            failures.append(f"окно: {case['recent']} + {case['text']!r} → {got}")
+    print(f"окно    {ok_window}/{len(window)}")
+    for f in failures:
+        print("  " + f)
+
+    cases = [c["input"] for c in json.loads(CASES_PATH.read_text(encoding="utf-8"))]
+    texts = pos + neg + cases
+    legacy = _bench(legacy_check, texts, args.rounds)
+    engine = _bench(safety.check_safety, texts, args.rounds)
+    recent = ["мне сейчас непросто", "работа и деньги — всё навалилось"]
+    engine_w = _bench(lambda t: safety.check_safety(t, recent), texts, args.rounds)
+    print(f"µs/сообщение ({len(texts)} текстов):  legacy {legacy:6.1f}   safety {engine:6.1f}   safety+окно {engine_w:6.1f}")
+    return 1 if args.check and failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
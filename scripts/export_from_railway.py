@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
-"""Выгрузка диалогов с Railway (PostgreSQL) в exports/."""
+"""Выгрузка диалогов с Railway (PostgreSQL) в exports/.
+
+Запуск: python scripts/export_from_railway.py [since]   (since — ISO-дата, опционально)
+"""
 import json
 import os
 import sys
@@ -30,28 +33,36 @@ def main():
         print(" pip install requests")
         sys.exit(1)
 
-    url = f"{EXPORT_URL.rstrip('/')}?token={EXPORT_TOKEN}"
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    data = r.json()
-
-    if "error" in data:
-        print(f"ERROR: {data['error']}")
+    # NDJSON-стрим (gzip) с сервера: записи пишутся на диск по мере прихода, без общего списка в памяти
+    url = EXPORT_URL.rstrip("/")
+    params = {"token": EXPORT_TOKEN, "format": "ndjson", "gzip": "1"}
+    if len(sys.argv) > 1:
+        params["since"] = sys.argv[1]
+    r = requests.get(url, params=params, timeout=(10, 300), stream=True)
+    if r.status_code == 401:
+        print("ERROR: unauthorized")
         sys.exit(1)
+    r.raise_for_status()
 
-    dialogs = data.get("dialogs", [])
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
     out_json = OUTPUT_DIR / "dialogs_all.json"
-    with open(out_json, "w", encoding="utf-8") as f:
-        json.dump(dialogs, f, ensure_ascii=False, indent=2)
-
     out_jsonl = OUTPUT_DIR / "dialogs_all.jsonl"
-    with open(out_jsonl, "w", encoding="utf-8") as f:
-        for d in dialogs:
-            f.write(json.dumps(d, ensure_ascii=False) + "\n")
+    count = 0
+    with open(out_jsonl, "w", encoding="utf-8") as fl, open(out_json, "w", encoding="utf-8") as fj:
+        fj.write("[\n")
+        for line in r.iter_lines(decode_unicode=False):
+            if not line:
+                continue
+            d = json.loads(line)
+            if "_meta" in d:
+                continue
+            d.pop("cursor", None)
+            fl.write(json.dumps(d, ensure_ascii=False) + "\n")
+            fj.write((",\n" if count else "") + json.dumps(d, ensure_ascii=False, indent=2))
+            count += 1
+        fj.write("\n]\n")
 
-    print(f"Сохранено: {len(dialogs)} записей")
+    print(f"Сохранено: {count} записей")
     print(f"  {out_json}")
     print(f"  {out_jsonl}")
 
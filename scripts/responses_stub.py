@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Локальная заглушка OpenAI Responses API — проверка цепочки previous_response_id без сети.
+
+Хранит ответы (store=true) в памяти, считает входные токены цепочки целиком и отдельно
+присланное в запросе; неизвестный previous_response_id → 404 previous_response_not_found.
+Ответ модели — эхо: номер звена цепочки и начало текущего сообщения.
+
+Запуск:  python scripts/responses_stub.py --port 8787 [--forget-every 5]
+Бот:     OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=stub PHI_RESPONSES_CHAIN=1 python bot.py
+Потеря цепочки: DELETE /v1/responses/<id> или --forget-every N (забывать каждый N-й ответ).
+Счётчики: GET /stats
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from utils.tokens import count_prompt_tokens, count_tokens
+
+
+def _input_text(inp) -> str:
+    """input: строка или список message-элементов."""
+    if isinstance(inp, str):
+        return inp
+    parts = []
+    for item in inp or []:
+        content = item.get("content") if isinstance(item, dict) else None
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(str(c.get("text", "")) for c in content if isinstance(c, dict))
+    return "\n".join(parts)
+
+
+class ResponsesStub:
+    def __init__(self, forget_every: int = 0):
+        self.forget_every = forget_every
+        self._lock = threading.Lock()
+        self._items: dict[str, dict] = {}  # id -> {"prev", "tokens" (вход+выход звена), "depth"}
+        self.stats = {"requests": 0, "stored": 0, "chained": 0, "not_found": 0, "sent_tokens": 0, "billed_input_tokens": 0}
+
+    def create(self, body: dict) -> tuple[int, dict]:
+        prev_id = body.get("previous_response_id")
+        text = _input_text(body.get("input"))
+        sent = count_prompt_tokens(body.get("instructions") or "") + count_tokens(text)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["sent_tokens"] += sent
+            prev = None
+            if prev_id:
+                prev = self._items.get(prev_id)
+                if prev is None:
+                    self.stats["not_found"] += 1
+                    return 404, {"error": {
+                        "message": f"Previous response with id '{prev_id}' not found.",
+                        "type": "invalid_request_error",
+                        "param": "previous_response_id",
+                        "code": "previous_response_not_found",
+                    }}
+                self.stats["chained"] += 1
+            depth = prev["depth"] + 1 if prev else 1
+            history_tokens = self._chain_tokens(prev_id)
+            out = f"[stub] звено {depth}: {text.rsplit('[Текущее сообщение]', 1)[-1].strip()[:120]}"
+            input_tokens = history_tokens + sent
+            self.stats["billed_input_tokens"] += input_tokens
+            rid = "resp_" + uuid.uuid4().hex
+            if body.get("store"):
+                self._items[rid] = {"prev": prev_id, "tokens": count_tokens(text) + count_tokens(out), "depth": depth}
+                self.stats["stored"] += 1
+                if self.forget_every and self.stats["stored"] % self.forget_every == 0:
+                    self._items.pop(rid)
+        output_tokens = count_tokens(out)
+        return 200, {
+            "id": rid,
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": "completed",
+            "model": body.get("model"),
+            "previous_response_id": prev_id,
+            "store": bool(body.get("store")),
+            "output": [{
+                "type": "message",
+                "id": "msg_" + uuid.uuid4().hex,
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": out, "annotations": []}],
+            }],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + output_tokens,
+            },
+        }
+
+    def _chain_tokens(self, rid) -> int:
+        """Instructions не наследуются — в цепочке только вход и выход звеньев."""
+        total = 0
+        while rid and rid in self._items:
+            total += self._items[rid]["tokens"]
+            rid = self._items[rid]["prev"]
+        return total
+
+    def delete(self, rid: str) -> bool:
+        with self._lock:
+            return self._items.pop(rid, None) is not None
+
+
+def make_handler(stub: ResponsesStub):
+    class Handler(BaseHTTPRequestHandler):
+        def _json(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/v1/responses":
+                return self._json(404, {"error": {"message": "unknown path"}})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            except json.JSONDecodeError:
+                return self._json(400, {"error": {"message": "bad json"}})
+            self._json(*stub.create(body))
+
+        def do_DELETE(self):
+            rid = self.path.rstrip("/").rsplit("/", 1)[-1]
+            self._json(200, {"id": rid, "object": "response.deleted", "deleted": stub.delete(rid)})
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                return self._json(200, dict(stub.stats, in_memory=len(stub._items)))
+            self._json(404, {"error": {"message": "unknown path"}})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Заглушка Responses API (previous_response_id)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--forget-every", type=int, default=0, help="забывать каждый N-й сохранённый ответ")
+    args = ap.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(ResponsesStub(args.forget_every)))
+    print(f"Responses stub: http://{args.host}:{args.port}/v1  (OPENAI_BASE_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""Обучение локального классификатора topic intent (utils.topic_classifier) + отчёт точности и задержки.
+
+Тексты: входы tests/cases.json, реплики eval/scenarios, seed_message eval/synth_scenarios.yaml,
+text_in из exports/dialogs_all.json, dataset/user_inputs.txt, --texts FILE (строка = текст).
+Метки по приоритету:
+  llm    — ответы mini-модели: кэш интентов бота (--intent-cache, utils.intent_cache) и прежний
+           eval-кэш intent_topic_llm (--cache-dir), записи которого находятся по ключу текста
+  topic  — target_topic synth-сценария (TOPIC_LABELS)
+  rules  — уверенные решения правил: topic_score ≥ 5 / philosophy_topic → True, score < 3 → False
+Тексты зоны topic_mid без метки llm/topic не используются — для них и нужен классификатор.
+
+Пороги low/high калибруются по out-of-fold вероятностям зоны topic_mid: уверенный ответ должен быть
+верен с точностью ≥ --target-accuracy. Меток topic_mid меньше --min-mid — модель не записывается.
+Отчёт: k-fold точность, доля уверенных ответов (не уходят в LLM) и точность на них — по всем меткам
+и по зоне topic_mid; µs на классификацию.
+
+Запуск: python scripts/train_topic_classifier.py [--intent-cache PATH] [--cache-dir eval/cache] [--out models/topic_intent.json]
+        [--target-accuracy 0.95] [--min-mid 30] [--folds 5] [--dry-run | --force]   (нужен numpy)
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from eval.llm_cache import _stable_hash  # noqa: E402
+from intent_philosophy_topic import detect_philosophy_topic_intent  # noqa: E402
+from intent_topic_v2 import is_topic_mid, topic_score  # noqa: E402
+from utils import intent_cache, topic_classifier as tc  # noqa: E402
+
+TOPIC_LABELS = {
+    "philosophy": True, "religion": True,
+    "finance": False, "insomnia": False, "anger": False, "orientation": False,
+    "meaning": False, "choice": False, "meta": False, "overload": False,
+}
+
+
+def _yaml(path: Path):
+    try:
+        import yaml
+    except ImportError:
+        return None
+    try:
+        return yaml.safe_load(path.read_text(encoding="utf-8"))
+    except (OSError, yaml.YAMLError):
+        return None
+
+
+def collect_texts(extra: list[Path]) -> tuple[list[str], dict[str, bool]]:
+    """Тексты-кандидаты и метки по target_topic."""
+    texts, topic = [], {}
+    cases = PROJECT_ROOT / "tests" / "cases.json"
+    if cases.exists():
+        texts += [c["input"] for c in json.loads(cases.read_text(encoding="utf-8"))]
+    for path in sorted((PROJECT_ROOT / "eval" / "scenarios").glob("*.yaml")):
+        for sc in (_yaml(path) or {}).get("scenarios") or []:
+            texts += [t for t in sc.get("turns") or [] if isinstance(t, str)]
+    for sc in _yaml(PROJECT_ROOT / "eval" / "synth_scenarios.yaml") or []:
+        seed = sc.get("seed_message") if isinstance(sc, dict) else None
+        if isinstance(seed, str):
+            texts.append(seed)
+            if sc.get("target_topic") in TOPIC_LABELS:
+                topic[seed.strip()] = TOPIC_LABELS[sc["target_topic"]]
+    dialogs = PROJECT_ROOT / "exports" / "dialogs_all.json"
+    if dialogs.exists():
+        texts += [d.get("text_in") for d in json.loads(dialogs.read_text(encoding="utf-8")) if isinstance(d, dict)]
+    for path in [PROJECT_ROOT / "dataset" / "user_inputs.txt", *extra]:
+        if path.exists():
+            texts += path.read_text(encoding="utf-8").splitlines()
+    texts = [t.strip() for t in texts if isinstance(t, str) and t.strip() and not t.strip().startswith("/")]
+    return list(dict.fromkeys(texts)), topic
+
+
+def llm_labels(intent_db: Path, cache_dir: Path, texts: list[str]) -> dict[str, bool]:
+    """Ответы mini-модели: кэш интентов бота (ключ — нормализованный текст) + прежний eval-кэш."""
+    labels = {}
+    try:
+        labels.update((key, bool(v)) for key, v in intent_cache.iter_entries(intent_db, "intent_topic", ttl_sec=0))
+    except Exception as e:
+        print(f"кэш интентов {intent_db}: {e}")
+    if not cache_dir.is_dir():
+        return labels
+    for t in texts:
+        if t in labels or intent_cache.normalize_key(t) in labels:
+            continue
+        path = cache_dir / (_stable_hash({"ns": "intent_topic_llm", "v": 1, "text": t.lower()}) + ".json")
+        if path.exists():
+            try:
+                labels[t] = bool(json.loads(path.read_text(encoding="utf-8")).get("is_topic"))
+            except (OSError, ValueError):
+                pass
+    return labels
+
+
+def rule_label(text: str):
+    score = topic_score(text)
+    if score >= 5 or detect_philosophy_topic_intent(text)[0]:
+        return True
+    if score < 3:
+        return False
+    return None
+
+
+def build_dataset(texts: list[str], topic: dict, llm: dict) -> list[tuple[str, bool, str]]:
+    """[(текст, метка, источник)] — первая метка по приоритету llm → topic → rules."""
+    data, seen = [], set()
+    for t in [*texts, *llm]:
+        key = intent_cache.normalize_key(t)
+        if key in seen:
+            continue
+        seen.add(key)
+        llm_label = llm.get(t, llm.get(key))
+        for source, label in (("llm", llm_label), ("topic", topic.get(t)), ("rules", rule_label(t))):
+            if label is not None:
+                data.append((t, bool(label), source))
+                break
+    return data
+
+
+def out_of_fold(data: list, folds: int, seed: int = 13) -> list[tuple[float, bool, bool]]:
+    """Вероятности k-fold: [(p, метка, в зоне topic_mid)]."""
+    items = list(data)
+    random.Random(seed).shuffle(items)
+    rows = []
+    for k in range(folds):
+        test = items[k::folds]
+        train = [x for i, x in enumerate(items) if i % folds != k]
+        if not test or len({label for _, label, _ in train}) < 2:
+            continue
+        model = tc.train([t for t, _, _ in train], [label for _, label, _ in train])
+        rows += [(model.proba(t), label, is_topic_mid(t)) for t, label, _ in test]
+    return rows
+
+
+def calibrate(rows: list, target: float, min_support: int = 5) -> tuple[float, float]:
+    """Самый низкий high и самый высокий low, при которых точность уверенных ответов ≥ target.
+    Недостижимо — (0.0, 1.0): всё решает LLM."""
+    cuts = sorted({p for p, _, _ in rows})
+    low = high = None
+    for cut in cuts:
+        above = [label for p, label, _ in rows if p >= cut]
+        if len(above) >= min_support and sum(above) / len(above) >= target:
+            high = cut
+            break
+    for cut in reversed(cuts):
+        below = [label for p, label, _ in rows if p <= cut]
+        if len(below) >= min_support and (len(below) - sum(below)) / len(below) >= target:
+            low = cut
+            break
+    return (round(low, 4) if low is not None else 0.0), (round(high, 4) if high is not None else 1.0)
+
+
+def report(rows: list, low: float, high: float) -> Optional[dict]:
+    if not rows:
+        return None
+    acc = sum((p >= 0.5) == label for p, label, _ in rows) / len(rows)
+    confident = [(p, label) for p, label, _ in rows if p >= high or p <= low]
+    conf_acc = sum((p >= high) == label for p, label in confident) / len(confident) if confident else None
+    return {
+        "n": len(rows),
+        "accuracy": round(acc, 3),
+        "confident_share": round(len(confident) / len(rows), 3),
+        "confident_accuracy": round(conf_acc, 3) if conf_acc is not None else None,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--intent-cache", type=Path, default=intent_cache.CACHE_PATH, help="SQLite кэша интентов бота")
+    ap.add_argument("--cache-dir", default="eval/cache", help="прежний eval-кэш")
+    ap.add_argument("--texts", type=Path, action="append", default=[], help="доп. тексты, строка = текст")
+    ap.add_argument("--out", type=Path, default=tc.MODEL_PATH)
+    ap.add_argument("--target-accuracy", type=float, default=0.95, help="точность уверенных ответов")
+    ap.add_argument("--min-mid", type=int, default=30, help="минимум меток зоны topic_mid для калибровки")
+    ap.add_argument("--folds", type=int, default=5)
+    ap.add_argument("--dry-run", action="store_true", help="только отчёт, модель не записывать")
+    ap.add_argument("--force", action="store_true", help="записать модель, даже если меток topic_mid мало")
+    args = ap.parse_args()
+
+    texts, topic = collect_texts(args.texts)
+    cache_dir = Path(args.cache_dir)
+    llm = llm_labels(args.intent_cache, cache_dir if cache_dir.is_absolute() else PROJECT_ROOT / cache_dir, texts)
+    data = build_dataset(texts, topic, llm)
+    by_source = {s: sum(1 for _, _, src in data if src == s) for s in ("llm", "topic", "rules")}
+    pos = sum(1 for _, label, _ in data if label)
+    print(f"текстов: {len(texts)}, с меткой: {len(data)} (True {pos} / False {len(data) - pos}), источники: {by_source}")
+    if pos == 0 or pos == len(data):
+        print("нужны метки обоих классов")
+        return 1
+
+    rows = out_of_fold(data, args.folds)
+    mid_rows = [r for r in rows if r[2]]
+    enough = len(mid_rows) >= args.min_mid
+    # классификатор вызывается только в зоне topic_mid — пороги калибруются на ней
+    low, high = calibrate(mid_rows if enough else rows, args.target_accuracy)
+    cv = {"all": report(rows, low, high), "topic_mid": report(mid_rows, low, high)}
+    print(f"{args.folds}-fold, пороги (точность уверенных ≥ {args.target_accuracy}): low={low} high={high}")
+    for name, r in cv.items():
+        print(f"  {name:9s} {r if r else 'нет меток'}")
+    if not enough:
+        print(f"меток в зоне topic_mid: {len(mid_rows)} < {args.min_mid} — пороги по всем меткам; "
+              "нужно больше ответов mini-модели в кэше интентов (--intent-cache)")
+
+    model = tc.train([t for t, _, _ in data], [label for _, label, _ in data])
+    model.low, model.high = low, high
+    model.meta = {"n": len(data), "positives": pos, "sources": by_source, "cv": cv,
+                  "trained_at": time.strftime("%Y-%m-%d %H:%M")}
+    sample = [t for t, _, _ in data][:200]
+    t0 = time.perf_counter()
+    for t in sample:
+        model.classify(t)
+    us = (time.perf_counter() - t0) / len(sample) * 1e6
+    print(f"признаков в модели: {len(model.weights)}, классификация: {us:.1f} µs/сообщение")
+    if args.dry_run:
+        return 0
+    if not enough and not args.force:
+        print("модель не записана (--force — записать всё равно)")
+        return 1
+    model.save(args.out)
+    print(f"модель: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
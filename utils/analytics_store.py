@@ -0,0 +1,414 @@
+"""Локальное аналитическое хранилище (SQLite) поверх сегментов логов.
+
+Таблицы dialogs / dialog_lenses / feedback / events / safety с индексами по ts, user_id,
+intent и линзам; view feedback_turns связывает фидбек с репликой (user_id, message_id).
+Загрузка инкрементальная: watermark (несжатый offset) на каждый сегмент/файл хранится
+в той же БД и сдвигается в одной транзакции со вставкой — повторный sync не дублирует строки.
+
+CLI:
+  python -m utils.analytics_store sync                     # догрузить новые записи из logs/segments
+  python -m utils.analytics_store load <file.jsonl[.gz]>   # bulk-загрузка диалогов (бэкапы, /export)
+  python -m utils.analytics_store report [name]            # стандартные отчёты (без name — все)
+  python -m utils.analytics_store sql "<SELECT ...>"
+  python -m utils.analytics_store search "Ирвин" [--since 2026-01-01] [--lens L] [--stage S] [--field text_out]
+"""
+
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from utils import dialog_search
+from utils.log_segments import KINDS, iter_records, list_segments, read_index, stem_of
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dialogs (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    user_id INTEGER,
+    message_id INTEGER,
+    intent TEXT,
+    stage TEXT,
+    lenses TEXT,
+    expand_retry INTEGER NOT NULL DEFAULT 0,
+    len_in INTEGER,
+    len_out INTEGER,
+    text_in TEXT,
+    text_out TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_dialogs_ts ON dialogs (ts);
+CREATE INDEX IF NOT EXISTS ix_dialogs_user ON dialogs (user_id, ts);
+CREATE INDEX IF NOT EXISTS ix_dialogs_intent ON dialogs (intent, len_out);
+CREATE INDEX IF NOT EXISTS ix_dialogs_msg ON dialogs (user_id, message_id);
+
+CREATE TABLE IF NOT EXISTS dialog_lenses (
+    dialog_id INTEGER NOT NULL REFERENCES dialogs (id),
+    lens TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_dialog_lenses_lens ON dialog_lenses (lens, dialog_id);
+CREATE INDEX IF NOT EXISTS ix_dialog_lenses_dialog ON dialog_lenses (dialog_id);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    user_id INTEGER,
+    message_id INTEGER,
+    rating TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_feedback_ts ON feedback (ts);
+CREATE INDEX IF NOT EXISTS ix_feedback_msg ON feedback (user_id, message_id);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    user_id INTEGER,
+    event TEXT NOT NULL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_events_event ON events (event, ts);
+CREATE INDEX IF NOT EXISTS ix_events_user ON events (user_id, ts);
+
+CREATE TABLE IF NOT EXISTS safety (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    user_id INTEGER,
+    reason TEXT,
+    text_in TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_safety_ts ON safety (ts);
+
+CREATE TABLE IF NOT EXISTS ingest_state (
+    source TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+
+CREATE VIEW IF NOT EXISTS feedback_turns AS
+SELECT f.id AS feedback_id, f.ts AS feedback_ts, f.user_id, f.message_id, f.rating,
+       d.id AS dialog_id, d.ts AS dialog_ts, d.intent, d.stage, d.lenses, d.expand_retry, d.len_out
+FROM feedback f
+LEFT JOIN dialogs d ON d.user_id = f.user_id AND d.message_id = f.message_id;
+"""
+
+
+def _as_int(v) -> Optional[int]:
+    try:
+        return int(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _insert_dialog(cur: sqlite3.Cursor, d: dict) -> None:
+    lenses = d.get("lenses") or []
+    if isinstance(lenses, str):
+        try:
+            lenses = json.loads(lenses)
+        except json.JSONDecodeError:
+            lenses = [lenses]
+    text_in = d.get("text_in") or ""
+    text_out = d.get("text_out") or ""
+    cur.execute(
+        "INSERT INTO dialogs (ts, user_id, message_id, intent, stage, lenses, expand_retry,"
+        " len_in, len_out, text_in, text_out) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            d.get("ts") or "",
+            _as_int(d.get("user_id")),
+            _as_int(d.get("message_id")),
+            d.get("intent"),
+            d.get("stage"),
+            json.dumps(lenses, ensure_ascii=False),
+            1 if d.get("expand_retry") else 0,
+            len(text_in),
+            len(text_out),
+            text_in,
+            text_out,
+        ),
+    )
+    dialog_id = cur.lastrowid
+    dialog_search.index_dialog(cur, dialog_id, text_in, text_out)
+    if lenses:
+        cur.executemany(
+            "INSERT INTO dialog_lenses (dialog_id, lens) VALUES (?, ?)",
+            [(dialog_id, str(lens)) for lens in lenses],
+        )
+
+
+def _insert_feedback(cur: sqlite3.Cursor, d: dict) -> None:
+    cur.execute(
+        "INSERT INTO feedback (ts, user_id, message_id, rating) VALUES (?, ?, ?, ?)",
+        (d.get("ts") or "", _as_int(d.get("user_id")), _as_int(d.get("message_id")), d.get("rating")),
+    )
+
+
+def _insert_event(cur: sqlite3.Cursor, d: dict) -> None:
+    data = {k: v for k, v in d.items() if k not in ("ts", "user_id", "event")}
+    cur.execute(
+        "INSERT INTO events (ts, user_id, event, data) VALUES (?, ?, ?, ?)",
+        (d.get("ts") or "", _as_int(d.get("user_id")), str(d.get("event") or ""),
+         json.dumps(data, ensure_ascii=False) if data else None),
+    )
+
+
+def _insert_safety(cur: sqlite3.Cursor, d: dict) -> None:
+    cur.execute(
+        "INSERT INTO safety (ts, user_id, reason, text_in) VALUES (?, ?, ?, ?)",
+        (d.get("ts") or "", _as_int(d.get("user_id")), d.get("reason"), d.get("text_in")),
+    )
+
+
+_INSERTERS: dict[str, Callable[[sqlite3.Cursor, dict], None]] = {
+    "dialogs": _insert_dialog,
+    "feedback": _insert_feedback,
+    "events": _insert_event,
+    "safety": _insert_safety,
+}
+
+
+# --- стандартные отчёты: имя → (описание, SQL) ---
+
+REPORTS: dict[str, tuple[str, str]] = {
+    "summary": (
+        "объём данных",
+        """SELECT 'dialogs' AS t, COUNT(*) AS n, MIN(ts) AS first_ts, MAX(ts) AS last_ts FROM dialogs
+           UNION ALL SELECT 'feedback', COUNT(*), MIN(ts), MAX(ts) FROM feedback
+           UNION ALL SELECT 'events', COUNT(*), MIN(ts), MAX(ts) FROM events
+           UNION ALL SELECT 'safety', COUNT(*), MIN(ts), MAX(ts) FROM safety""",
+    ),
+    "lens_feedback": (
+        "линзы ↔ фидбек (доля not_useful)",
+        """SELECT dl.lens,
+                  SUM(ft.rating = 'useful') AS useful,
+                  SUM(ft.rating = 'not_useful') AS not_useful,
+                  ROUND(1.0 * SUM(ft.rating = 'not_useful') / COUNT(*), 3) AS not_useful_rate
+           FROM feedback_turns ft
+           JOIN dialog_lenses dl ON dl.dialog_id = ft.dialog_id
+           GROUP BY dl.lens
+           ORDER BY not_useful_rate DESC, not_useful DESC""",
+    ),
+    "intent_feedback": (
+        "intent ↔ фидбек",
+        """SELECT COALESCE(intent, '?') AS intent,
+                  SUM(rating = 'useful') AS useful,
+                  SUM(rating = 'not_useful') AS not_useful,
+                  SUM(dialog_id IS NULL) AS unmatched
+           FROM feedback_turns
+           GROUP BY intent
+           ORDER BY not_useful DESC""",
+    ),
+    "expand_rate": (
+        "как часто срабатывает expand-retry (по дням)",
+        """SELECT substr(ts, 1, 10) AS day, COUNT(*) AS dialogs,
+                  SUM(expand_retry) AS expand_retries,
+                  ROUND(1.0 * SUM(expand_retry) / COUNT(*), 3) AS rate
+           FROM dialogs
+           GROUP BY day
+           ORDER BY day DESC
+           LIMIT 30""",
+    ),
+    "reply_len": (
+        "длина ответа по intent (p50 / p95 / max)",
+        """WITH ranked AS (
+               SELECT COALESCE(intent, '?') AS intent, len_out,
+                      ROW_NUMBER() OVER (PARTITION BY intent ORDER BY len_out) AS rn,
+                      COUNT(*) OVER (PARTITION BY intent) AS cnt
+               FROM dialogs
+           )
+           SELECT intent, MAX(cnt) AS n,
+                  MIN(CASE WHEN rn >= 0.50 * cnt THEN len_out END) AS p50,
+                  MIN(CASE WHEN rn >= 0.95 * cnt THEN len_out END) AS p95,
+                  MAX(len_out) AS max_len
+           FROM ranked
+           GROUP BY intent
+           ORDER BY n DESC""",
+    ),
+    "top_events": (
+        "частые события",
+        """SELECT event, COUNT(*) AS n, COUNT(DISTINCT user_id) AS users, MAX(ts) AS last_ts
+           FROM events GROUP BY event ORDER BY n DESC LIMIT 30""",
+    ),
+}
+
+
+class AnalyticsStore:
+    """SQLite-хранилище аналитики. Один writer (sync/load), чтение — из любого потока."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stats = {"syncs": 0, "rows": 0, "last_sync_ms": 0.0, "errors": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            dialog_search.ensure_index(conn)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    # --- загрузка ---
+
+    def _ingest(self, conn: sqlite3.Connection, source: str, kind: str, path: Path, size: Optional[int]) -> int:
+        """Догрузить записи source после watermark; вставка и сдвиг watermark — одна транзакция."""
+        row = conn.execute("SELECT offset FROM ingest_state WHERE source = ?", (source,)).fetchone()
+        offset = row[0] if row else 0
+        if size is not None and size < offset:
+            offset = 0  # файл пересоздан/обрезан
+        if size is not None and size == offset:
+            return 0
+        insert = _INSERTERS[kind]
+        n = 0
+        with conn:
+            cur = conn.cursor()
+            for end, rec in iter_records(path, offset):
+                insert(cur, rec)
+                offset = end
+                n += 1
+            cur.execute(
+                "INSERT INTO ingest_state (source, offset) VALUES (?, ?) "
+                "ON CONFLICT (source) DO UPDATE SET offset = excluded.offset",
+                (source, offset),
+            )
+        return n
+
+    def sync_segments(self, root: Path) -> int:
+        """Догрузить новые записи из всех сегментов logs/segments. Возвращает число строк."""
+        t0 = time.perf_counter()
+        total = 0
+        with self._lock:
+            conn = self._connect()
+            try:
+                for kind in KINDS:
+                    for path in list_segments(root, kind):
+                        idx = read_index(path)
+                        try:
+                            size = idx.get("bytes") if idx is not None else path.stat().st_size
+                            total += self._ingest(conn, f"seg:{stem_of(path)}", kind, path, size)
+                        except (OSError, EOFError, sqlite3.DatabaseError) as e:
+                            self._stats["errors"] += 1
+                            print(f"[analytics] sync {path.name} error: {e}")
+            finally:
+                conn.close()
+        self._stats["syncs"] += 1
+        self._stats["rows"] += total
+        self._stats["last_sync_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        return total
+
+    def load_file(self, path: Path, kind: str = "dialogs") -> int:
+        """Bulk-загрузка JSONL/JSONL.gz (бэкапы exports/, выгрузка /export). Повтор — только хвост."""
+        path = Path(path)
+        with self._lock:
+            conn = self._connect()
+            try:
+                return self._ingest(conn, f"file:{path.resolve()}", kind, path, None)
+            finally:
+                conn.close()
+
+    # --- чтение ---
+
+    def query(self, sql: str, params: tuple = ()) -> tuple[list[str], list[tuple]]:
+        """(колонки, строки). Соединение только для чтения — CLI не может испортить данные."""
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        try:
+            cur = conn.execute(sql, params)
+            cols = [c[0] for c in cur.description or ()]
+            return cols, cur.fetchall()
+        finally:
+            conn.close()
+
+    def report(self, name: str) -> tuple[list[str], list[tuple]]:
+        return self.query(REPORTS[name][1])
+
+    def search(self, query: str, **filters) -> list[dict]:
+        """Полнотекстовый поиск по text_in/text_out (см. utils.dialog_search.search)."""
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        try:
+            return dialog_search.search(conn, query, **filters)
+        finally:
+            conn.close()
+
+
+def _print_table(cols: list[str], rows: list[tuple]) -> None:
+    cells = [cols] + [["" if v is None else str(v) for v in r] for r in rows]
+    widths = [max(len(r[i]) for r in cells) for i in range(len(cols))]
+    for j, r in enumerate(cells):
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+        if j == 0:
+            print("  ".join("-" * w for w in widths))
+
+
+def _iter_report_names(argv: list[str]) -> Iterator[str]:
+    names = argv[1:] or list(REPORTS)
+    for name in names:
+        if name not in REPORTS:
+            print(f"unknown report: {name} (есть: {', '.join(REPORTS)})")
+            sys.exit(1)
+        yield name
+
+
+def _search_cli(store: AnalyticsStore, argv: list[str]) -> None:
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="python -m utils.analytics_store search")
+    ap.add_argument("query")
+    ap.add_argument("--since")
+    ap.add_argument("--until")
+    ap.add_argument("--lens")
+    ap.add_argument("--stage")
+    ap.add_argument("--user-id", type=int)
+    ap.add_argument("--field", choices=["text_in", "text_out"])
+    ap.add_argument("--limit", type=int, default=50)
+    a = ap.parse_args(argv)
+    t0 = time.perf_counter()
+    hits = store.search(
+        a.query, since=a.since, until=a.until, lens=a.lens, stage=a.stage,
+        user_id=a.user_id, field=a.field, limit=a.limit,
+    )
+    for h in hits:
+        print(f"[{h['ts']}] user={h['user_id']} stage={h['stage']} lenses={h['lenses']}")
+        print(f"  > {h['text_in']}")
+        print(f"  < {h['text_out']}")
+    print(f"{len(hits)} hits in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+def main(argv: list[str]) -> None:
+    from logger import ANALYTICS_DB, SEGMENTS_DIR
+
+    if not argv or argv[0] not in ("sync", "load", "report", "sql", "search"):
+        print(__doc__)
+        sys.exit(1)
+    store = AnalyticsStore(ANALYTICS_DB)
+    cmd = argv[0]
+    if cmd == "sync":
+        t0 = time.perf_counter()
+        n = store.sync_segments(SEGMENTS_DIR)
+        print(f"synced: {n} rows in {time.perf_counter() - t0:.2f}s → {ANALYTICS_DB}")
+        return
+    if cmd == "load":
+        for p in argv[1:]:
+            print(f"{p}: {store.load_file(Path(p))} rows")
+        return
+    if cmd == "sql":
+        _print_table(*store.query(" ".join(argv[1:])))
+        return
+    if cmd == "search":
+        _search_cli(store, argv[1:])
+        return
+    for name in _iter_report_names(argv):
+        t0 = time.perf_counter()
+        cols, rows = store.report(name)
+        print(f"\n== {name}: {REPORTS[name][0]} ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+        _print_table(cols, rows)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,243 @@
+"""Ежедневный бэкап логов как async-задача: subprocess без блокировки event loop.
+
+- запуск через asyncio.create_subprocess_exec (бот не ждёт 60 с синхронно);
+- jitter к интервалу, чтобы реплики не стартовали одновременно;
+- asyncio.Lock против наложения запусков в процессе;
+- lease между репликами: PostgreSQL advisory lock + отметка последнего запуска
+  (если есть DATABASE_URL), иначе flock-файл в exports/;
+- метрики длительности и исходов для /health.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+BACKUP_INTERVAL_SEC = int(os.environ.get("PHI_BACKUP_INTERVAL_SEC", "86400"))
+BACKUP_JITTER_SEC = int(os.environ.get("PHI_BACKUP_JITTER_SEC", "900"))
+BACKUP_TIMEOUT_SEC = int(os.environ.get("PHI_BACKUP_TIMEOUT_SEC", "600"))
+# Другая реплика уже сделала бэкап, если прошло меньше этой доли интервала
+RECENT_RUN_RATIO = 0.9
+JOB_NAME = "backup_logs_daily"
+_PG_LOCK_KEY = 0x50484942  # "PHIB"
+
+
+class FileLease:
+    """Lease через flock + last_run в JSON (реплики на одном диске)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._fd = None
+
+    def acquire(self, min_interval: float) -> Optional[str]:
+        """None — lease получен; иначе причина пропуска ("locked" | "recent")."""
+        try:
+            import fcntl
+        except ImportError:
+            return None  # нет flock (Windows) — полагаемся на asyncio.Lock
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return "locked"
+        raw = os.read(fd, 4096)
+        try:
+            last = float(json.loads(raw or b"{}").get("last_run", 0))
+        except (ValueError, AttributeError):
+            last = 0.0
+        if time.time() - last < min_interval:
+            os.close(fd)
+            return "recent"
+        self._fd = fd
+        return None
+
+    def release(self, success: bool) -> None:
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if success:
+                os.ftruncate(fd, 0)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, json.dumps({"last_run": time.time()}).encode("utf-8"))
+        finally:
+            os.close(fd)  # закрытие снимает flock
+
+
+class PgLease:
+    """Lease через pg_try_advisory_lock + таблицу job_runs (реплики на разных машинах).
+
+    Advisory lock сессионный: держим его на отдельном соединении (connect), не из пула —
+    _reset_db_pool() закрывает все соединения пула и снял бы lock посреди бэкапа.
+    """
+
+    def __init__(self, connect: Callable[[], Optional[object]], fallback: Optional[FileLease] = None):
+        self._connect = connect
+        self._fallback = fallback
+        self._using_fallback = False
+        self._conn = None
+
+    def acquire(self, min_interval: float) -> Optional[str]:
+        conn = self._connect()
+        if conn is None:
+            # БД недоступна — бэкап важнее координации: локальный flock
+            if self._fallback is None:
+                return "db_unavailable"
+            reason = self._fallback.acquire(min_interval)
+            self._using_fallback = reason is None
+            return reason
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (_PG_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                _close(conn)
+                return "locked"
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS job_runs (job TEXT PRIMARY KEY, last_run TIMESTAMPTZ)"
+            )
+            cur.execute(
+                "SELECT EXTRACT(EPOCH FROM now() - last_run) FROM job_runs WHERE job = %s", (JOB_NAME,)
+            )
+            row = cur.fetchone()
+            conn.commit()
+            if row and row[0] is not None and float(row[0]) < min_interval:
+                _close(conn)
+                return "recent"
+        except Exception:
+            _close(conn)
+            return "db_unavailable"
+        self._conn = conn
+        return None
+
+    def release(self, success: bool) -> None:
+        if self._using_fallback:
+            self._using_fallback = False
+            self._fallback.release(success)
+            return
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            if success:
+                cur = conn.cursor()
+                cur.execute(
+                    "INSERT INTO job_runs (job, last_run) VALUES (%s, now()) "
+                    "ON CONFLICT (job) DO UPDATE SET last_run = EXCLUDED.last_run",
+                    (JOB_NAME,),
+                )
+                conn.commit()
+        except Exception:
+            pass
+        _close(conn)
+
+
+def _close(conn) -> None:
+    """Закрыть соединение lease: конец сессии снимает advisory lock."""
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class BackupJob:
+    """Периодический запуск scripts/backup_logs_daily.py в async subprocess."""
+
+    def __init__(
+        self,
+        script: Path,
+        cwd: Path,
+        lease,
+        interval: float = BACKUP_INTERVAL_SEC,
+        jitter: float = BACKUP_JITTER_SEC,
+        timeout: float = BACKUP_TIMEOUT_SEC,
+    ):
+        self.script = Path(script)
+        self.cwd = Path(cwd)
+        self.lease = lease
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._stats = {
+            "runs": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "skipped_running": 0,
+            "skipped_locked": 0,
+            "skipped_recent": 0,
+            "running": False,
+            "last_started_at": None,
+            "last_duration_sec": None,
+            "max_duration_sec": 0.0,
+            "last_returncode": None,
+        }
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    async def run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+            try:
+                await self.run_once()
+            except Exception as e:
+                self._stats["failures"] += 1
+                print(f"[Phi] backup error: {e}")
+
+    async def run_once(self) -> bool:
+        """Один запуск. False — пропущен (уже идёт / другая реплика / недавно) или упал."""
+        if self._lock.locked():
+            self._stats["skipped_running"] += 1
+            return False
+        async with self._lock:
+            reason = await asyncio.to_thread(self.lease.acquire, self.interval * RECENT_RUN_RATIO)
+            if reason:
+                key = "skipped_recent" if reason == "recent" else "skipped_locked"
+                self._stats[key] += 1
+                return False
+            ok = False
+            try:
+                ok = await self._run_subprocess()
+            finally:
+                await asyncio.to_thread(self.lease.release, ok)
+            return ok
+
+    async def _run_subprocess(self) -> bool:
+        if not self.script.exists():
+            return False
+        self._stats["running"] = True
+        self._stats["last_started_at"] = time.time()
+        t0 = time.monotonic()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, str(self.script),
+                cwd=str(self.cwd),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                _, err = await asyncio.wait_for(proc.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                self._stats["timeouts"] += 1
+                self._stats["failures"] += 1
+                return False
+            self._stats["last_returncode"] = proc.returncode
+            self._stats["runs"] += 1
+            if proc.returncode != 0:
+                self._stats["failures"] += 1
+                print(f"[Phi] backup exit {proc.returncode}: {(err or b'').decode('utf-8', 'replace')[-500:]}")
+                return False
+            return True
+        finally:
+            dur = round(time.monotonic() - t0, 3)
+            self._stats["running"] = False
+            self._stats["last_duration_sec"] = dur
+            self._stats["max_duration_sec"] = max(self._stats["max_duration_sec"], dur)
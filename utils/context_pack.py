@@ -2,7 +2,11 @@
 
 from typing import Any, Optional
 
-MAX_HISTORY = 20
+from utils.history_store import ENTRY_MAX_CHARS, MAX_ENTRIES, HistoryStore
+from utils.summary_memory import summary_block
+from utils.tokens import count_tokens
+
+MAX_HISTORY = MAX_ENTRIES
 KEEP_USER = 2
 KEEP_BOT = 2
 
@@ -12,12 +16,19 @@ def pack_context(
     state: dict,
     history_store: dict[int, list],
     user_language: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    history_tail: Optional[int] = None,
+    include_summary: bool = True,
 ) -> str:
     """Формирует блок контекста для передачи в модель.
 
     history_store[user_id] = [{"role":"user"|"assistant","content":...}, ...]
     Берёт последние 4–6 сообщений (2–3 user + 2–3 bot) по порядку.
+    state["summary"] (скользящее резюме, utils.summary_memory) — блоком перед репликами.
     user_language: для SOURCE_RULE_LANGUAGE_MATCH (RU → только RU editions).
+    max_tokens: бюджет контекста — при нехватке отбрасываются самые старые реплики.
+    history_tail / include_summary: дельта для цепочки Responses API (utils.response_chain) —
+    только последние history_tail записей, без резюме (оно уже в цепочке).
     """
     from philosophy.source_rule import get_user_language, should_allow_source_suggestion
 
@@ -33,14 +44,31 @@ def pack_context(
         parts.append("[source_suggestion_allowed: yes]")
     else:
         parts.append("[source_suggestion_allowed: no]")
-    if history:
-        tail = history[-(KEEP_USER + KEEP_BOT) * 2 :]
+    summary = summary_block(state) if include_summary else None
+    if summary:
+        parts.append(summary)
+    keep = (KEEP_USER + KEEP_BOT) * 2 if history_tail is None else history_tail
+    if history and keep > 0:
+        tail = history[-keep:]
+        lines = []
         for h in tail:
             role = h.get("role", "")
-            content = (h.get("content") or "")[:400]
+            content = (h.get("content") or "")[:ENTRY_MAX_CHARS]
             if content:
                 label = "Пользователь" if role == "user" else "Бот"
-                parts.append(f"{label}: {content}")
+                lines.append(f"{label}: {content}")
+        if max_tokens is not None:
+            # новые реплики важнее: набираем с конца, пока влезает
+            left = max_tokens - sum(count_tokens(p) for p in parts)
+            kept = []
+            for line in reversed(lines):
+                cost = count_tokens(line) + 1
+                if cost > left:
+                    break
+                kept.append(line)
+                left -= cost
+            lines = kept[::-1]
+        parts.extend(lines)
 
     return "\n\n".join(parts) if parts else ""
 
@@ -51,10 +79,16 @@ def append_history(
     role: str,
     content: str,
 ) -> None:
-    """Добавить сообщение в историю. Ограничить до MAX_HISTORY."""
+    """Добавить сообщение в историю. Ограничить до MAX_HISTORY.
+
+    HistoryStore — ring buffer с лимитом байт и журналом; обычный dict (eval) — как раньше.
+    """
+    if isinstance(history_store, HistoryStore):
+        history_store.append(user_id, role, content)
+        return
     if user_id not in history_store:
         history_store[user_id] = []
-    history_store[user_id].append({"role": role, "content": content})
+    history_store[user_id].append({"role": role, "content": (content or "")[:ENTRY_MAX_CHARS]})
     hist = history_store[user_id]
     if len(hist) > MAX_HISTORY:
         history_store[user_id] = hist[-MAX_HISTORY:]
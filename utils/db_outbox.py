@@ -0,0 +1,263 @@
+"""Дисковый outbox для записей, которые должны попасть в PostgreSQL.
+
+Сегменты logs/outbox/seg_XXXXXXXX.jsonl (append-only, ротация по размеру) +
+cursor.json — позиция (сегмент, байтовый offset), до которой всё уже в БД.
+Отправленные сегменты удаляются; при рестарте отправка продолжается с курсора.
+
+append() только кладёт строку в очередь (event loop не ждёт диск); поток-appender пишет
+пачку одним write и делает fsync — запись на диске переживает и падение хоста. Пока строка в
+очереди, её теряет только падение процесса. Переполненная очередь — append() возвращает False.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+SEGMENT_MAX_BYTES = int(os.environ.get("PHI_OUTBOX_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+QUEUE_MAX = int(os.environ.get("PHI_OUTBOX_QUEUE_MAX", "10000"))
+BATCH_MAX = 500
+_SEG_PREFIX = "seg_"
+_SEG_SUFFIX = ".jsonl"
+_STOP = object()
+
+
+def _seg_name(seq: int) -> str:
+    return f"{_SEG_PREFIX}{seq:08d}{_SEG_SUFFIX}"
+
+
+def _seg_seq(name: str) -> int:
+    try:
+        return int(name[len(_SEG_PREFIX):-len(_SEG_SUFFIX)])
+    except ValueError:
+        return -1
+
+
+class Outbox:
+    """Потокобезопасный append через очередь + последовательное чтение с курсора (один читатель)."""
+
+    def __init__(self, directory: Path, segment_max_bytes: int = SEGMENT_MAX_BYTES, queue_max: int = QUEUE_MAX):
+        self.dir = Path(directory)
+        self.segment_max_bytes = segment_max_bytes
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_max)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._lock = threading.Lock()  # активный сегмент и счётчики
+        self._active = None
+        self._active_seq = -1
+        self._active_size = 0
+        self._appended = 0
+        self._dropped = 0
+        self._fsyncs = 0
+        self._errors = 0
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            self._errors += 1  # пачки не лягут на диск (errors/dropped) — записи останутся только в JSONL-логе
+        self._cursor = self._load_cursor()
+
+    # --- запись ---
+
+    def append(self, rec: dict) -> bool:
+        """Поставить запись в очередь на диск. False — очередь полна или outbox закрыт."""
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        if self._closed:
+            self._count_dropped()
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self._count_dropped()
+            return False
+        return True
+
+    def _count_dropped(self) -> None:
+        with self._lock:
+            self._dropped += 1
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="phi-outbox-appender", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            while len(batch) < BATCH_MAX:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [x for x in batch if x is not _STOP]
+            if lines:
+                self._write_batch(lines)
+            for _ in batch:
+                q.task_done()
+            if len(lines) < len(batch):
+                self._close_active()
+                return
+
+    def _write_batch(self, lines: list[str]) -> None:
+        """Пачка — одним write + flush + fsync; ротация по размеру между пачками."""
+        data = "".join(lines)
+        with self._lock:
+            try:
+                if self._active is None or self._active_size >= self.segment_max_bytes:
+                    self._rotate()
+                self._active.write(data)
+                self._active.flush()
+                os.fsync(self._active.fileno())
+                self._fsyncs += 1
+                self._active_size += len(data.encode("utf-8"))
+                self._appended += len(lines)
+            except (OSError, ValueError) as e:
+                self._errors += 1
+                self._dropped += len(lines)
+                print(f"[outbox] write error ({len(lines)} records lost): {e}")
+
+    def _rotate(self) -> None:
+        if self._active is not None:
+            self._active.close()  # данные уже под fsync пачки
+        segs = self._segments()
+        seq = max([_seg_seq(s) for s in segs] + [self._active_seq]) + 1
+        path = self.dir / _seg_name(seq)
+        self._active = open(path, "a", encoding="utf-8")
+        self._active_seq = seq
+        self._active_size = 0
+
+    def _close_active(self) -> None:
+        with self._lock:
+            if self._active is not None:
+                try:
+                    self._active.close()
+                except (OSError, ValueError):
+                    pass
+                self._active = None
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Дождаться записи очереди на диск (shutdown, проверки)."""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Дописать очередь и закрыть сегмент (это делает сам appender). Повторный вызов — no-op."""
+        if self._closed:
+            return
+        self._closed = True
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print(f"[outbox] close: queue full after {timeout}s, appender keeps running")
+            return
+        thread.join(timeout)
+        if thread.is_alive():
+            print(f"[outbox] close: appender busy after {timeout}s")
+
+    # --- чтение ---
+
+    def read_batch(self, max_records: int) -> tuple[list[dict], Optional[tuple[str, int]]]:
+        """Прочитать до max_records записей после курсора. Возвращает (записи, новая позиция)."""
+        records: list[dict] = []
+        seg, offset = self._cursor
+        segs = self._segments()
+        if not segs:
+            return [], None
+        if seg not in segs:
+            seg, offset = segs[0], 0
+        idx = segs.index(seg)
+        with self._lock:
+            active_seq = self._active_seq if self._active is not None else None
+        while len(records) < max_records:
+            path = self.dir / seg
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    while len(records) < max_records:
+                        raw = f.readline()
+                        if not raw or not raw.endswith(b"\n"):
+                            break  # конец или недописанная строка активного сегмента
+                        offset += len(raw)
+                        try:
+                            records.append(json.loads(raw.decode("utf-8")))
+                        except (json.JSONDecodeError, UnicodeDecodeError):
+                            continue
+            except OSError:
+                break
+            if len(records) >= max_records:
+                break
+            if idx + 1 >= len(segs) or _seg_seq(seg) == active_seq:
+                break
+            # сегмент закрыт и прочитан целиком — переходим к следующему
+            idx += 1
+            seg, offset = segs[idx], 0
+        return records, (seg, offset)
+
+    def commit(self, position: Optional[tuple[str, int]]) -> None:
+        """Сдвинуть курсор (после успешной отправки) и удалить отправленные сегменты."""
+        if position is None or position == self._cursor:
+            return
+        self._cursor = position
+        tmp = self.dir / "cursor.json.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"segment": position[0], "offset": position[1]}, f)
+            os.replace(tmp, self.dir / "cursor.json")
+        except OSError:
+            self._errors += 1
+        cur_seq = _seg_seq(position[0])
+        for s in self._segments():
+            if _seg_seq(s) < cur_seq:
+                try:
+                    (self.dir / s).unlink()
+                except OSError:
+                    pass
+
+    def backlog(self) -> dict:
+        """Неотправленный хвост: число сегментов и байт после курсора."""
+        seg, offset = self._cursor
+        segs = self._segments()
+        pending = 0
+        count = 0
+        for s in segs:
+            if s < seg:
+                continue
+            try:
+                size = (self.dir / s).stat().st_size
+            except OSError:
+                continue
+            size -= offset if s == seg else 0
+            if size > 0:
+                pending += size
+                count += 1
+        with self._lock:
+            counters = {"appended": self._appended, "dropped": self._dropped, "fsyncs": self._fsyncs, "errors": self._errors}
+        return {"segments": count, "pending_bytes": pending, "queued": self._queue.qsize(), **counters}
+
+    def _segments(self) -> list[str]:
+        try:
+            names = [p.name for p in self.dir.iterdir() if p.name.startswith(_SEG_PREFIX) and p.name.endswith(_SEG_SUFFIX)]
+        except OSError:
+            return []
+        return sorted(names)
+
+    def _load_cursor(self) -> tuple[str, int]:
+        try:
+            with open(self.dir / "cursor.json", encoding="utf-8") as f:
+                data = json.load(f)
+            return str(data.get("segment", "")), int(data.get("offset", 0))
+        except (OSError, ValueError, json.JSONDecodeError):
+            return "", 0
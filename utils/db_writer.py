@@ -0,0 +1,210 @@
+"""Фоновая запись логов в PostgreSQL: дисковый outbox → батчи multi-row INSERT, reconnect с backoff.
+
+Хендлеры дописывают строку в outbox (submit) и сразу возвращаются — INSERT/COMMIT
+выполняет поток-реплеер на соединении из пула. Каждая запись несёт idem_key
+(INSERT ... ON CONFLICT DO NOTHING), поэтому повтор батча после обрыва не дублирует строки.
+Метрики: backlog outbox, латентность вставки по таблицам, reconnect'ы.
+"""
+
+import atexit
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+from utils.db_outbox import Outbox
+
+BATCH_MAX = int(os.environ.get("PHI_DB_BATCH_MAX", "200"))
+FLUSH_INTERVAL_SEC = float(os.environ.get("PHI_DB_FLUSH_SEC", "0.5"))
+BACKOFF_MAX_SEC = 60.0
+
+
+def _is_connection_error(exc: Exception) -> bool:
+    """OperationalError/InterfaceError — соединение потеряно, батч надо повторить."""
+    if isinstance(exc, ConnectionError):
+        return True
+    try:
+        import psycopg2
+        return isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError))
+    except ImportError:
+        return False
+
+
+class DbBatchWriter:
+    """Поток-реплеер: читает outbox с курсора, пишет одним INSERT ... VALUES на таблицу.
+
+    get_pool() -> пул psycopg2 (getconn/putconn) или None, если БД недоступна;
+    reset_pool() вызывается после обрыва соединения. Курсор outbox сдвигается
+    только после успешной записи всего батча.
+    """
+
+    def __init__(
+        self,
+        tables: dict[str, tuple[str, ...]],
+        get_pool: Callable[[], Optional[object]],
+        reset_pool: Callable[[], None],
+        outbox_dir: Path,
+        batch_max: int = BATCH_MAX,
+        flush_interval: float = FLUSH_INTERVAL_SEC,
+    ):
+        self.tables = tables
+        self._get_pool = get_pool
+        self._reset_pool = reset_pool
+        self.batch_max = batch_max
+        self.flush_interval = flush_interval
+        self.outbox = Outbox(outbox_dir)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._closed = False
+        self._backoff = 0.0
+        self._stats = {"enqueued": 0, "inserted": 0, "dropped": 0, "failed": 0, "reconnects": 0}
+        self._latency: dict[str, dict] = {
+            t: {"batches": 0, "rows": 0, "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0} for t in tables
+        }
+
+    def submit(self, table: str, row: tuple) -> bool:
+        """Записать строку в outbox. False — writer закрыт или ошибка диска (строка отброшена)."""
+        if self._closed or table not in self.tables:
+            self._stats["dropped"] += 1
+            return False
+        self._ensure_started()
+        rec = {"k": uuid.uuid4().hex, "t": table, "r": list(row)}
+        if not self.outbox.append(rec):
+            self._stats["dropped"] += 1
+            return False
+        self._stats["enqueued"] += 1
+        return True
+
+    def stats(self) -> dict:
+        """Backlog outbox + латентность INSERT по таблицам (avg/last/max, мс)."""
+        out = dict(self._stats)
+        out["outbox"] = self.outbox.backlog()
+        out["backoff_sec"] = self._backoff
+        tables = {}
+        for t, m in self._latency.items():
+            avg = m["total_ms"] / m["batches"] if m["batches"] else 0.0
+            tables[t] = {
+                "batches": m["batches"],
+                "rows": m["rows"],
+                "avg_ms": round(avg, 2),
+                "last_ms": round(m["last_ms"], 2),
+                "max_ms": round(m["max_ms"], 2),
+            }
+        out["tables"] = tables
+        return out
+
+    def start(self) -> None:
+        """Запустить реплеер заранее (дослать outbox, оставшийся с прошлого запуска)."""
+        self._ensure_started()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Остановить реплеер; неотправленное остаётся в outbox до следующего запуска."""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.outbox.close()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="phi-db-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            records, position = self.outbox.read_batch(self.batch_max)
+            if not records:
+                self.outbox.commit(position)
+                if self._stop.wait(self.flush_interval):
+                    return
+                continue
+            if self._ship(records):
+                self._backoff = 0.0
+                self.outbox.commit(position)
+                continue
+            self._stats["reconnects"] += 1
+            self._reset_pool()
+            self._backoff = min(max(self._backoff * 2, 1.0), BACKOFF_MAX_SEC)
+            if self._stop.wait(self._backoff):
+                return
+
+    def _ship(self, records: list[dict]) -> bool:
+        """Отправить батч. False — БД недоступна (батч повторится целиком, idem_key защищает от дублей)."""
+        by_table: dict[str, list[tuple]] = {}
+        for rec in records:
+            table = rec.get("t")
+            row = rec.get("r")
+            if table not in self.tables or not isinstance(row, list) or len(row) != len(self.tables[table]):
+                self._stats["failed"] += 1
+                continue
+            by_table.setdefault(table, []).append(tuple(row) + (rec.get("k"),))
+        for table, rows in by_table.items():
+            err = self._insert(table, rows)
+            if err is None:
+                continue
+            if _is_connection_error(err):
+                return False
+            # ошибка данных — по одной строке, битые пропускаем
+            print(f"[DB] Insert {table} error: {err}")
+            for row in rows:
+                err = self._insert(table, [row])
+                if err is not None and _is_connection_error(err):
+                    return False
+                if err is not None:
+                    self._stats["failed"] += 1
+        return True
+
+    def _insert(self, table: str, rows: list[tuple]) -> Optional[Exception]:
+        pool = self._get_pool()
+        if pool is None:
+            return ConnectionError("db unavailable")
+        cols = self.tables[table] + ("idem_key",)
+        conn = None
+        t0 = time.perf_counter()
+        try:
+            from psycopg2.extras import execute_values
+            conn = pool.getconn()
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO {table} ({', '.join(cols)}) VALUES %s ON CONFLICT (idem_key) DO NOTHING",
+                    rows,
+                    page_size=self.batch_max,
+                )
+            conn.commit()
+        except Exception as e:
+            broken = _is_connection_error(e)
+            if conn is not None:
+                try:
+                    if not broken:
+                        conn.rollback()
+                    pool.putconn(conn, close=broken)
+                except Exception:
+                    pass
+            return e
+        pool.putconn(conn)
+        ms = (time.perf_counter() - t0) * 1000
+        m = self._latency[table]
+        m["batches"] += 1
+        m["rows"] += len(rows)
+        m["last_ms"] = ms
+        m["total_ms"] += ms
+        m["max_ms"] = max(m["max_ms"], ms)
+        self._stats["inserted"] += len(rows)
+        return None
+
+
+def make_writer(tables, get_pool, reset_pool, outbox_dir: Path) -> DbBatchWriter:
+    """Создать writer и зарегистрировать остановку реплеера при выходе процесса."""
+    w = DbBatchWriter(tables, get_pool, reset_pool, outbox_dir)
+    atexit.register(w.close)
+    return w
@@ -0,0 +1,156 @@
+"""Полнотекстовый поиск по диалогам: SQLite FTS5 внутри analytics_store.
+
+Индекс dialogs_fts (contentless, rowid = dialogs.id) по text_in / text_out пополняется
+вместе со вставкой диалога. Русский текст: регистр и ё→е нормализуются на входе и в запросе,
+слова запроса режутся до основы (грубый суффиксный стеммер) и ищутся как префикс —
+«Ирвина» найдёт «Ирвин», «Ирвином». Фильтры: since/until, линза, stage, user_id.
+"""
+
+import re
+import sqlite3
+from typing import Optional
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS dialogs_fts USING fts5 (
+    text_in, text_out,
+    content = '',
+    tokenize = 'unicode61',
+    prefix = '2 3'
+);
+"""
+SEARCH_LIMIT_MAX = 500
+SNIPPET_CHARS = 160
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PHRASE_RE = re.compile(r'"([^"]+)"')
+# Окончания (длинные первыми); основа не короче _STEM_MIN символов
+_RU_SUFFIXES = (
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией",
+    "ия", "ие", "ий", "ый", "ой", "ая", "яя", "ое", "ее", "ов", "ев", "ах", "ях",
+    "ом", "ем", "ам", "ям", "ую", "юю", "ы", "и", "а", "я", "о", "е", "у", "ю", "ь", "й",
+)
+_STEM_MIN = 4
+
+
+def normalize(text: str) -> str:
+    return (text or "").lower().replace("ё", "е")
+
+
+def stem(word: str) -> str:
+    for suf in _RU_SUFFIXES:
+        if word.endswith(suf) and len(word) - len(suf) >= _STEM_MIN:
+            return word[: -len(suf)]
+    return word
+
+
+def build_match(query: str) -> tuple[str, list[str]]:
+    """Запрос пользователя → (выражение FTS5 MATCH, основы для сниппета).
+
+    Слова объединяются через AND, "фраза в кавычках" ищется точно.
+    """
+    q = normalize(query)
+    parts: list[str] = []
+    terms: list[str] = []
+    for phrase in _PHRASE_RE.findall(q):
+        words = _WORD_RE.findall(phrase)
+        if words:
+            parts.append('"' + " ".join(words) + '"')
+            terms.append(words[0])
+    for word in _WORD_RE.findall(_PHRASE_RE.sub(" ", q)):
+        base = stem(word)
+        parts.append(f'"{base}"*')
+        terms.append(base)
+    return " AND ".join(parts), terms
+
+
+def ensure_index(conn: sqlite3.Connection) -> None:
+    """Создать FTS-индекс; при первом создании проиндексировать уже загруженные диалоги."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dialogs_fts'"
+    ).fetchone()
+    if exists:
+        return
+    with conn:
+        conn.executescript(FTS_SCHEMA)
+        cur = conn.cursor()
+        for rowid, text_in, text_out in conn.execute("SELECT id, text_in, text_out FROM dialogs").fetchall():
+            index_dialog(cur, rowid, text_in, text_out)
+
+
+def index_dialog(cur: sqlite3.Cursor, rowid: int, text_in: Optional[str], text_out: Optional[str]) -> None:
+    cur.execute(
+        "INSERT INTO dialogs_fts (rowid, text_in, text_out) VALUES (?, ?, ?)",
+        (rowid, normalize(text_in), normalize(text_out)),
+    )
+
+
+def _snippet(text: str, terms: list[str]) -> str:
+    low = normalize(text)
+    pos = -1
+    for t in terms:
+        pos = low.find(t)
+        if pos >= 0:
+            break
+    if pos < 0:
+        return text[:SNIPPET_CHARS]
+    start = max(0, pos - SNIPPET_CHARS // 3)
+    out = text[start:start + SNIPPET_CHARS].replace("\n", " ")
+    return ("…" if start else "") + out + ("…" if start + SNIPPET_CHARS < len(text) else "")
+
+
+def search(
+    conn: sqlite3.Connection,
+    query: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    lens: Optional[str] = None,
+    stage: Optional[str] = None,
+    user_id: Optional[int] = None,
+    field: Optional[str] = None,
+    limit: int = 50,
+) -> list[dict]:
+    """Найти реплики (новые первыми). field: text_in | text_out | None (оба)."""
+    match, terms = build_match(query)
+    if not match:
+        return []
+    if field in ("text_in", "text_out"):
+        match = f"{field} : ({match})"
+    where = ["dialogs_fts MATCH ?"]
+    params: list = [match]
+    if since:
+        where.append("d.ts >= ?")
+        params.append(since)
+    if until:
+        where.append("d.ts < ?")
+        params.append(until)
+    if stage:
+        where.append("d.stage = ?")
+        params.append(stage)
+    if user_id is not None:
+        where.append("d.user_id = ?")
+        params.append(user_id)
+    if lens:
+        where.append("EXISTS (SELECT 1 FROM dialog_lenses dl WHERE dl.dialog_id = d.id AND dl.lens = ?)")
+        params.append(lens)
+    params.append(max(1, min(int(limit), SEARCH_LIMIT_MAX)))
+    rows = conn.execute(
+        "SELECT d.id, d.ts, d.user_id, d.message_id, d.intent, d.stage, d.lenses, d.text_in, d.text_out"
+        " FROM dialogs_fts JOIN dialogs d ON d.id = dialogs_fts.rowid"
+        f" WHERE {' AND '.join(where)}"
+        " ORDER BY d.ts DESC LIMIT ?",
+        params,
+    ).fetchall()
+    return [
+        {
+            "id": r[0],
+            "ts": r[1],
+            "user_id": r[2],
+            "message_id": r[3],
+            "intent": r[4],
+            "stage": r[5],
+            "lenses": r[6],
+            "text_in": _snippet(r[7] or "", terms),
+            "text_out": _snippet(r[8] or "", terms),
+        }
+        for r in rows
+    ]
@@ -6,11 +6,15 @@ import re
 from typing import Optional
 
 
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+_SENT_ELLIPSIS_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
 def _split_sentences(text: str) -> list:
     """Разбить на предложения по . ! ?"""
     if not text or not text.strip():
         return []
-    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
+    return [s.strip() for s in _SENT_SPLIT_RE.split(text) if s.strip()]
 
 
 # v21.1: ban-opener — первое предложение (financial_rhythm / philosophy_pipeline / answer-first)
@@ -104,7 +108,9 @@ def final_send_clamp(
                 sentences.pop(1)
 
     # A2) Meta-tail hard drop — всегда, в любом месте ответа
-    sentences = [s for s in sentences if not any(p in s.lower() for p in META_TAIL_HARD_PHRASES)]
+    low = text.lower()
+    if any(p in low for p in META_TAIL_HARD_PHRASES):  # нет ни в тексте — нет ни в одном предложении
+        sentences = [s for s in sentences if not any(p in s.lower() for p in META_TAIL_HARD_PHRASES)]
 
     if not sentences:
         return text  # fallback: не обнулять ответ
@@ -160,7 +166,7 @@ def _strip_hanging_tail(text: str) -> str:
     s = (text or "").strip()
     if not s:
         return s
-    parts = re.split(r"(?<=[.!?…])\s+", s)
+    parts = _SENT_ELLIPSIS_SPLIT_RE.split(s)
     if len(parts) <= 1:
         # нет полных предложений — вернуть всё кроме висящего конца
         for end in HANGING_ENDINGS:
@@ -220,7 +226,7 @@ def ends_with_meta_tail(text: str) -> bool:
 def strip_last_meta_sentence(text: str) -> str:
     """Убрать последнее предложение (грубое удаление мета-хвоста)."""
     s = (text or "").strip()
-    parts = re.split(r"(?<=[.!?…])\s+", s)
+    parts = _SENT_ELLIPSIS_SPLIT_RE.split(s)
     if len(parts) <= 1:
         return s
     return " ".join(parts[:-1]).strip()
@@ -297,7 +303,7 @@ def _strip_last_sentence_p3(text: str) -> str:
     s = (text or "").strip()
     if not s:
         return s
-    parts = re.split(r"(?<=[.!?…])\s+", s)
+    parts = _SENT_ELLIPSIS_SPLIT_RE.split(s)
     if len(parts) <= 1:
         return s
     return " ".join(parts[:-1]).strip()
@@ -0,0 +1,169 @@
+"""Кольцевой буфер истории диалога с лимитом по байтам и append-only журналом.
+
+Хранит записи уже обрезанными до ENTRY_MAX_CHARS (pack_context больше не использует),
+держит на пользователя не больше MAX_ENTRIES записей и MAX_BYTES байт (utf-8).
+Журнал: PHI_HISTORY_PATH (по умолчанию /tmp/phi_bot_history.jsonl), одна строка — одно событие.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+HISTORY_PATH = Path(os.environ.get("PHI_HISTORY_PATH", "/tmp/phi_bot_history.jsonl"))
+ENTRY_MAX_CHARS = 400  # pack_context отдаёт в модель не больше 400 символов на запись
+MAX_ENTRIES = 20
+MAX_BYTES = int(os.environ.get("PHI_HISTORY_MAX_BYTES", "16384"))
+# Компактизация журнала: когда событий в N раз больше, чем живых записей
+COMPACT_RATIO = 4
+COMPACT_MIN_LINES = 2000
+COMPACT_CHECK_EVERY = 500
+
+
+def _entry_bytes(entry: dict) -> int:
+    return len((entry.get("content") or "").encode("utf-8"))
+
+
+def _persistable(user_id) -> bool:
+    """FIX A: synth user_id не персистим."""
+    return not str(user_id).startswith("synth:")
+
+
+class HistoryStore(dict):
+    """dict user_id -> [{"role","content"}, ...] с ring-buffer семантикой.
+
+    Совместим с прежним dict: pack_context и eval читают/пишут списки напрямую.
+    Журнал подключается явно (attach_journal) — eval и тесты ничего не пишут на диск.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._bytes: dict = {}
+        self._journal_path: Optional[Path] = None
+        self._journal = None
+        self._journal_lines = 0
+
+    def append(self, user_id, role: str, content: str) -> None:
+        """Добавить запись (обрезанную до ENTRY_MAX_CHARS) и вытеснить старые по лимитам."""
+        entry = {"role": role, "content": (content or "")[:ENTRY_MAX_CHARS]}
+        self._push(user_id, entry)
+        if _persistable(user_id):
+            self._write({"u": user_id, "r": role, "c": entry["content"]})
+
+    def reset(self, user_id) -> None:
+        """Очистить историю пользователя (/start)."""
+        self[user_id] = []
+        if _persistable(user_id):
+            self._write({"u": user_id, "reset": True})
+
+    def bytes_used(self, user_id) -> int:
+        hist = self.get(user_id) or []
+        return sum(_entry_bytes(h) for h in hist)
+
+    def _push(self, user_id, entry: dict) -> None:
+        hist = self.get(user_id)
+        if hist is None:
+            hist = []
+            self[user_id] = hist
+            self._bytes[user_id] = 0
+        elif user_id not in self._bytes:
+            # список подменили снаружи (eval) — пересчитать
+            self._bytes[user_id] = sum(_entry_bytes(h) for h in hist)
+        hist.append(entry)
+        used = self._bytes[user_id] + _entry_bytes(entry)
+        drop = 0
+        while len(hist) - drop > 1 and (len(hist) - drop > self.max_entries or used > self.max_bytes):
+            used -= _entry_bytes(hist[drop])
+            drop += 1
+        if drop:
+            del hist[:drop]
+        self._bytes[user_id] = used
+
+    def __setitem__(self, user_id, value) -> None:
+        super().__setitem__(user_id, value)
+        self._bytes.pop(user_id, None)
+
+    # --- журнал ---
+
+    def attach_journal(self, path: Path = HISTORY_PATH) -> None:
+        """Восстановить историю из журнала и дальше дописывать в него."""
+        self._journal_path = Path(path)
+        self._replay()
+        self._compact()
+
+    def _replay(self) -> None:
+        path = self._journal_path
+        if path is None or not path.exists():
+            return
+        lines = 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # оборванная последняя строка после падения
+                    lines += 1
+                    uid = rec.get("u")
+                    if uid is None:
+                        continue
+                    if rec.get("reset"):
+                        self[uid] = []
+                    else:
+                        self._push(uid, {"role": rec.get("r", ""), "content": rec.get("c", "")})
+        except OSError:
+            return
+        self._journal_lines = lines
+
+    def _compact(self) -> None:
+        """Переписать журнал живыми записями (tmp + os.replace)."""
+        path = self._journal_path
+        if path is None:
+            return
+        self._close_journal()
+        tmp = path.with_name(path.name + ".tmp")
+        lines = 0
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                for uid, hist in self.items():
+                    if not _persistable(uid):
+                        continue
+                    for h in hist:
+                        rec = {"u": uid, "r": h.get("role", ""), "c": h.get("content", "")}
+                        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                        lines += 1
+            os.replace(tmp, path)
+            self._journal_lines = lines
+        except OSError:
+            pass  # /tmp может быть read-only — работаем только в памяти
+
+    def _write(self, rec: dict) -> None:
+        if self._journal_path is None:
+            return
+        try:
+            if self._journal is None:
+                self._journal_path.parent.mkdir(parents=True, exist_ok=True)
+                self._journal = open(self._journal_path, "a", encoding="utf-8")
+            self._journal.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            self._journal_lines += 1
+        except OSError:
+            return
+        if self._journal_lines > COMPACT_MIN_LINES and self._journal_lines % COMPACT_CHECK_EVERY == 0:
+            live = sum(len(h) for h in self.values())
+            if self._journal_lines > live * COMPACT_RATIO:
+                self._compact()
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            try:
+                self._journal.close()
+            except OSError:
+                pass
+            self._journal = None
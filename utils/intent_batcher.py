@@ -0,0 +1,76 @@
+"""Micro-batching классификации интента между параллельными сообщениями.
+
+submit(text) копит запросы до max_batch или max_wait_ms, затем один batch_fn(texts) -> [результат]
+в потоке (синхронный клиент OpenAI) и раздаёт результаты ожидающим. Одинаковые тексты в пачке
+классифицируются один раз. Ошибка batch_fn или ответ не той длины — None каждому: вызывающий
+решает сам (bot.llm_classify_topic_intent_batched спросит модель по одному, как раньше).
+
+PHI_INTENT_BATCH=0 — выключено, PHI_INTENT_BATCH_MAX — размер пачки, PHI_INTENT_BATCH_WAIT_MS — ожидание.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Callable, Optional
+
+BATCH_ENABLED = os.environ.get("PHI_INTENT_BATCH", "1") != "0"
+BATCH_MAX = int(os.environ.get("PHI_INTENT_BATCH_MAX", "16"))
+BATCH_WAIT_MS = float(os.environ.get("PHI_INTENT_BATCH_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """Одна очередь на event loop; batch_fn(list) -> list той же длины."""
+
+    def __init__(self, batch_fn: Callable[[list], list], max_batch: int = BATCH_MAX, max_wait_ms: float = BATCH_WAIT_MS, name: str = "intent"):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self._pending: list = []  # [(item, future)]
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._stats = {"submitted": 0, "batches": 0, "items": 0, "max_size": 0, "errors": 0, "last_ms": None}
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+        self._stats["submitted"] += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: list) -> None:
+        unique = list(dict.fromkeys(item for item, _ in batch))
+        t0 = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self.batch_fn, unique)
+            if len(results) != len(unique):
+                raise ValueError(f"{len(results)} результатов на {len(unique)} элементов")
+            by_item = dict(zip(unique, results))
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"[intent_batcher] {self.name} batch of {len(unique)} error: {e}")
+            by_item = {}
+        self._stats["batches"] += 1
+        self._stats["items"] += len(unique)
+        self._stats["max_size"] = max(self._stats["max_size"], len(unique))
+        self._stats["last_ms"] = round((time.perf_counter() - t0) * 1000)
+        for item, fut in batch:
+            if not fut.done():  # ожидающий мог быть отменён
+                fut.set_result(by_item.get(item))
+
+    def stats(self) -> dict:
+        s = dict(self._stats, max_batch=self.max_batch, max_wait_ms=self.max_wait_ms, pending=len(self._pending))
+        s["avg_size"] = round(s["items"] / s["batches"], 2) if s["batches"] else None
+        s["calls_saved"] = s["submitted"] - s["batches"]
+        return s
@@ -0,0 +1,203 @@
+"""Кэш решений классификаторов интента: LRU в памяти перед компактной SQLite-таблицей с TTL.
+
+Ключ — (ns, нормализованный текст): нижний регистр, ё→е, схлопнутые пробелы (km.VIEWS["yo"]).
+Текст хранится как есть, без хэша: записи intent_topic — заодно разметка для
+scripts/train_topic_classifier.py. Значение — JSON. Запись старше TTL — промах; просроченные
+удаляются при attach() и каждые PURGE_EVERY записей.
+До attach() — только память: eval и скрипты ничего не пишут на диск. get/put ходят в SQLite
+синхронно; из event loop — peek() (только память), а get/put — через asyncio.to_thread.
+
+PHI_INTENT_CACHE_PATH (по умолчанию /tmp/phi_bot_intent_cache.sqlite3), PHI_INTENT_CACHE_SIZE —
+записей в памяти, PHI_INTENT_CACHE_TTL_DAYS — срок жизни (0 — бессрочно).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from utils import keyword_matcher as km
+
+CACHE_PATH = Path(os.environ.get("PHI_INTENT_CACHE_PATH", "/tmp/phi_bot_intent_cache.sqlite3"))
+MAX_ENTRIES = int(os.environ.get("PHI_INTENT_CACHE_SIZE", "4096"))
+TTL_SEC = float(os.environ.get("PHI_INTENT_CACHE_TTL_DAYS", "30")) * 86400
+PURGE_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intent_cache (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    ts REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_intent_cache_ts ON intent_cache (ts);
+"""
+
+_MISSING = object()
+
+
+def normalize_key(text: str) -> str:
+    return km.VIEWS["yo"](text or "")
+
+
+class IntentCache:
+    """get/put по (ns, текст). Потокобезопасен: одно соединение SQLite под замком."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_sec: float = TTL_SEC):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._mem: OrderedDict = OrderedDict()  # (ns, key) -> (value, ts)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._path: Optional[Path] = None
+        self._puts_since_purge = 0
+        self._stats = {"hits_mem": 0, "hits_db": 0, "misses": 0, "expired": 0, "puts": 0, "purged": 0, "errors": 0}
+
+    # --- хранилище ---
+
+    def attach(self, path: Path = CACHE_PATH) -> None:
+        """Подключить SQLite (создать таблицу, удалить просроченные). Ошибка — работаем в памяти."""
+        path = Path(path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            print(f"[intent_cache] attach {path} error: {e}")
+            return
+        with self._lock:
+            self._conn, self._path = conn, path
+            self._purge()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _expired(self, ts: float, now: float) -> bool:
+        return self.ttl_sec > 0 and now - ts > self.ttl_sec
+
+    def _purge(self) -> None:
+        self._puts_since_purge = 0
+        if self._conn is None or self.ttl_sec <= 0:
+            return
+        try:
+            with self._conn:
+                cur = self._conn.execute("DELETE FROM intent_cache WHERE ts < ?", (time.time() - self.ttl_sec,))
+            self._stats["purged"] += cur.rowcount
+        except sqlite3.Error as e:
+            self._stats["errors"] += 1
+            print(f"[intent_cache] purge error: {e}")
+
+    def _remember(self, mk: tuple, value: Any, ts: float) -> None:
+        self._mem[mk] = (value, ts)
+        self._mem.move_to_end(mk)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    # --- API ---
+
+    def peek(self, ns: str, text: str, default: Any = None) -> Any:
+        """Только память, без SQLite — можно звать из event loop. Промах не считается:
+        за ним идёт get() (в потоке), который досмотрит диск и учтёт исход."""
+        mk = (ns, normalize_key(text))
+        with self._lock:
+            hit = self._mem.get(mk, _MISSING)
+            if hit is _MISSING or self._expired(hit[1], time.time()):
+                return default
+            self._mem.move_to_end(mk)
+            self._stats["hits_mem"] += 1
+            return hit[0]
+
+    def get(self, ns: str, text: str, default: Any = None) -> Any:
+        key = normalize_key(text)
+        mk = (ns, key)
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(mk, _MISSING)
+            if hit is not _MISSING:
+                value, ts = hit
+                if not self._expired(ts, now):
+                    self._mem.move_to_end(mk)
+                    self._stats["hits_mem"] += 1
+                    return value
+                del self._mem[mk]
+                self._stats["expired"] += 1
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, ts FROM intent_cache WHERE ns = ? AND key = ?", (ns, key)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    row = None
+                    self._stats["errors"] += 1
+                    print(f"[intent_cache] get error: {e}")
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        value = json.loads(row[0])
+                        self._remember(mk, value, row[1])
+                        self._stats["hits_db"] += 1
+                        return value
+                    self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return default
+
+    def put(self, ns: str, text: str, value: Any) -> None:
+        key = normalize_key(text)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember((ns, key), value, now)
+            self._stats["puts"] += 1
+            if self._conn is None:
+                return
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO intent_cache (ns, key, value, ts) VALUES (?, ?, ?, ?)",
+                        (ns, key, json.dumps(value, ensure_ascii=False), now),
+                    )
+            except sqlite3.Error as e:
+                self._stats["errors"] += 1
+                print(f"[intent_cache] put error: {e}")
+                return
+            self._puts_since_purge += 1
+            if self._puts_since_purge >= PURGE_EVERY:
+                self._purge()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["mem_entries"] = len(self._mem)
+            s["path"] = str(self._path) if self._conn is not None else None
+            if self._conn is not None:
+                try:
+                    s["db_entries"] = self._conn.execute("SELECT COUNT(*) FROM intent_cache").fetchone()[0]
+                except sqlite3.Error:
+                    s["db_entries"] = None
+        lookups = s["hits_mem"] + s["hits_db"] + s["misses"]
+        s["hit_rate"] = round((s["hits_mem"] + s["hits_db"]) / lookups, 3) if lookups else None
+        return s
+
+
+def iter_entries(path: Path, ns: str, ttl_sec: float = TTL_SEC) -> Iterator[tuple[str, Any]]:
+    """(нормализованный текст, значение) живых записей ns — только чтение (обучение классификатора)."""
+    path = Path(path)
+    if not path.exists():
+        return
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+    try:
+        since = time.time() - ttl_sec if ttl_sec > 0 else 0.0
+        for key, value in conn.execute("SELECT key, value FROM intent_cache WHERE ns = ? AND ts >= ?", (ns, since)):
+            yield key, json.loads(value)
+    finally:
+        conn.close()
@@ -3,6 +3,8 @@
 import re
 from typing import Any, Optional
 
+from utils import keyword_matcher as km
+
 # v19: блокируем philosophy при этих темах (деньги, тревога — в finance/warmup)
 PHILOSOPHY_INTENT_BLOCK = ("тревог", "тревож", "неопредел", "деньг", "бедност", "богатств")
 
@@ -63,6 +65,15 @@ ACK_CLOSE_PHRASES = (
 )
 
 
+_PHILOSOPHY_BLOCK = km.register("intent_gate.philosophy_block", PHILOSOPHY_INTENT_BLOCK)
+_PHILOSOPHY_KEYS = km.register("intent_gate.philosophy_keys", PHILOSOPHY_INTENT_KEYS)
+_UNCLEAR = km.register("intent_gate.unclear", UNCLEAR_MARKERS)
+_RELIGION_ANCHORS = km.register("intent_gate.religion_anchors", RELIGION_ANCHORS)
+_RELIGION_ALWAYS = km.register("intent_gate.religion_always", ORIENTATION_RELIGION_ALWAYS)
+_FAITH = km.register("intent_gate.faith", FAITH_MARKERS_NEED_ANCHOR)
+_TOPIC = km.register("intent_gate.topic", TOPIC_MARKERS)
+
+
 def is_ack_close_intent(text: str) -> bool:
     """True если короткое подтверждение/закрытие — ack, не orientation."""
     if not text:
@@ -85,12 +96,11 @@ def has_religion_in_orientation_context(text: str) -> bool:
     «Стыд/вина/совест» и якоря — всегда True (проверяем первыми)."""
     if not text:
         return False
-    t = (text or "").strip().lower()
-    if any(m in t for m in ORIENTATION_RELIGION_ALWAYS):
+    match = km.scan_message(text)
+    if match.has(_RELIGION_ALWAYS):
         return True
-    has_anchor = any(a in t for a in RELIGION_ANCHORS)
-    has_faith = any(m in t for m in FAITH_MARKERS_NEED_ANCHOR) or t.startswith("вера ") or t.startswith("верой ") or t.startswith("веру ") or t.startswith("верю ")
-    return has_faith and has_anchor
+    # «вера …» в начале текста — частный случай FAITH_MARKERS (" вера" без пробела перед)
+    return match.has(_RELIGION_ANCHORS) and (match.has(_FAITH) or text.strip().lower().startswith(("вера ", "верой ", "веру ", "верю ")))
 
 
 def is_unclear_message(text: str) -> bool:
@@ -106,11 +116,12 @@ def is_unclear_message(text: str) -> bool:
         return False
     if len(t) >= 160:
         return False
-    if any(m in t for m in TOPIC_MARKERS):
+    match = km.scan_message(text)
+    if match.has(_TOPIC):
         return False
     if len(t) <= 70:
         return True
-    if any(m in t for m in UNCLEAR_MARKERS):
+    if match.has(_UNCLEAR):
         return True
     return False
 
@@ -134,13 +145,13 @@ EXPLAIN_REQUEST_TRIGGERS = (
 )
 
 
+_EXPLAIN_REQUEST = km.register("intent_gate.explain_request", EXPLAIN_REQUEST_TRIGGERS, view="dspace")
+
+
 def is_explain_request(text: str) -> bool:
     """Fix Pack B: True если запрос на разъяснение/расширение — explain_mode.
     Расширенный список триггеров с учётом contains."""
-    if not text:
-        return False
-    t = (text or "").strip().lower().replace("  ", " ")
-    return any(tr in t for tr in EXPLAIN_REQUEST_TRIGGERS)
+    return km.has(_EXPLAIN_REQUEST, text)
 
 
 def is_expand_request(text: str) -> bool:
@@ -160,12 +171,12 @@ def is_philosophy_intent(text: str) -> bool:
     """True если вопрос философский/когнитивный. v19: блок при тревоге/деньгах."""
     if not text or len(text.strip()) < 4:
         return False
-    t = (text or "").lower()
-    if any(k in t for k in PHILOSOPHY_INTENT_BLOCK):
+    match = km.scan_message(text)
+    if match.has(_PHILOSOPHY_BLOCK):
         return False
-    if any(k in t for k in PHILOSOPHY_INTENT_KEYS):
+    if match.has(_PHILOSOPHY_KEYS):
         return True
-    if HOW_PATTERN.search(t):
+    if HOW_PATTERN.search(text.lower()):
         return True
     return False
 
@@ -1,5 +1,7 @@
 """Расширенное определение философского вопроса: философия + конфессии (сравнительная антропология)."""
 
+from utils import keyword_matcher as km
+
 # Прямые триггеры — обход triage. Используем stems: «про философ» ловит «про философов», «про философию» и т.д.
 PHILOSOPHY_DIRECT_TRIGGERS = [
     "про философ", "о философ", "про философи", "о философи",
@@ -10,12 +12,14 @@ PHILOSOPHY_DIRECT_TRIGGERS = [
 ]
 
 
+_DIRECT_TRIGGERS = km.register("philosophy_question.direct", PHILOSOPHY_DIRECT_TRIGGERS)
+
+
 def is_direct_philosophy_intent(text: str) -> bool:
     """True если явный запрос на философский разговор — обход triage/orientation."""
     if not text or not (text or "").strip():
         return False
-    t = (text or "").strip().lower()
-    return any(k in t for k in PHILOSOPHY_DIRECT_TRIGGERS)
+    return km.has(_DIRECT_TRIGGERS, text)
 
 
 # Широкие stems: любой из них в тексте → философский контекст
@@ -28,9 +32,11 @@ PHILOSOPHY_TRIGGERS = (
 )
 
 
+_TRIGGERS = km.register("philosophy_question.triggers", PHILOSOPHY_TRIGGERS)
+
+
 def is_philosophy_question(text: str) -> bool:
     """True если вопрос про философию или конфессии (сравнительная антропология)."""
     if not text or len(text.strip()) < 3:
         return False
-    t = (text or "").lower().strip()
-    return any(tr in t for tr in PHILOSOPHY_TRIGGERS)
+    return km.has(_TRIGGERS, text)
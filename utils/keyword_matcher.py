@@ -0,0 +1,236 @@
+"""Единый автомат ключевых слов (Aho-Corasick) для всех детекторов сообщения.
+
+Словари детекторов (линзы router, триггеры bot, маркеры pattern_governor / intent_gate /
+intent_* …) регистрируются при импорте модуля: register(name, patterns, view). Перед первым
+сканом все шаблоны собираются в один автомат (DFA с уже разрешёнными fail-переходами),
+сообщение проходит его за один проход посимвольно и даёт битовую маску найденных шаблонов.
+Детекторы читают маску: has / count / hits — вместо десятков `any(p in t for p in …)`.
+
+view — нормализация, в которой словарь искался раньше (поведение детекторов не меняется):
+  lower  — strip().lower()
+  dspace — lower + replace("  ", " ")            (utils.intent_gate.is_explain_request)
+  ws     — lower + схлопнутые пробелы            (intent_philosophy_topic)
+  yo     — ws + ё→е                              (intent_topic_v2, intent_explain_ru)
+  punct  — lower, пунктуация кроме «-» → пробел   (router.select_lenses)
+  cap    — yo, вся пунктуация → пробел, схлопнуть (intent_capabilities)
+Автомат проходит один раз — по lower. Остальные представления считаются лениво, при первом
+обращении: совпало с lower (обычный случай) — берётся та же маска; отличается (пунктуация, ё,
+двойные пробелы) — проверяются только шаблоны словарей этого представления (их единицы–десятки).
+Результат скана кэшируется по тексту (LRU): детекторы одного хода автомат не повторяют.
+Сами представления тоже общие: MessageMatch.view(name) — _norm детекторов берут текст отсюда.
+
+Замер: python scripts/bench_detectors.py
+"""
+
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Callable, NamedTuple
+
+SCAN_CACHE_SIZE = 1024
+
+_WS_RE = re.compile(r"\s+")
+_PUNCT_KEEP_DASH_RE = re.compile(r"[^\w\s\-]")
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def _view_lower(text: str) -> str:
+    return text.strip().lower()
+
+
+def _view_ws(text: str) -> str:
+    return _WS_RE.sub(" ", text.strip().lower())
+
+
+def _view_cap(text: str) -> str:
+    t = _PUNCT_RE.sub(" ", text.lower().strip().replace("ё", "е"))
+    return _WS_RE.sub(" ", t).strip()
+
+
+VIEWS: dict[str, Callable[[str], str]] = {
+    "lower": _view_lower,
+    "dspace": lambda t: _view_lower(t).replace("  ", " "),
+    "ws": _view_ws,
+    "yo": lambda t: _view_ws(t).replace("ё", "е"),
+    "punct": lambda t: _PUNCT_KEEP_DASH_RE.sub(" ", t.lower().strip()),
+    "cap": _view_cap,
+}
+
+
+class Vocab(NamedTuple):
+    name: str
+    view: str
+    patterns: tuple
+    bits: tuple  # бит каждого шаблона (в порядке patterns)
+    mask: int
+    unique: bool  # без повторов — count() через popcount
+
+
+class _Automaton:
+    """Бор шаблонов + fail-ссылки, развёрнутые в полный DFA: переход — один dict.get на символ."""
+
+    def __init__(self, patterns: list[str]):
+        delta: list[dict] = [{}]
+        out = [0]
+        for i, p in enumerate(patterns):
+            s = 0
+            for ch in p:
+                nxt = delta[s].get(ch)
+                if nxt is None:
+                    nxt = len(delta)
+                    delta.append({})
+                    out.append(0)
+                    delta[s][ch] = nxt
+                s = nxt
+            out[s] |= 1 << i
+        fail = [0] * len(delta)
+        queue = deque(delta[0].values())
+        while queue:
+            s = queue.popleft()
+            # переходы fail-состояния уже полные (BFS): наследуем недостающие
+            for ch, t in delta[s].items():
+                queue.append(t)
+                f = delta[fail[s]].get(ch, 0) if s else 0
+                fail[t] = f if f != t else 0
+                out[t] |= out[fail[t]]
+            if s:
+                for ch, t in delta[fail[s]].items():
+                    delta[s].setdefault(ch, t)
+        self.delta = delta
+        self.out = out
+        self.states = len(delta)
+
+    def scan(self, text: str) -> int:
+        delta, out = self.delta, self.out
+        s = mask = 0
+        for ch in text:
+            s = delta[s].get(ch, 0)
+            if s:
+                mask |= out[s]
+        return mask
+
+
+_lock = threading.Lock()
+_patterns: list[str] = []
+_bit_of: dict[str, int] = {}
+_vocabs: dict[str, Vocab] = {}
+_view_patterns: dict[str, dict[str, int]] = {v: {} for v in VIEWS}  # view -> {шаблон: бит}
+_automaton = None
+
+
+def register(name: str, patterns, view: str = "lower") -> Vocab:
+    """Зарегистрировать словарь детектора (вызывается при импорте модуля)."""
+    global _automaton
+    if view not in VIEWS:
+        raise ValueError(f"unknown view: {view}")
+    patterns = tuple(p for p in patterns if p)
+    with _lock:
+        bits = []
+        for p in patterns:
+            if p not in _bit_of:
+                _bit_of[p] = len(_patterns)
+                _patterns.append(p)
+                _automaton = None  # пересобрать при следующем скане
+            bits.append(1 << _bit_of[p])
+            _view_patterns[view][p] = bits[-1]
+        mask = 0
+        for b in bits:
+            mask |= b
+        vocab = Vocab(name, view, patterns, tuple(bits), mask, len(set(patterns)) == len(patterns))
+        _vocabs[name] = vocab
+    scan_message.cache_clear()
+    return vocab
+
+
+def _get_automaton() -> _Automaton:
+    global _automaton
+    a = _automaton
+    if a is None:
+        with _lock:
+            if _automaton is None:
+                _automaton = _Automaton(_patterns)
+            a = _automaton
+    return a
+
+
+class MessageMatch:
+    """Маски найденных шаблонов по представлениям одного текста (представления — лениво)."""
+
+    __slots__ = ("text", "lower", "masks", "views")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lower = _view_lower(text)
+        self.masks = {"lower": _get_automaton().scan(self.lower)}
+        self.views = {"lower": self.lower}
+
+    def view(self, name: str) -> str:
+        """Нормализованный текст (считается один раз на текст)."""
+        v = self.views.get(name)
+        if v is None:
+            v = self.views[name] = VIEWS[name](self.text)
+        return v
+
+    def mask(self, view: str) -> int:
+        m = self.masks.get(view)
+        if m is None:
+            v = self.view(view)
+            if v == self.lower:
+                m = self.masks["lower"]
+            else:
+                m = 0
+                for p, bit in _view_patterns[view].items():
+                    if p in v:
+                        m |= bit
+            self.masks[view] = m
+        return m
+
+    def has(self, vocab: Vocab) -> bool:
+        return bool(self.mask(vocab.view) & vocab.mask)
+
+    def count(self, vocab: Vocab) -> int:
+        """Сколько шаблонов словаря нашлось (повторы в словаре считаются, как в sum(... for p in list))."""
+        m = self.mask(vocab.view)
+        if vocab.unique:
+            return bin(m & vocab.mask).count("1")
+        return sum(1 for b in vocab.bits if m & b)
+
+    def hits(self, vocab: Vocab) -> list[str]:
+        """Найденные шаблоны в порядке словаря."""
+        m = self.mask(vocab.view)
+        if not m & vocab.mask:
+            return []
+        return [p for p, b in zip(vocab.patterns, vocab.bits) if m & b]
+
+
+@lru_cache(maxsize=SCAN_CACHE_SIZE)
+def scan_message(text: str) -> MessageMatch:
+    """Один проход автомата по тексту (кэш по тексту)."""
+    return MessageMatch(text)
+
+
+def has(vocab: Vocab, text) -> bool:
+    return bool(text) and scan_message(text).has(vocab)
+
+
+def count(vocab: Vocab, text) -> int:
+    return scan_message(text).count(vocab) if text else 0
+
+
+def hits(vocab: Vocab, text) -> list[str]:
+    return scan_message(text).hits(vocab) if text else []
+
+
+def stats() -> dict:
+    info = scan_message.cache_info()
+    return {
+        "vocabs": len(_vocabs),
+        "patterns": len(_patterns),
+        "states": _automaton.states if _automaton is not None else None,
+        "scan_cache": {"hits": info.hits, "misses": info.misses, "size": info.currsize},
+    }
+
+
+def vocabs() -> dict[str, Vocab]:
+    return dict(_vocabs)
@@ -0,0 +1,224 @@
+"""Локальный роутер линз: TF-IDF по символьным n-граммам, один центроид на линзу.
+
+Включается PHI_LENS_ROUTER=tfidf (нужен numpy; без него — только ключевые слова router.select_lenses).
+Документ линзы = markdown линзы + ключевые слова (LENS_KEYWORDS, с весом KEYWORD_REPEAT) + реплики
+eval-сценариев: размеченные по target_topic (TOPIC_LENSES) и те, что ключевой роутер относит к линзе.
+Реплики, почти совпадающие со входами tests/cases.json (NEAR_DUP_OVERLAP их слов), в центроиды не идут —
+ожидания "lenses" проверяют роутер на отложенных фразах. Признаки — n-граммы символов
+(NGRAM_RANGE) внутри слов с границами « слово », tf сублинейный, idf по документам линз,
+строки L2-нормированы — строка матрицы и есть центроид линзы.
+
+Сообщение: вектор n-грамм → одно умножение матрицы на вектор → косинус с каждой линзой.
+router.select_lenses смешивает: счёт = совпавшие ключевые слова + TFIDF_WEIGHT · косинус
+(косинус ниже MIN_SIM не учитывается). Индекс строится лениво и пересобирается при смене линз.
+
+Проверка и замер: python scripts/bench_lens_router.py --check (ожидания "lenses" в tests/cases.json)
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional: без numpy роутер выключен
+    np = None
+
+from utils import keyword_matcher as km
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SCENARIOS_DIR = PROJECT_ROOT / "eval" / "scenarios"
+SYNTH_SCENARIOS_PATH = PROJECT_ROOT / "eval" / "synth_scenarios.yaml"
+HOLDOUT_CASES_PATH = PROJECT_ROOT / "tests" / "cases.json"
+
+LENS_ROUTER = os.environ.get("PHI_LENS_ROUTER", "keywords").strip().lower()
+NGRAM_RANGE = (3, 5)
+KEYWORD_REPEAT = 3
+MIN_SIM = float(os.environ.get("PHI_LENS_TFIDF_MIN_SIM", "0.12"))
+TFIDF_WEIGHT = float(os.environ.get("PHI_LENS_TFIDF_WEIGHT", "2.0"))
+FALLBACK_LENS = "lens_general"  # запасная линза — не кандидат роутера
+# реплика сценария — почти дубль входа cases.json, если содержит такую долю его слов
+NEAR_DUP_OVERLAP = 0.6
+# target_topic synth-сценариев → линза (разметка seed_message); темы без линзы не размечаются
+TOPIC_LENSES = {
+    "finance": "lens_finance_rhythm",
+    "insomnia": "lens_control_scope",
+    "anger": "lens_psychology",
+    "meaning": "lens_mortality_focus",
+    "choice": "lens_role_position",
+    "overload": "lens_micro_agency",
+}
+
+_WORD_RE = re.compile(r"[^\W\d_]+|\d+")
+
+
+if LENS_ROUTER == "tfidf" and np is None:
+    print("[lens_router] PHI_LENS_ROUTER=tfidf, но numpy не установлен — линзы только по ключевым словам")
+
+
+def enabled() -> bool:
+    return LENS_ROUTER == "tfidf" and np is not None
+
+
+@lru_cache(maxsize=8192)
+def _word_ngrams(word: str) -> tuple:
+    w = f" {word} "
+    lo, hi = NGRAM_RANGE
+    return tuple(w[i:i + n] for n in range(lo, hi + 1) for i in range(len(w) - n + 1))
+
+
+def _ngrams(text: str) -> Counter:
+    grams: Counter = Counter()
+    for word in _WORD_RE.findall(km.VIEWS["yo"](text)):
+        grams.update(_word_ngrams(word))
+    return grams
+
+
+def _load_yaml(path: Path):
+    try:
+        import yaml
+    except ImportError:
+        return None
+    try:
+        return yaml.safe_load(path.read_text(encoding="utf-8"))
+    except (OSError, yaml.YAMLError) as e:
+        print(f"[lens_router] {path.name}: {e}")
+        return None
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall(km.VIEWS["yo"](text)))
+
+
+def _holdout_words() -> list[set]:
+    """Слова входов tests/cases.json — отложенная выборка роутера (нет файла — пусто)."""
+    try:
+        cases = json.loads(HOLDOUT_CASES_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+    return [w for w in (_words(c.get("input") or "") for c in cases if isinstance(c, dict)) if w]
+
+
+def _near_duplicate(text: str, holdout: list[set]) -> bool:
+    words = _words(text)
+    return any(len(h & words) >= NEAR_DUP_OVERLAP * len(h) for h in holdout)
+
+
+def _scenario_texts() -> list[tuple[str, Optional[str]]]:
+    """(реплика, линза или None) из eval-сценариев: turns персон и seed_message synth-сценариев
+    (линза — по target_topic через TOPIC_LENSES), без почти-дублей входов cases.json.
+    Нет yaml или файлов — пусто."""
+    texts = []
+    for path in sorted(SCENARIOS_DIR.glob("*.yaml")):
+        for sc in (_load_yaml(path) or {}).get("scenarios") or []:
+            texts.extend((t, None) for t in sc.get("turns") or [] if isinstance(t, str))
+    for sc in _load_yaml(SYNTH_SCENARIOS_PATH) or []:
+        if isinstance(sc, dict) and isinstance(sc.get("seed_message"), str):
+            texts.append((sc["seed_message"], TOPIC_LENSES.get(sc.get("target_topic"))))
+    holdout = _holdout_words()
+    return [(t, lens) for t, lens in texts if not _near_duplicate(t, holdout)]
+
+
+def lens_documents(lenses: dict[str, str], keywords: dict[str, list], keyword_select) -> dict[str, str]:
+    """Текст документа каждой линзы. keyword_select(text) -> линзы по ключевым словам (разметка сценариев)."""
+    docs = {}
+    for name, content in lenses.items():
+        if name == FALLBACK_LENS:
+            continue
+        kw = " ".join(keywords.get(name, []))
+        docs[name] = "\n".join([content or ""] + [kw] * KEYWORD_REPEAT)
+    for text, lens in _scenario_texts():
+        for name in {lens, *keyword_select(text)}:
+            if name in docs:
+                docs[name] += "\n" + text
+    return docs
+
+
+class TfidfLensIndex:
+    """Матрица центроидов линз (линзы × n-граммы) и idf словаря."""
+
+    def __init__(self, docs: dict[str, str]):
+        self.names = list(docs)
+        counts = [_ngrams(docs[n]) for n in self.names]
+        df: Counter = Counter()
+        for c in counts:
+            df.update(c.keys())
+        self.vocab = {g: i for i, g in enumerate(sorted(df))}
+        n_docs = len(self.names)
+        self.idf = np.array(
+            [math.log((1 + n_docs) / (1 + df[g])) + 1.0 for g in sorted(df)], dtype=np.float32
+        )
+        self.idf_max = math.log(1 + n_docs) + 1.0
+        matrix = np.zeros((n_docs, len(self.vocab)), dtype=np.float32)
+        for row, c in enumerate(counts):
+            for g, tf in c.items():
+                j = self.vocab[g]
+                matrix[row, j] = (1.0 + math.log(tf)) * self.idf[j]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms > 0, norms, 1.0)
+
+    def similarities(self, text: str) -> dict[str, float]:
+        """Косинус сообщения с центроидом каждой линзы."""
+        grams = _ngrams(text)
+        idx, weights = [], []
+        for g, tf in grams.items():
+            j = self.vocab.get(g)
+            if j is not None:
+                idx.append(j)
+                weights.append(1.0 + math.log(tf))
+        if not idx:
+            return {}
+        q = np.asarray(weights, dtype=np.float32) * self.idf[idx]
+        # норма по всем n-граммам сообщения: незнакомые (idf максимальный) тоже «размывают» сходство
+        oov = sum((1.0 + math.log(tf)) ** 2 for g, tf in grams.items() if g not in self.vocab)
+        norm = math.sqrt(float(q @ q) + oov * self.idf_max ** 2)
+        sims = self.matrix[:, idx] @ (q / norm)
+        return dict(zip(self.names, sims.tolist()))
+
+
+_lock = threading.Lock()
+_index: Optional[TfidfLensIndex] = None
+_index_key = None
+
+
+def get_index(lenses: dict[str, str], keywords: dict[str, list], keyword_select) -> Optional[TfidfLensIndex]:
+    """Индекс по текущему набору линз (пересборка, если содержимое линз сменилось)."""
+    global _index, _index_key
+    if not enabled():
+        return None
+    key = hash(tuple(lenses.items()))
+    if _index is None or key != _index_key:
+        with _lock:
+            if _index is None or key != _index_key:
+                _index = TfidfLensIndex(lens_documents(lenses, keywords, keyword_select))
+                _index_key = key
+                _similarities.cache_clear()
+    return _index
+
+
+@lru_cache(maxsize=512)
+def _similarities(text: str) -> tuple:
+    return tuple(_index.similarities(text).items()) if _index is not None else ()
+
+
+def similarities(text: str) -> dict[str, float]:
+    """Косинусы по текущему индексу (кэш по тексту)."""
+    return dict(_similarities(text or ""))
+
+
+def stats() -> dict:
+    info = _similarities.cache_info()
+    return {
+        "router": LENS_ROUTER,
+        "enabled": enabled(),
+        "numpy": np is not None,
+        "lenses": len(_index.names) if _index is not None else 0,
+        "features": len(_index.vocab) if _index is not None else 0,
+        "cache": {"hits": info.hits, "misses": info.misses},
+    }
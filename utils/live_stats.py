@@ -0,0 +1,152 @@
+"""Живые агрегаты, обновляемые в момент логирования (без скана логов).
+
+Окно из последних WINDOW_DAYS дней (UTC): на день — число реплик, счётчики линз,
+intent'ов, stage, фидбек useful/not_useful, safety по причинам, ретраи LLM и события.
+Снимок хранится в logs/live_stats.json (atomic replace) и подхватывается при рестарте.
+Запрос агрегата — O(дней окна), не O(логов).
+"""
+
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+WINDOW_DAYS = int(os.environ.get("PHI_LIVE_STATS_DAYS", "30"))
+_COUNTERS = ("lenses", "intents", "stages", "feedback", "safety", "events")
+_SCALARS = ("turns", "llm_retries", "expand_retries")
+
+
+def _day(ts: Optional[str] = None) -> str:
+    return (ts or datetime.now(timezone.utc).isoformat())[:10]
+
+
+def _empty_bucket() -> dict:
+    b = {k: 0 for k in _SCALARS}
+    b.update({k: Counter() for k in _COUNTERS})
+    return b
+
+
+class LiveStats:
+    """Потокобезопасные счётчики по дням; запись — O(1), старые дни вытесняются."""
+
+    def __init__(self, path: Optional[Path] = None, window_days: int = WINDOW_DAYS):
+        self.path = Path(path) if path else None
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._days: dict[str, dict] = {}
+        self._dirty = False
+        self._load()
+
+    # --- запись (из logger) ---
+
+    def _bucket(self, ts: Optional[str]) -> dict:
+        day = _day(ts)
+        b = self._days.get(day)
+        if b is None:
+            b = self._days[day] = _empty_bucket()
+            self._evict()
+        self._dirty = True
+        return b
+
+    def _evict(self) -> None:
+        if len(self._days) <= self.window_days:
+            return
+        for day in sorted(self._days)[: len(self._days) - self.window_days]:
+            del self._days[day]
+
+    def record_turn(
+        self,
+        ts: Optional[str],
+        lenses: Iterable[str],
+        intent: Optional[str] = None,
+        stage: Optional[str] = None,
+        llm_retries: int = 0,
+        expand_retry: bool = False,
+    ) -> None:
+        with self._lock:
+            b = self._bucket(ts)
+            b["turns"] += 1
+            b["lenses"].update(str(x) for x in lenses or ())
+            b["intents"][intent or "none"] += 1
+            if stage:
+                b["stages"][stage] += 1
+            b["llm_retries"] += int(llm_retries or 0)
+            b["expand_retries"] += 1 if expand_retry else 0
+
+    def record_feedback(self, ts: Optional[str], rating: str) -> None:
+        with self._lock:
+            self._bucket(ts)["feedback"][rating] += 1
+
+    def record_safety(self, ts: Optional[str], reason: str) -> None:
+        with self._lock:
+            self._bucket(ts)["safety"][reason] += 1
+
+    def record_event(self, ts: Optional[str], event: str) -> None:
+        with self._lock:
+            self._bucket(ts)["events"][event] += 1
+
+    # --- чтение ---
+
+    def snapshot(self, days: int = 7) -> dict:
+        """Сумма за последние days дней + по дням (для дашборда)."""
+        today = datetime.now(timezone.utc).date()
+        wanted = {(today - timedelta(days=i)).isoformat() for i in range(max(1, min(days, self.window_days)))}
+        total = _empty_bucket()
+        per_day = {}
+        with self._lock:
+            for day in sorted(self._days):
+                if day not in wanted:
+                    continue
+                b = self._days[day]
+                per_day[day] = {"turns": b["turns"], "feedback": dict(b["feedback"]), "safety": sum(b["safety"].values())}
+                for k in _SCALARS:
+                    total[k] += b[k]
+                for k in _COUNTERS:
+                    total[k].update(b[k])
+        fb = total["feedback"]
+        rated = fb.get("useful", 0) + fb.get("not_useful", 0)
+        out = {k: total[k] for k in _SCALARS}
+        out.update({k: dict(total[k].most_common()) for k in _COUNTERS})
+        out["feedback_useful_ratio"] = round(fb.get("useful", 0) / rated, 3) if rated else None
+        out["llm_retry_rate"] = round(total["llm_retries"] / total["turns"], 3) if total["turns"] else None
+        out["days"] = per_day
+        return out
+
+    # --- персистентность ---
+
+    def save(self) -> None:
+        """Сбросить снимок на диск, если были изменения (atomic replace)."""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            data = {day: {k: (dict(v) if isinstance(v, Counter) else v) for k, v in b.items()} for day, b in self._days.items()}
+            self._dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"days": data}, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self._dirty = True
+            print(f"[live_stats] save error: {e}")
+
+    def _load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                days = json.load(f).get("days", {})
+        except (OSError, json.JSONDecodeError, AttributeError):
+            return
+        for day, raw in days.items():
+            b = _empty_bucket()
+            for k in _SCALARS:
+                b[k] = int(raw.get(k, 0))
+            for k in _COUNTERS:
+                b[k].update(raw.get(k) or {})
+            self._days[day] = b
+        self._evict()
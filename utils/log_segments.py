@@ -0,0 +1,320 @@
+"""Сегментированная раскладка логов: logs/segments/{kind}/{kind}_{период}.jsonl.
+
+Вместо logs/users/{user_id}/*.jsonl (сотни тысяч мелких файлов) все пользователи пишут
+в один сегмент на период (день или час, PHI_LOG_SEGMENT_PERIOD). Закрытые сегменты
+«запечатываются»: строится индекс {user_id: [offset, ...]} (.idx.json) и файл сжимается
+(gzip или zstd, PHI_LOG_COMPRESS). Поиск по пользователю читает индексы и нужные строки,
+bulk-скан — несколько больших файлов.
+
+Индекс помнит свой файл ("file"). Записи в уже запечатанный период (migrate, поздняя строка)
+идут в отдельный стем {stem}_late[N] и печатаются отдельно: офсеты сжатого сегмента к ним не применяются.
+
+CLI: python -m utils.log_segments seal | migrate | user <user_id> [kind]
+"""
+
+import gzip
+import io
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+KINDS = ("dialogs", "feedback", "events", "safety")
+SEGMENT_PERIOD = os.environ.get("PHI_LOG_SEGMENT_PERIOD", "day")  # day | hour
+COMPRESS = os.environ.get("PHI_LOG_COMPRESS", "gzip")  # gzip | zstd | none
+# Запечатывать сегмент не раньше чем через SEAL_GRACE_SEC после конца периода (догоняет очередь writer)
+SEAL_GRACE_SEC = 600
+_PERIOD_FMT = {"day": "%Y%m%d", "hour": "%Y%m%d%H"}
+_PERIOD_SEC = {"day": 86400, "hour": 3600}
+_COMPRESSED_SUFFIXES = (".jsonl.gz", ".jsonl.zst")
+_LATE_RE = re.compile(r"_late\d*$")
+
+
+def _period() -> str:
+    return SEGMENT_PERIOD if SEGMENT_PERIOD in _PERIOD_FMT else "day"
+
+
+def segment_stem(kind: str, when: Optional[datetime] = None) -> str:
+    when = when or datetime.now(timezone.utc)
+    return f"{kind}_{when.strftime(_PERIOD_FMT[_period()])}"
+
+
+def segment_path(root: Path, kind: str, when: Optional[datetime] = None) -> Path:
+    """Активный (несжатый) сегмент для записи."""
+    return Path(root) / kind / f"{segment_stem(kind, when)}.jsonl"
+
+
+def _segment_end(stem: str) -> float:
+    """Конец периода сегмента (epoch), по имени файла."""
+    stamp = _LATE_RE.sub("", stem).rsplit("_", 1)[-1]
+    fmt = "%Y%m%d%H" if len(stamp) == 10 else "%Y%m%d"
+    start = datetime.strptime(stamp, fmt).replace(tzinfo=timezone.utc).timestamp()
+    return start + (_PERIOD_SEC["hour"] if len(stamp) == 10 else _PERIOD_SEC["day"])
+
+
+def stem_of(path: Path) -> str:
+    name = path.name
+    for suf in _COMPRESSED_SUFFIXES + (".jsonl",):
+        if name.endswith(suf):
+            return name[: -len(suf)]
+    return path.stem
+
+
+def list_segments(root: Path, kind: str) -> list[Path]:
+    """Все сегменты kind по времени (сжатые и активные)."""
+    d = Path(root) / kind
+    if not d.exists():
+        return []
+    out = [p for p in d.iterdir() if p.name.endswith(".jsonl") or p.name.endswith(_COMPRESSED_SUFFIXES)]
+    return sorted(out, key=stem_of)
+
+
+def open_segment(path: Path):
+    """Бинарный поток несжатого содержимого сегмента (gzip/zstd/plain)."""
+    if path.name.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.name.endswith(".zst"):
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb")
+
+
+def read_index(path: Path) -> Optional[dict]:
+    """Индекс запечатанного сегмента: {"file", "bytes", "lines", "users": {uid: [offset, ...]}}.
+    None — у файла нет своего индекса (в т.ч. несжатый файл рядом с уже запечатанным стемом)."""
+    stem = stem_of(path)
+    try:
+        with open(path.with_name(stem + ".idx.json"), encoding="utf-8") as f:
+            idx = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    owner = idx.get("file")
+    if owner is None:
+        # индексы без "file": принадлежат сжатому файлу стема, при PHI_LOG_COMPRESS=none — самому .jsonl
+        compressed = [stem + suf for suf in _COMPRESSED_SUFFIXES if path.with_name(stem + suf).exists()]
+        owner = compressed[0] if compressed else stem + ".jsonl"
+    return idx if owner == path.name else None
+
+
+def _stem_files(d: Path, stem: str) -> list[Path]:
+    return [d / (stem + suf) for suf in (".jsonl", ".idx.json") + _COMPRESSED_SUFFIXES]
+
+
+def _late_stem(d: Path, stem: str, free: bool) -> str:
+    """Стем для записей в запечатанный период: {stem}_late, {stem}_late2, …
+    free — без единого файла (под переименование), иначе первый незапечатанный (дописать)."""
+    base = _LATE_RE.sub("", stem)
+    n = 1
+    while True:
+        cand = f"{base}_late" + (str(n) if n > 1 else "")
+        taken = [p for p in _stem_files(d, cand) if p.exists()]
+        if not taken or (not free and not (d / f"{cand}.idx.json").exists()):
+            return cand
+        n += 1
+
+
+def writable_segment(root: Path, kind: str, stem: str) -> Path:
+    """Несжатый файл для дозаписи в период stem: сам сегмент или, если он запечатан, {stem}_late[N]."""
+    d = Path(root) / kind
+    if not (d / f"{stem}.idx.json").exists():
+        return d / f"{stem}.jsonl"
+    return d / f"{_late_stem(d, stem, free=False)}.jsonl"
+
+
+def _compressor() -> tuple[str, Optional[object]]:
+    if COMPRESS == "zstd":
+        try:
+            import zstandard
+            return ".jsonl.zst", zstandard
+        except ImportError:
+            pass  # нет zstandard — gzip
+    if COMPRESS == "none":
+        return ".jsonl", None
+    return ".jsonl.gz", gzip
+
+
+class SegmentChanged(OSError):
+    """Сегмент дописали во время печати — результат отброшен, повтор в следующий проход."""
+
+
+def seal_segment(path: Path) -> Path:
+    """Построить индекс по user_id и сжать закрытый сегмент. Возвращает путь результата."""
+    users: dict[str, list[int]] = {}
+    offset = 0
+    lines = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            lines += 1
+            try:
+                uid = json.loads(raw).get("user_id")
+            except (json.JSONDecodeError, AttributeError):
+                uid = None
+            if uid is not None:
+                users.setdefault(str(uid), []).append(offset)
+            offset += len(raw)
+    suffix, mod = _compressor()
+    stem = stem_of(path)
+    out = path.with_name(stem + suffix)
+    if mod is not None:
+        tmp = out.with_name(out.name + ".tmp")
+        with open(path, "rb") as src:
+            if mod is gzip:
+                with gzip.open(tmp, "wb", compresslevel=6) as dst:
+                    _copy(src, dst)
+            else:
+                with open(tmp, "wb") as raw_dst:
+                    with mod.ZstdCompressor(level=10).stream_writer(raw_dst) as dst:
+                        _copy(src, dst)
+        os.replace(tmp, out)
+    idx_tmp = path.with_name(stem + ".idx.json.tmp")
+    with open(idx_tmp, "w", encoding="utf-8") as f:
+        json.dump({"file": out.name, "bytes": offset, "lines": lines, "users": users}, f, separators=(",", ":"))
+    if path.stat().st_size != offset:
+        # поздняя строка пришла во время печати — не терять её вместе с удалённым .jsonl
+        idx_tmp.unlink()
+        if mod is not None:
+            out.unlink()
+        raise SegmentChanged(f"{path.name} grew while sealing")
+    os.replace(idx_tmp, path.with_name(stem + ".idx.json"))
+    if out != path:
+        path.unlink()
+    return out
+
+
+def _copy(src, dst, chunk: int = 1 << 20) -> None:
+    while True:
+        buf = src.read(chunk)
+        if not buf:
+            return
+        dst.write(buf)
+
+
+def seal_closed_segments(root: Path, now: Optional[float] = None, release: Optional[Callable[[Path], bool]] = None) -> int:
+    """Запечатать все сегменты, чей период закончился больше SEAL_GRACE_SEC назад.
+    release(path) — писатель дописывает очередь и закрывает файл (JsonlWriter.release);
+    False — сегмент пропускается до следующего прохода (удалённый, но открытый файл терял бы записи).
+    Несжатый файл рядом с уже запечатанным стемом (поздние записи) переименовывается в {stem}_late[N]
+    и печатается отдельно; несжатый запечатанный (PHI_LOG_COMPRESS=none), который дописали, — переиндексируется."""
+    now = now or time.time()
+    sealed = 0
+    for kind in KINDS:
+        for path in list_segments(root, kind):
+            if not path.name.endswith(".jsonl"):
+                continue
+            idx = read_index(path)
+            try:
+                if idx is not None and idx.get("bytes", 0) >= path.stat().st_size:
+                    continue
+                if _segment_end(stem_of(path)) + SEAL_GRACE_SEC > now:
+                    continue
+            except (OSError, ValueError):
+                continue
+            if release is not None and not release(path):
+                print(f"[logs] seal {path.name} skipped: writer did not release the file")
+                continue
+            try:
+                if idx is None and path.with_name(stem_of(path) + ".idx.json").exists():
+                    late = path.with_name(_late_stem(path.parent, stem_of(path), free=True) + ".jsonl")
+                    os.replace(path, late)
+                    path = late
+                seal_segment(path)
+                sealed += 1
+            except OSError as e:
+                print(f"[logs] seal {path.name} error: {e}")
+    return sealed
+
+
+def iter_records(path: Path, start: int = 0) -> Iterator[tuple[int, dict]]:
+    """(offset конца строки, запись) начиная с несжатого offset; недописанная строка не отдаётся."""
+    with open_segment(path) as f:
+        if start:
+            f.seek(start)
+        offset = start
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                return
+            offset += len(raw)
+            try:
+                yield offset, json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+
+
+def iter_user_records(root: Path, kind: str, user_id) -> Iterator[dict]:
+    """Записи одного пользователя: по индексу в запечатанных сегментах, сканом — в активном."""
+    uid = str(user_id)
+    for path in list_segments(root, kind):
+        idx = read_index(path)
+        if idx is None:
+            for _, rec in iter_records(path):
+                if str(rec.get("user_id")) == uid:
+                    yield rec
+            continue
+        offsets = idx.get("users", {}).get(uid) or []
+        with open_segment(path) as f:
+            for off in offsets:
+                f.seek(off)
+                try:
+                    yield json.loads(f.readline())
+                except json.JSONDecodeError:
+                    continue
+        if path.name.endswith(".jsonl"):
+            # несжатый запечатанный сегмент дописали после индекса — хвост сканом
+            for _, rec in iter_records(path, idx.get("bytes", 0)):
+                if str(rec.get("user_id")) == uid:
+                    yield rec
+
+
+def migrate_user_dirs(users_dir: Path, root: Path) -> int:
+    """Перенести старую раскладку logs/users/{uid}/{kind}.jsonl в сегменты (по ts записи)."""
+    moved = 0
+    for kind in KINDS:
+        by_stem: dict[str, list[tuple[str, bytes]]] = {}
+        for path in Path(users_dir).glob(f"*/{kind}.jsonl"):
+            with open(path, "rb") as f:
+                for raw in f:
+                    if not raw.strip():
+                        continue
+                    try:
+                        ts = json.loads(raw).get("ts") or ""
+                        when = datetime.fromisoformat(ts)
+                    except (json.JSONDecodeError, ValueError, AttributeError):
+                        continue
+                    if when.tzinfo is None:
+                        when = when.replace(tzinfo=timezone.utc)
+                    stem = segment_stem(kind, when.astimezone(timezone.utc))
+                    by_stem.setdefault(stem, []).append((ts, raw.rstrip(b"\n") + b"\n"))
+        for stem, rows in by_stem.items():
+            out = writable_segment(root, kind, stem)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            rows.sort(key=lambda r: r[0])
+            with open(out, "ab") as f:
+                f.writelines(raw for _, raw in rows)
+            moved += len(rows)
+    return moved
+
+
+def main(argv: list[str]) -> None:
+    from logger import SEGMENTS_DIR, USERS_DIR
+
+    if not argv or argv[0] not in ("seal", "user", "migrate"):
+        print("usage: python -m utils.log_segments seal | migrate | user <user_id> [kind]")
+        sys.exit(1)
+    if argv[0] == "seal":
+        print(f"sealed: {seal_closed_segments(SEGMENTS_DIR)}")
+        return
+    if argv[0] == "migrate":
+        print(f"migrated: {migrate_user_dirs(USERS_DIR, SEGMENTS_DIR)} records")
+        print(f"sealed: {seal_closed_segments(SEGMENTS_DIR)}")
+        return
+    kind = argv[2] if len(argv) > 2 else "dialogs"
+    for rec in iter_user_records(SEGMENTS_DIR, kind, argv[1]):
+        print(json.dumps(rec, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
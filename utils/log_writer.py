@@ -0,0 +1,249 @@
+"""Фоновая запись JSONL-логов: очередь + поток-писатель, LRU открытых файлов, батчи, периодический fsync.
+
+Хендлеры только кладут готовую строку в очередь (put_nowait) — event loop не ждёт диск.
+При переполнении очереди запись отбрасывается и считается в stats()["dropped"].
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+QUEUE_MAX = int(os.environ.get("PHI_LOG_QUEUE_MAX", "10000"))
+MAX_OPEN_FILES = int(os.environ.get("PHI_LOG_MAX_OPEN_FILES", "128"))
+FSYNC_INTERVAL_SEC = float(os.environ.get("PHI_LOG_FSYNC_SEC", "5"))
+BATCH_MAX = 500
+# Backpressure: очередь заполнена больше чем на HIGH_WATERMARK — считаем, но не блокируем
+HIGH_WATERMARK = 0.8
+
+_STOP = object()
+_RELEASE = object()  # (_RELEASE, path, threading.Event) — закрыть файл после всего, что в очереди раньше
+
+
+class JsonlWriter:
+    """Асинхронный писатель строк в файлы (append). Один поток, потокобезопасный write()."""
+
+    def __init__(
+        self,
+        queue_max: int = QUEUE_MAX,
+        max_open_files: int = MAX_OPEN_FILES,
+        fsync_interval: float = FSYNC_INTERVAL_SEC,
+    ):
+        self.max_open_files = max_open_files
+        self.fsync_interval = fsync_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_max)
+        self._files: OrderedDict[Path, object] = OrderedDict()
+        self._dirty: set = set()
+        self._known_dirs: set = set()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # счётчики меняют и вызывающие потоки, и писатель
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "backpressure": 0,
+            "batches": 0,
+            "fsyncs": 0,
+            "errors": 0,
+            "evicted_files": 0,
+        }
+
+    def write(self, path: Path, line: str) -> bool:
+        """Поставить строку в очередь. False — очередь полна (запись отброшена) или writer закрыт."""
+        if self._closed:
+            self._count("dropped")
+            return False
+        self._ensure_started()
+        q = self._queue
+        if q.maxsize and q.qsize() >= q.maxsize * HIGH_WATERMARK:
+            self._count("backpressure")
+        try:
+            q.put_nowait((path, line))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("enqueued")
+        return True
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self) -> dict:
+        """Счётчики для /health: очередь, записи, дропы, backpressure, открытые файлы."""
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["queue_depth"] = self._queue.qsize()
+        out["queue_max"] = self._queue.maxsize
+        out["open_files"] = len(self._files)
+        return out
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Дождаться, пока очередь будет записана (для shutdown и eval)."""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def release(self, path: Path, timeout: float = 5.0) -> bool:
+        """Дописать всё, что уже в очереди, и закрыть файл path (перед сжатием/удалением сегмента).
+        False — писатель не подтвердил за timeout: файл может быть ещё открыт."""
+        thread = self._thread
+        if thread is None:
+            return True
+        if self._closed:
+            return not thread.is_alive()
+        done = threading.Event()
+        try:
+            self._queue.put((_RELEASE, Path(path), done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Дописать очередь, fsync и закрыть файлы. Повторный вызов — no-op.
+        Файлы закрывает сам поток-писатель по _STOP: не успел за timeout — остаются ему."""
+        if self._closed:
+            return
+        self._closed = True
+        thread = self._thread
+        if thread is None:
+            return  # поток не запускался — файлов нет
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print(f"[log_writer] close: queue full after {timeout}s, writer keeps running")
+            return
+        thread.join(timeout)
+        if thread.is_alive():
+            print(f"[log_writer] close: writer busy after {timeout}s, files left to the writer thread")
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="phi-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            try:
+                item = q.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                self._maybe_fsync(force=True)
+                continue
+            batch = [item]
+            while len(batch) < BATCH_MAX:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._write_batch(batch)
+            for _ in batch:
+                q.task_done()
+            if stop:
+                self._close_all()
+                return
+
+    def _write_batch(self, batch: list) -> bool:
+        """Сгруппировать строки по файлу и записать одним write на файл."""
+        stop = False
+        by_path: dict[Path, list[str]] = {}
+        releases = []
+        for item in batch:
+            if item is _STOP:
+                stop = True
+                continue
+            if item[0] is _RELEASE:
+                releases.append(item)
+                continue
+            path, line = item
+            by_path.setdefault(path, []).append(line)
+        for path, lines in by_path.items():
+            try:
+                f = self._open(path)
+                f.write("".join(lines))
+                f.flush()
+                self._dirty.add(path)
+                self._count("written", len(lines))
+            except OSError:
+                self._count("errors")
+                self._drop_handle(path)
+        self._count("batches")
+        # строки до release в этой же пачке уже записаны — теперь файл можно закрыть
+        for _, path, done in releases:
+            self._drop_handle(path, fsync=True)
+            done.set()
+        self._maybe_fsync(force=stop)
+        return stop
+
+    def _open(self, path: Path):
+        f = self._files.get(path)
+        if f is not None:
+            self._files.move_to_end(path)
+            return f
+        parent = path.parent
+        if parent not in self._known_dirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            self._known_dirs.add(parent)
+        f = open(path, "a", encoding="utf-8")
+        self._files[path] = f
+        while len(self._files) > self.max_open_files:
+            old_path, _ = next(iter(self._files.items()))
+            self._drop_handle(old_path, fsync=True)
+            self._count("evicted_files")
+        return f
+
+    def _drop_handle(self, path: Path, fsync: bool = False) -> None:
+        f = self._files.pop(path, None)
+        self._dirty.discard(path)
+        if f is None:
+            return
+        try:
+            if fsync:
+                os.fsync(f.fileno())
+            f.close()
+        except (OSError, ValueError):
+            pass
+
+    def _maybe_fsync(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not self._dirty or (not force and now - self._last_fsync < self.fsync_interval):
+            return
+        for path in list(self._dirty):
+            f = self._files.get(path)
+            if f is None:
+                continue
+            try:
+                os.fsync(f.fileno())
+            except (OSError, ValueError):
+                self._count("errors")
+        self._dirty.clear()
+        self._last_fsync = now
+        self._count("fsyncs")
+
+    def _close_all(self) -> None:
+        for path in list(self._files):
+            self._drop_handle(path, fsync=True)
+
+
+_default_writer: Optional[JsonlWriter] = None
+
+
+def get_writer() -> JsonlWriter:
+    """Общий писатель процесса (закрывается через atexit)."""
+    global _default_writer
+    if _default_writer is None:
+        _default_writer = JsonlWriter()
+        atexit.register(_default_writer.close)
+    return _default_writer
@@ -0,0 +1,56 @@
+"""Признаки сообщения на один ход: предикаты детекторов — по одному разу.
+
+generate_reply_core создаёт MessageFeatures(user_text) и передаёт его дальше (governor_plan и
+ветки бота). Предикат вызывается через features(fn): первый вызов считает fn(text), повторные
+берут результат из кэша хода. Нормализация текста и маски ключевых слов, которые нужны
+детекторам, — из общего скана utils.keyword_matcher (один на текст, делается при создании).
+
+Счётчики computed / reused по каждому предикату — feature_stats() (в /health): сколько
+повторных вычислений убрано.
+"""
+
+from collections import defaultdict
+from typing import Callable
+
+from utils import keyword_matcher as km
+
+_STATS: dict = defaultdict(lambda: [0, 0])  # имя предиката -> [computed, reused]
+
+
+class MessageFeatures:
+    """Кэш признаков одного сообщения (живёт один ход)."""
+
+    __slots__ = ("text", "match", "_values", "computed", "reused")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.match = km.scan_message(text or "")
+        self._values: dict = {}
+        self.computed = 0
+        self.reused = 0
+
+    def __call__(self, fn: Callable[[str], object]):
+        """fn(text) — один раз за ход; повторный вызов того же предиката — из кэша."""
+        try:
+            value = self._values[fn]
+        except KeyError:
+            value = self._values[fn] = fn(self.text)
+            self.computed += 1
+            _STATS[fn.__name__][0] += 1
+            return value
+        self.reused += 1
+        _STATS[fn.__name__][1] += 1
+        return value
+
+    def summary(self) -> dict:
+        return {"computed": self.computed, "reused": self.reused}
+
+
+def feature_stats() -> dict:
+    """Счётчики по предикатам с начала процесса."""
+    per = {name: {"computed": c, "reused": r} for name, (c, r) in sorted(_STATS.items())}
+    return {
+        "computed": sum(c for c, _ in _STATS.values()),
+        "reused": sum(r for _, r in _STATS.values()),
+        "predicates": per,
+    }
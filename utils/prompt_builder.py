@@ -0,0 +1,151 @@
+"""Сборка system prompt для guidance-хода с мемоизацией.
+
+Промпт = основной промпт + линзы + условные суффиксы (explain-контракт, floor'ы, оптика,
+multi-style). Различных комбинаций — сотни, поэтому собранный текст кэшируется по
+каноническому ключу (линзы в порядке выбора, без дублей; только включённые флаги).
+Кэш привязан к prompt_bundle_hash(): правка любого промпта или линзы его сбрасывает.
+Вместе с текстом хранятся число токенов (utils.tokens) и хэш — стабильный ключ для eval/llm_cache.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+from prompt_loader import (
+    build_system_prompt,
+    load_all_lenses,
+    load_philosophy_style,
+    load_system_prompt,
+    prompt_bundle_hash,
+)
+from utils.tokens import count_tokens
+
+PROMPT_CACHE_MAX = 512
+
+EXISTENTIAL_SUFFIX = "\n\nExistential: макс. 2 рамки, каждая ≤2 предложения."
+FORCE_EXPAND_SUFFIX = "\n\n---\nforce_expand_next: Дай развёрнутый ответ с объяснением и примером. Не менее 2 абзацев."
+RICH_FLOOR_SUFFIX = "\n\nОтвет: развёрнуто, не менее 900 символов. Без ultra-short."
+PHILOSOPHY_SUFFIX = (
+    "\n\nОтвет: развёрнуто, не менее ~900 символов. Без короткого режима."
+    "\n---\nЗАПРЕЩЕНО: начинать с абстрактной подводки («Когда ответов много», «Когда внутри нет ясности» и т.п.). Сразу отвечать на вопрос."
+    "\n---\nОдин связный ответ. Не дублировать содержание вторым блоком."
+    "\nЕсли ответ длинный — вторую часть не начинать с «Продолжу», «Дальше». Продолжать тот же ответ без вступления, сразу по делу."
+)
+# Fix Pack D2: structure requirement вместо только length floor
+EXPLAIN_SUFFIX = (
+    "\n\n---\nEXPLAIN_MODE: Структура обязательна (без заголовков, но по смыслу):\n"
+    "1) Первый абзац: заявленная оптика (если попросили через буддизм/другую — именно её рамку). "
+    "2) Середина: 2–3 пункта или нумерованные предложения — как это работает в случае пользователя. "
+    "3) Конец: одно практическое переформулирование (не новая практика каждый раз), затем макс 1 вопрос. "
+    "Практика — макс 1, только если просит советы. СТРОГО не менее 900 символов."
+)
+EXPLAIN_OPTIC_SUFFIX = {
+    "buddhism": (
+        "\n\n---\nБУДДИЙСКАЯ ОПТИКА: Мягко, без лекции. Ключи: дуккха/танха (привязанность к контролю), "
+        "непостоянство, осознанность к тяге к определённости. Переведи на язык пользователя, не академично."
+    ),
+    "example": " Обязательно включи конкретный пример.",
+}
+MULTI_STYLE_SUFFIX = "\n\n---\nv21.1 Multi-style: 2–3 оптики. Максимум 3 школы, 1 вопрос, 1 практика."
+
+
+def explain_mode_instructions_ru() -> str:
+    """PATCH F + PATCH G: инструкция для режима разъяснения + blocks contract."""
+    return (
+        "Пользователь просит разъяснение. Сделай ответ более развернутым и понятным: "
+        "1) кратко переформулируй, что именно объясняешь; "
+        "2) разложи на 2–4 смысловых блока; "
+        "3) дай 1 короткий пример; "
+        "4) завершай без вопросов. "
+        "Пиши читабельно: абзацы и маркеры, без полотна. "
+        "Тон: живой, спокойный, без формальностей и без давления.\n\n"
+        "---\n"
+        "[EXPLAIN_MODE_BLOCKS_CONTRACT] Если пользователь просит «объясни», «разбери», «шире», «покажи варианты», «сравни», «поясни детальнее»: "
+        "1) Сформируй ответ как семантические блоки в JSON и помести его строго между тегами: <BLOCKS_JSON> ... </BLOCKS_JSON> "
+        "2) Схема JSON: {\"lead\": \"1–2 предложения по сути\", \"sections\": [{\"title\": \"Заголовок\", \"body\": \"2–5 предложений\", \"bullets\": []}], "
+        "\"bridge\": null, \"question\": \"опционально один финальный вопрос\"} "
+        "3) Никаких других тегов, никакого второго дублирующего блока. "
+        "4) Не добавляй мета-фразы про «рамки», «оптики», «сейчас разберём философски» — начинай по делу."
+    )
+
+
+class BuiltPrompt(NamedTuple):
+    text: str
+    tokens: int
+    digest: str
+
+
+def canonical_key(lenses: list[str], flags: dict) -> tuple:
+    """Линзы — в порядке выбора без дублей (порядок влияет на текст); флаги — только истинные, сортированно."""
+    return tuple(dict.fromkeys(lenses)), tuple(sorted((k, v) for k, v in flags.items() if v))
+
+
+def _assemble(lenses: tuple[str, ...], flags: dict) -> str:
+    all_lenses = load_all_lenses()
+    lens_contents = [c for c in (all_lenses.get(n, "") for n in lenses) if c]
+    text = build_system_prompt(load_system_prompt(), lens_contents)
+    text += flags.get("extra") or ""
+    text += EXISTENTIAL_SUFFIX
+    if flags.get("force_expand"):
+        text += FORCE_EXPAND_SUFFIX
+    phi_style = load_philosophy_style()
+    if phi_style:
+        text += "\n\n---\n" + phi_style
+    if flags.get("rich_floor"):
+        text += RICH_FLOOR_SUFFIX
+    if flags.get("philosophy_pipeline"):
+        text += PHILOSOPHY_SUFFIX
+    if flags.get("explain_mode"):
+        text += EXPLAIN_SUFFIX + EXPLAIN_OPTIC_SUFFIX.get(flags.get("explain_optic") or "", "")
+        # PATCH F: Explain Expander — развернуто и читабельно
+        text += "\n\n---\n" + explain_mode_instructions_ru()
+    if flags.get("multi_style"):
+        text += MULTI_STYLE_SUFFIX
+    return text
+
+
+class SystemPromptBuilder:
+    """LRU собранных промптов; сбрасывается при смене содержимого промптов/линз."""
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_MAX, count_tokens: Callable[[str], int] = count_tokens):
+        self.max_entries = max_entries
+        self.count_tokens = count_tokens
+        self._cache: "OrderedDict[tuple, BuiltPrompt]" = OrderedDict()
+        self._salt: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def build(self, lenses: list[str], flags: dict) -> BuiltPrompt:
+        """flags: extra (str), force_expand, rich_floor, philosophy_pipeline, explain_mode,
+        explain_optic ("buddhism" | "example" | None), multi_style."""
+        key = canonical_key(lenses, flags)
+        salt = prompt_bundle_hash()
+        with self._lock:
+            if salt != self._salt:
+                if self._cache:
+                    self._stats["invalidations"] += 1
+                self._cache.clear()
+                self._salt = salt
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                return hit
+        text = _assemble(key[0], dict(key[1]))
+        built = BuiltPrompt(text, self.count_tokens(text), hashlib.sha256(text.encode("utf-8")).hexdigest()[:16])
+        with self._lock:
+            self._stats["misses"] += 1
+            self._cache[key] = built
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self._stats["evictions"] += 1
+        return built
+
+    def stats(self) -> dict:
+        total = self._stats["hits"] + self._stats["misses"]
+        return dict(
+            self._stats,
+            entries=len(self._cache),
+            hit_rate=round(self._stats["hits"] / total, 3) if total else None,
+        )
@@ -0,0 +1,62 @@
+"""Серверное состояние диалога: цепочка ответов Responses API (previous_response_id).
+
+Режим PHI_RESPONSES_CHAIN=1. Первый ход цепочки — обычный вызов с упакованным контекстом
+и store=true; следующие цепляются к прошлому ответу через previous_response_id и отправляют
+только новое сообщение + дельту (флаги хода и реплики, которых нет в цепочке: шаблонные ответы
+без LLM). Instructions Responses API не наследует — они уходят каждый ход (кэшируются на стороне API).
+
+Цепочка начинается заново, если она старше CHAIN_MAX_TURNS ходов (контекст на сервере растёт),
+пропущено больше CHAIN_MAX_MISSED ходов или сервер её потерял (ответ истёк/удалён → ошибка) —
+тогда ход идёт по-старому, с полной упаковкой контекста. Повтор, заменивший ответ хода, становится
+новым началом цепочки (bot._adopt_retry): следующий ход цепляется к тексту, который видел пользователь.
+Проверка без OpenAI: scripts/responses_stub.py + OPENAI_BASE_URL.
+"""
+
+import os
+from typing import Optional
+
+CHAIN_ENABLED = os.environ.get("PHI_RESPONSES_CHAIN", "0") == "1"
+CHAIN_MAX_TURNS = int(os.environ.get("PHI_RESPONSES_CHAIN_TURNS", "12"))
+CHAIN_MAX_MISSED = 2
+
+_STATS = {"started": 0, "chained": 0, "lost": 0, "expired": 0, "ctx_tokens_saved": 0}
+
+
+def chain_head(state: dict) -> Optional[dict]:
+    """Текущая цепочка пользователя, если к ней можно прицепить этот ход."""
+    head = state.get("response_chain")
+    if not isinstance(head, dict) or not head.get("id"):
+        return None
+    turn = state.get("turn_index", 0)
+    if turn - head.get("start", 0) >= CHAIN_MAX_TURNS or missed_turns(state, head) > CHAIN_MAX_MISSED or turn <= head.get("turn", 0):
+        _STATS["expired"] += 1
+        state["response_chain"] = None
+        return None
+    return head
+
+
+def missed_turns(state: dict, head: dict) -> int:
+    """Ходов между последним звеном цепочки и текущим (ответы без LLM — в цепочку не попали)."""
+    return max(0, state.get("turn_index", 0) - head.get("turn", 0) - 1)
+
+
+def advance(state: dict, response_id: Optional[str], started: bool, ctx_tokens_saved: int = 0) -> None:
+    """Записать ответ хода звеном цепочки."""
+    if not response_id:
+        state["response_chain"] = None
+        return
+    turn = state.get("turn_index", 0)
+    head = state.get("response_chain") if not started else None
+    state["response_chain"] = {"id": response_id, "turn": turn, "start": head.get("start", turn) if head else turn}
+    _STATS["started" if started else "chained"] += 1
+    _STATS["ctx_tokens_saved"] += max(0, ctx_tokens_saved)
+
+
+def drop(state: dict) -> None:
+    """Цепочка потеряна на сервере — дальше stateless, со следующего хода новая цепочка."""
+    state["response_chain"] = None
+    _STATS["lost"] += 1
+
+
+def stats() -> dict:
+    return dict(_STATS, enabled=CHAIN_ENABLED, max_turns=CHAIN_MAX_TURNS)
@@ -0,0 +1,146 @@
+"""Стеммер русского языка (алгоритм Snowball / Porter для русского), без зависимостей.
+
+Отрезает окончания словоизменения: «покончил», «покончу», «покончить» → «поконч».
+Чередования основы (повешусь / повеситься) не сводит — такие формы перечисляются явно.
+Возвратность по желанию сохраняется меткой (stem_words(..., keep_reflexive=True)).
+"""
+
+import re
+from functools import lru_cache
+
+_VOWELS = "аеиоуыэюя"
+
+_PERFECTIVE_GERUND = (("вшись", "вши", "в"), ("ившись", "ывшись", "ивши", "ывши", "ив", "ыв"))
+_ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому",
+    "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+    "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+_PARTICIPLE = (("ем", "нн", "вш", "ющ", "щ"), ("ивш", "ывш", "ующ"))
+_REFLEXIVE = ("ся", "сь")
+_VERB = (
+    ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н"),
+    (
+        "ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют", "ены",
+        "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю",
+    ),
+)
+_NOUN = (
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях",
+    "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой", "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья",
+    "а", "е", "и", "й", "о", "у", "ы", "ь", "ю", "я",
+)
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+_WORD_RE = re.compile(r"[^\W\d_]+|\d+")
+
+
+def _by_length(endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+_PERFECTIVE_GERUND = tuple(_by_length(g) for g in _PERFECTIVE_GERUND)
+_PARTICIPLE = tuple(_by_length(g) for g in _PARTICIPLE)
+_VERB = tuple(_by_length(g) for g in _VERB)
+_ADJECTIVE = _by_length(_ADJECTIVE)
+_NOUN = _by_length(_NOUN)
+
+
+def _regions(word: str) -> tuple[int, int]:
+    """Начала RV и R2 (индексы в слове)."""
+    rv = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+    r1 = len(word)
+    for i in range(1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r1 = i + 1
+            break
+    r2 = len(word)
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word: str, rv: int, endings) -> str | None:
+    for e in endings:
+        if word.endswith(e) and len(word) - len(e) >= rv:
+            return word[: -len(e)]
+    return None
+
+
+def _strip_grouped(word: str, rv: int, groups) -> str | None:
+    """Группа 1 — окончание только после «а»/«я» (сама буква остаётся); группа 2 — без условия."""
+    first, second = groups
+    best = None
+    for e in first:
+        n = len(word) - len(e)
+        if word.endswith(e) and n - 1 >= rv and word[n - 1] in "ая":
+            best = e
+            break
+    for e in second:
+        if word.endswith(e) and len(word) - len(e) >= rv and (best is None or len(e) > len(best)):
+            best = e
+            break
+    return word[: -len(best)] if best else None
+
+
+def _strip_adjectival(word: str, rv: int) -> str | None:
+    stem = _strip(word, rv, _ADJECTIVE)
+    if stem is None:
+        return None
+    return _strip_grouped(stem, rv, _PARTICIPLE) or stem
+
+
+@lru_cache(maxsize=8192)
+def stem(word: str) -> str:
+    """Основа слова (слово в нижнем регистре, ё → е)."""
+    word = word.lower().replace("ё", "е")
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Шаг 1
+    s = _strip_grouped(word, rv, _PERFECTIVE_GERUND)
+    if s is None:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        s = _strip_adjectival(word, rv)
+        if s is None:
+            s = _strip_grouped(word, rv, _VERB)
+        if s is None:
+            s = _strip(word, rv, _NOUN)
+    if s is not None:
+        word = s
+    # Шаг 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+    # Шаг 3
+    for e in _DERIVATIONAL:
+        if word.endswith(e) and len(word) - len(e) >= r2:
+            word = word[: -len(e)]
+            break
+    # Шаг 4
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        return word[:-1]
+    s = _strip(word, rv, _SUPERLATIVE)
+    if s is not None:
+        word = s[:-1] if s.endswith("нн") and len(s) - 2 >= rv else s
+    elif word.endswith("ь") and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def stem_words(text: str, keep_reflexive: bool = False) -> list[str]:
+    """Основы слов текста по порядку (пунктуация отбрасывается).
+
+    keep_reflexive — возвратным формам оставить метку «ся»: «повешусь» → «повешся», «повешу» → «повеш».
+    """
+    words = _WORD_RE.findall((text or "").lower().replace("ё", "е"))
+    if not keep_reflexive:
+        return [stem(w) for w in words]
+    return [stem(w) + "ся" if w.endswith(_REFLEXIVE) else stem(w) for w in words]
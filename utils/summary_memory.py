@@ -0,0 +1,119 @@
+"""Скользящее резюме диалога: долгая память при плоском входе модели.
+
+Каждые SUMMARY_EVERY_TURNS ходов, уже после отправки ответа, дешёвая модель (PHI_SUMMARY_MODEL)
+сворачивает прошлое резюме + реплики с прошлого обновления в новое резюме ≤ SUMMARY_MAX_TOKENS.
+Обновление — фоновая задача: ответ пользователю его не ждёт, на пользователя не больше одной
+задачи одновременно. Резюме хранится в state (summary, summary_turn) вместе с сессией,
+pack_context вставляет его компактным блоком [summary: …] перед последними репликами.
+"""
+
+import asyncio
+import os
+import time
+from typing import Callable, Optional
+
+from utils.tokens import count_tokens, truncate_tokens
+
+SUMMARY_EVERY_TURNS = int(os.environ.get("PHI_SUMMARY_EVERY", "6"))  # 0 — выкл.
+SUMMARY_MODEL = (os.environ.get("PHI_SUMMARY_MODEL") or "gpt-5.2-mini").strip()
+SUMMARY_MAX_TOKENS = 200  # размер блока в контексте
+SUMMARY_INPUT_MAX_TOKENS = 2000  # вход модели-резюмера
+SUMMARY_MAX_OUTPUT_TOKENS = 400
+
+SUMMARY_INSTRUCTIONS = (
+    "Ты ведёшь краткую память диалога философского бота с пользователем. "
+    "Обнови резюме: объедини прошлое резюме и новые реплики. "
+    "Сохрани: ситуацию и запрос пользователя, важные факты о нём, темы и философские оптики, "
+    "которые уже обсуждали, что помогло или не откликнулось, открытые вопросы. "
+    "Не пересказывай реплики дословно, без советов и оценок. "
+    "Пиши по-русски, 3–6 коротких пунктов, не больше 120 слов. Только резюме, без вступления."
+)
+
+
+def needs_refresh(state: dict, every: int = SUMMARY_EVERY_TURNS) -> bool:
+    """Пора обновлять: с прошлого резюме прошло every ходов."""
+    if every <= 0:
+        return False
+    return state.get("turn_index", 0) - state.get("summary_turn", 0) >= every
+
+
+def new_entries(history: list, state: dict) -> list:
+    """Реплики с прошлого обновления (user + bot на ход; старее буфера истории — не достать)."""
+    turns = max(0, state.get("turn_index", 0) - state.get("summary_turn", 0))
+    return history[-turns * 2:] if turns else []
+
+
+def build_summary_input(prev_summary: str, entries: list) -> str:
+    lines = []
+    for h in entries:
+        content = (h.get("content") or "").strip()
+        if content:
+            label = "Пользователь" if h.get("role") == "user" else "Бот"
+            lines.append(f"{label}: {content}")
+    head = f"Прошлое резюме:\n{prev_summary or '(нет)'}\n\nНовые реплики:\n"
+    body = "\n".join(lines)
+    left = SUMMARY_INPUT_MAX_TOKENS - count_tokens(head)
+    return head + truncate_tokens(body, left, keep_tail=True)
+
+
+def clean_summary(text: str) -> str:
+    return truncate_tokens(" ".join((text or "").split()), SUMMARY_MAX_TOKENS, keep_tail=False)
+
+
+class SummaryRefresher:
+    """Фоновое обновление резюме. summarize(instructions, input) -> текст — синхронный вызов LLM,
+    выполняется в потоке; on_done(user_id, summary, turn_index) — в event loop."""
+
+    def __init__(
+        self,
+        summarize: Callable[[str, str], str],
+        on_done: Callable[[int, str, int], None],
+        every: int = SUMMARY_EVERY_TURNS,
+    ):
+        self.summarize = summarize
+        self.on_done = on_done
+        self.every = every
+        self._inflight: set = set()
+        self._stats = {"scheduled": 0, "done": 0, "failed": 0, "skipped_inflight": 0, "last_ms": None}
+
+    def maybe_schedule(self, user_id: int, state: dict, history: list) -> bool:
+        """Запланировать обновление, если пора. Вызывать после отправки ответа."""
+        if str(user_id).startswith("synth:") or not needs_refresh(state, self.every):
+            return False
+        if user_id in self._inflight:
+            self._stats["skipped_inflight"] += 1
+            return False
+        entries = new_entries(history, state)
+        if not entries:
+            return False
+        self._inflight.add(user_id)
+        self._stats["scheduled"] += 1
+        input_text = build_summary_input(state.get("summary") or "", entries)
+        asyncio.create_task(self._run(user_id, input_text, state.get("turn_index", 0)))
+        return True
+
+    async def _run(self, user_id: int, input_text: str, turn: int) -> None:
+        t0 = time.perf_counter()
+        try:
+            text = await asyncio.to_thread(self.summarize, SUMMARY_INSTRUCTIONS, input_text)
+            summary = clean_summary(text)
+            if summary:
+                self.on_done(user_id, summary, turn)
+                self._stats["done"] += 1
+            else:
+                self._stats["failed"] += 1
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"[summary] refresh error user={user_id}: {e}")
+        finally:
+            self._inflight.discard(user_id)
+            self._stats["last_ms"] = round((time.perf_counter() - t0) * 1000)
+
+    def stats(self) -> dict:
+        return dict(self._stats, inflight=len(self._inflight), every=self.every, model=SUMMARY_MODEL)
+
+
+def summary_block(state: dict) -> Optional[str]:
+    """Блок для контекста модели или None."""
+    summary = (state.get("summary") or "").strip()
+    return f"[summary: {summary}]" if summary else None
@@ -0,0 +1,114 @@
+"""Подсчёт токенов и бюджет входа модели.
+
+Токенизатор: tiktoken (o200k_base, BPE моделей OpenAI), если установлен и кодировка
+доступна; иначе приближение по пре-токенизации (слова/числа/знаки, кириллица дробится
+мельче латиницы) — заметно точнее len/4 на русском тексте.
+
+Бюджет входа зависит от плана (warmup / guidance / explain|philosophy). При превышении
+деградируют части с наименьшим приоритетом: старая история → линзы → текст пользователя
+(середина длинного сообщения). Основной system prompt не режется.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Optional
+
+ENCODING_NAME = os.environ.get("PHI_TOKENIZER_ENCODING", "o200k_base")
+# Бюджет входа (system + линзы + контекст + сообщение), токены
+INPUT_BUDGETS = {
+    "warmup": 2500,
+    "guidance": int(os.environ.get("PHI_INPUT_TOKEN_BUDGET", "4000")),
+    "long": 6000,  # explain_mode / philosophy_pipeline
+}
+CONTEXT_MIN_TOKENS = 300  # под историю оставляем хотя бы столько, прежде чем резать сообщение
+_TRUNC_MARK = " […] "
+
+# Пре-токенизация в духе BPE-токенизаторов OpenAI: слово с ведущим пробелом, числа по 3, прочее
+_PIECE_RE = re.compile(r" ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+", re.UNICODE)
+_CYR_RE = re.compile(r"[а-яё]", re.IGNORECASE)
+
+
+def _load_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        return None  # нет пакета или кодировка не скачивается — приближение
+
+
+_ENC = _load_encoding()
+TOKENIZER = f"tiktoken:{ENCODING_NAME}" if _ENC is not None else "approx"
+
+
+def _approx_count(text: str) -> int:
+    n = 0
+    for piece in _PIECE_RE.findall(text):
+        core = piece.strip()
+        if not core:
+            n += 1 if len(piece) > 1 else 0
+            continue
+        if core[0].isalpha():
+            # кириллица ~3 символа на токен, латиница ~4.5
+            per = 3.0 if _CYR_RE.match(core) else 4.5
+            n += max(1, round(len(core) / per + 0.3))
+        else:
+            n += max(1, len(core) // 2)
+    return n
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов текста. Без кэша: сообщения и история почти не повторяются."""
+    if not text:
+        return 0
+    if _ENC is not None:
+        return len(_ENC.encode(text, disallowed_special=()))
+    return _approx_count(text)
+
+
+@lru_cache(maxsize=64)
+def count_prompt_tokens(text: str) -> int:
+    """count_tokens для повторяющихся текстов (системные промпты) — считается один раз.
+
+    Не для пользовательского текста и контекста: ключ кэша — строка целиком.
+    """
+    return count_tokens(text)
+
+
+def truncate_tokens(text: str, max_tokens: int, keep_tail: bool = True) -> str:
+    """Обрезать текст до max_tokens. keep_tail — сохранить начало и конец (вырезать середину)."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _ENC is not None:
+        ids = _ENC.encode(text, disallowed_special=())
+        if not keep_tail:
+            return _ENC.decode(ids[:max_tokens])
+        head = max_tokens * 2 // 3
+        tail = max_tokens - head - 3
+        return _ENC.decode(ids[:head]) + _TRUNC_MARK + (_ENC.decode(ids[-tail:]) if tail > 0 else "")
+    # приближение: режем пропорционально по символам, потом дожимаем
+    ratio = max_tokens / max(1, count_tokens(text))
+    keep = int(len(text) * ratio)
+    while keep > 0:
+        if keep_tail:
+            head = keep * 2 // 3
+            out = text[:head] + _TRUNC_MARK + text[len(text) - (keep - head):]
+        else:
+            out = text[:keep]
+        if count_tokens(out) <= max_tokens:
+            return out
+        keep = int(keep * 0.9)
+    return ""
+
+
+def input_budget(plan: Optional[dict], stage: Optional[str]) -> int:
+    """Бюджет входных токенов для хода по плану."""
+    plan = plan or {}
+    if plan.get("explain_mode") or plan.get("philosophy_pipeline"):
+        return INPUT_BUDGETS["long"]
+    if stage == "warmup":
+        return INPUT_BUDGETS["warmup"]
+    return INPUT_BUDGETS["guidance"]
+
@@ -0,0 +1,151 @@
+"""Локальный классификатор «философско-понятийный вопрос?» вместо вызова mini-модели на topic_mid.
+
+Логистическая регрессия на бинарных признаках: слова, пары слов, n-граммы символов внутри слов.
+Обучение — scripts/train_topic_classifier.py (numpy): метки из кэша интентов (ответы
+mini-модели, utils.intent_cache), target_topic synth-сценариев и уверенных решений правил (topic gate).
+Модель — JSON {признак: вес}; предсказание — сумма весов найденных признаков, numpy не нужен.
+
+classify(text): p ≥ high → True, p ≤ low → False, иначе None — решает LLM (bot.llm_classify_topic_intent).
+Нет файла модели (PHI_TOPIC_CLF_PATH) — всегда None, поведение как раньше.
+"""
+
+import json
+import math
+import os
+import re
+import time
+from pathlib import Path
+from typing import Optional
+
+from utils import keyword_matcher as km
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+MODEL_PATH = Path(os.environ.get("PHI_TOPIC_CLF_PATH") or PROJECT_ROOT / "models" / "topic_intent.json")
+CHAR_NGRAM = 4
+DEFAULT_LOW, DEFAULT_HIGH = 0.15, 0.85
+
+_WORD_RE = re.compile(r"[^\W\d_]+|\d+")
+
+_STATS = {"local_true": 0, "local_false": 0, "fallback": 0, "no_model": 0, "last_us": None}
+
+
+def features(text: str) -> set:
+    """Бинарные признаки текста (одинаковые при обучении и предсказании)."""
+    words = _WORD_RE.findall(km.VIEWS["yo"](text or ""))
+    feats = {"w:" + w for w in words}
+    feats.update(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    for w in words:
+        w = f" {w} "
+        feats.update("c:" + w[i:i + CHAR_NGRAM] for i in range(len(w) - CHAR_NGRAM + 1))
+    if words:
+        feats.add("s:first:" + words[0])
+    if (text or "").rstrip().endswith("?"):
+        feats.add("s:question")
+    return feats
+
+
+def sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class TopicClassifier:
+    def __init__(self, weights: dict, bias: float, low: float = DEFAULT_LOW, high: float = DEFAULT_HIGH, meta: Optional[dict] = None):
+        self.weights = weights
+        self.bias = bias
+        self.low = low
+        self.high = high
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "TopicClassifier":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(data["weights"], data["bias"], data.get("low", DEFAULT_LOW), data.get("high", DEFAULT_HIGH), data.get("meta"))
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": 1, "bias": self.bias, "low": self.low, "high": self.high, "meta": self.meta, "weights": self.weights}
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def proba(self, text: str) -> float:
+        w = self.weights
+        return sigmoid(self.bias + sum(w.get(f, 0.0) for f in features(text)))
+
+    def classify(self, text: str) -> Optional[bool]:
+        p = self.proba(text)
+        if p >= self.high:
+            return True
+        if p <= self.low:
+            return False
+        return None
+
+
+_model: Optional[TopicClassifier] = None
+_model_loaded = False
+
+
+def get_model() -> Optional[TopicClassifier]:
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        if MODEL_PATH.exists():
+            try:
+                _model = TopicClassifier.load(MODEL_PATH)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[topic_classifier] load error {MODEL_PATH}: {e}")
+    return _model
+
+
+def classify(text: str) -> Optional[bool]:
+    """Уверенный локальный ответ или None (нет модели / неуверенно — спросить LLM)."""
+    model = get_model()
+    if model is None:
+        _STATS["no_model"] += 1
+        return None
+    t0 = time.perf_counter()
+    result = model.classify(text)
+    _STATS["last_us"] = round((time.perf_counter() - t0) * 1e6)
+    _STATS["fallback" if result is None else "local_true" if result else "local_false"] += 1
+    return result
+
+
+def stats() -> dict:
+    model = get_model()
+    return dict(
+        _STATS,
+        model=str(MODEL_PATH) if model else None,
+        features=len(model.weights) if model else 0,
+        low=model.low if model else None,
+        high=model.high if model else None,
+    )
+
+
+def train(texts: list, labels: list, l2: float = 1e-3, epochs: int = 400, lr: float = 0.5, min_weight: float = 1e-3) -> TopicClassifier:
+    """Обучение (numpy): полный градиентный спуск, L2, веса классов поровну. Пороги — снаружи."""
+    import numpy as np
+
+    feats = [features(t) for t in texts]
+    vocab = {f: i for i, f in enumerate(sorted(set().union(*feats)))}
+    x = np.zeros((len(texts), len(vocab)), dtype=np.float32)
+    for row, fs in enumerate(feats):
+        x[row, [vocab[f] for f in fs]] = 1.0
+    y = np.asarray(labels, dtype=np.float32)
+    pos = max(1.0, float(y.sum()))
+    neg = max(1.0, float(len(y) - y.sum()))
+    sample_w = np.where(y > 0, len(y) / (2 * pos), len(y) / (2 * neg)).astype(np.float32)
+    w = np.zeros(len(vocab), dtype=np.float32)
+    b = 0.0
+    for _ in range(epochs):
+        z = x @ w + b
+        p = 1.0 / (1.0 + np.exp(-z))
+        g = (p - y) * sample_w / len(y)
+        w -= lr * (x.T @ g + l2 * w)
+        b -= lr * float(g.sum())
+    names = sorted(vocab, key=vocab.get)
+    weights = {f: round(float(v), 5) for f, v in zip(names, w) if abs(v) >= min_weight}
+    return TopicClassifier(weights, round(b, 5))